@@ -0,0 +1,131 @@
+# server/bench/bench_compression.py
+"""Serialization time and transfer size of API responses, measured through the app.
+
+Each payload is returned by a route declared with the same response model
+as the real endpoint, once through FastAPI's default path (model
+validation, jsonable_encoder and stdlib json in JSONResponse) and once the
+way the server answers now (ORJSONResponse as the default response class,
+behind CompressionMiddleware). Requests are driven straight through the
+ASGI interface, so the figures include routing and validation but no
+network.
+
+    python bench/bench_compression.py [rounds]
+"""
+from datetime import datetime, timedelta
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+from compression import CompressionMiddleware, zstandard
+from main import GenerateAssessmentResponse, SessionDetailResponse, SessionPageResponse
+
+MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+
+
+def sample_payloads():
+    created = datetime(2025, 10, 1, 12, 0)
+    question = {
+        "id": "q1", "type": "multiple_choice", "topic": "grammar", "bank_id": "qb_0a9923740a0de14e",
+        "question": "Which sentence uses the present perfect correctly to describe an experience?",
+        "options": ["I have visited Paris twice.", "I visited Paris twice since 2019.",
+                    "I have visit Paris twice.", "I am visiting Paris twice."],
+        "correct": "I have visited Paris twice.",
+    }
+    quiz = {
+        "success": True, "quiz_id": "quiz_1760000000000", "assessment_level": "INTERMEDIATE",
+        "created_at": created.isoformat(),
+        "questions": [dict(question, id=f"q{i}") for i in range(1, 9)],
+    }
+    history = {
+        "items": [
+            {"id": f"session_{i}", "title": "Weekend plans", "status": "completed",
+             "created_at": created + timedelta(minutes=i), "ended_at": created + timedelta(minutes=i + 20),
+             "message_count": 30, "preview": "I goes to the park yesterday with my friends", "has_summary": True}
+            for i in range(50)
+        ],
+        "next_cursor": "c2Vzc2lvbl80OQ",
+    }
+    turns = [
+        {"role": "user" if i % 2 else "assistant",
+         "content": "I goes to the park yesterday with my friends and we plays football.",
+         "timestamp": (created + timedelta(seconds=20 * i)).isoformat() + "Z"}
+        for i in range(200)
+    ]
+    session = {
+        "id": "session_1", "userId": "uid_1", "title": "Weekend plans", "status": "completed",
+        "createdAt": created, "endedAt": created + timedelta(minutes=40), "messageCount": len(turns),
+        "preview": turns[1]["content"][:60],
+        "summary": {"final_feedback": "Good job!", "tips": "Watch your past tense.", "corrections": []},
+        "messages": turns, "total_turns": len(turns), "next_turn": None,
+    }
+    return [
+        ("generate_assessment", GenerateAssessmentResponse, quiz),
+        ("session history (50 sessions)", SessionPageResponse, history),
+        ("session detail (200 turns)", SessionDetailResponse, session),
+    ]
+
+
+def build_app(model, payload, optimized: bool):
+    if optimized:
+        app = FastAPI(default_response_class=ORJSONResponse)
+        app.add_middleware(CompressionMiddleware, minimum_size=MIN_BYTES)
+    else:
+        app = FastAPI(default_response_class=JSONResponse)
+
+    @app.get("/payload", response_model=model)
+    async def get_payload():
+        return payload
+
+    return app
+
+
+async def call(app, accept_encoding: str = "") -> bytes:
+    headers = [(b"accept-encoding", accept_encoding.encode("latin-1"))] if accept_encoding else []
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": "/payload", "raw_path": b"/payload", "root_path": "", "query_string": b"", "headers": headers,
+        "client": ("127.0.0.1", 50000), "server": ("testserver", 80),
+    }
+    body = bytearray()
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.body":
+            body.extend(message.get("body", b""))
+
+    await app(scope, receive, send)
+    return bytes(body)
+
+
+async def timed(app, rounds: int, accept_encoding: str = "") -> float:
+    await call(app, accept_encoding)
+    start = time.perf_counter()
+    for _ in range(rounds):
+        await call(app, accept_encoding)
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+async def main(rounds: int):
+    encodings = ["gzip"] + (["zstd"] if zstandard is not None else [])
+    for name, model, payload in sample_payloads():
+        before, after = build_app(model, payload, False), build_app(model, payload, True)
+        before_us, after_us = await timed(before, rounds), await timed(after, rounds)
+        print(name)
+        print(f"  request  default {before_us:8.1f} us   orjson {after_us:8.1f} us   ({before_us / after_us:.1f}x)")
+        sizes = [f"identity {len(await call(before)):7d} B"]
+        for encoding in encodings:
+            encoded_us = await timed(after, rounds, encoding)
+            sizes.append(f"{encoding} {len(await call(after, encoding)):7d} B ({encoded_us:.0f} us)")
+        print(f"  transfer {'   '.join(sizes)}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 500))
@@ -0,0 +1,95 @@
+# server/bench/bench_export_stream.py
+"""Peak memory and rows/sec of the streaming export vs building the whole export first.
+
+Pages come from an in-memory fake query with 20 ms of latency per page.
+
+    python bench/bench_export_stream.py
+"""
+from datetime import datetime
+import asyncio
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orjson
+
+from export_stream import EXPORTS, stream_export, zstandard
+
+PAGE_LATENCY = 0.02
+
+
+class FakeSnapshot:
+    def __init__(self, index: int):
+        self.id = f"user_{index:08d}"
+        self._index = index
+
+    def to_dict(self):
+        return {
+            "email": f"learner{self._index}@example.com", "displayName": f"Learner {self._index}",
+            "createdAt": datetime(2025, 1, 1, 12, 0), "assessmentLevel": "INTERMEDIATE",
+            "assessmentCompleted": True, "quizCompleted": self._index % 2 == 0, "emailVerified": True,
+        }
+
+
+class FakeQuery:
+    """In-memory stand-in for a Firestore query over `total` generated documents."""
+
+    def __init__(self, total: int, page_latency: float, start: int = 0, size: int = 0):
+        self.total, self.page_latency, self.start, self.size = total, page_latency, start, size
+
+    def order_by(self, *_args, **_kwargs):
+        return self
+
+    def limit(self, size: int):
+        return FakeQuery(self.total, self.page_latency, self.start, size)
+
+    def start_after(self, snapshot):
+        return FakeQuery(self.total, self.page_latency, snapshot._index + 1, self.size)
+
+    def get(self):
+        time.sleep(self.page_latency)
+        return [FakeSnapshot(i) for i in range(self.start, min(self.total, self.start + self.size))]
+
+
+async def drain(total: int, fmt: str, compress):
+    size = 0
+    async for chunk in stream_export("users", FakeQuery(total, PAGE_LATENCY), EXPORTS["users"], fmt, compress):
+        size += len(chunk)
+    return size
+
+
+def load_everything(total: int):
+    # What AdminReports did before, in spirit: fetch every document, then render
+    docs, query = [], FakeQuery(total, PAGE_LATENCY).limit(500)
+    page = query.get()
+    while page:
+        docs.extend({"id": s.id, **s.to_dict()} for s in page)
+        page = query.start_after(page[-1]).get() if len(page) == 500 else []
+    return len(orjson.dumps(docs, option=orjson.OPT_NAIVE_UTC))
+
+
+def main():
+    print(f"{'rows':>8} {'mode':22} {'peak MiB':>9} {'rows/sec':>10} {'bytes':>11}")
+    for total in (10_000, 50_000):
+        modes = [("stream csv", lambda: asyncio.run(drain(total, "csv", None))),
+                 ("stream ndjson", lambda: asyncio.run(drain(total, "ndjson", None)))]
+        if zstandard is not None:
+            modes.append(("stream csv+zstd", lambda: asyncio.run(drain(total, "csv", "zstd"))))
+        modes.append(("load all, then encode", lambda: load_everything(total)))
+        for name, run in modes:
+            # Timed without tracing, which slows allocation-heavy code considerably
+            start = time.perf_counter()
+            size = run()
+            elapsed = time.perf_counter() - start
+            tracemalloc.start()
+            run()
+            peak = tracemalloc.get_traced_memory()[1] / 2**20
+            tracemalloc.stop()
+            print(f"{total:>8} {name:22} {peak:9.1f} {total / elapsed:10.0f} {size:11d}")
+
+
+if __name__ == "__main__":
+    main()
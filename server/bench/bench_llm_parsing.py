@@ -0,0 +1,76 @@
+# server/bench/bench_llm_parsing.py
+"""Parse time and success of the old greedy-regex parsing vs loads_lenient on malformed LLM output.
+
+Runs over llm_parsing_corpus.json plus a few adversarial cases: long
+outputs full of unmatched brackets, where the greedy patterns backtrack
+from every opener (quadratic).
+
+    python bench/bench_llm_parsing.py [rounds]
+"""
+from typing import Any
+import json
+import os
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm_parsing import loads_lenient
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_parsing_corpus.json")
+LEGACY_PATTERNS = {"object": r"\{.*\}", "array": r"\[[\s\S]*\]"}
+
+
+def legacy_parse(text: str, pattern: str) -> Any:
+    match = re.search(pattern, text, re.DOTALL)
+    if not match:
+        raise ValueError("no match")
+    return json.loads(match.group(0))
+
+
+def load_corpus():
+    with open(CORPUS_PATH, encoding="utf-8") as f:
+        corpus = json.load(f)
+    corpus.append({"name": "long prose, 4k unmatched braces", "kind": "object",
+                   "text": "Let me think {about this " * 4000 + '{"score": 5, "feedback": "ok", "suggestions": []}'})
+    corpus.append({"name": "long prose, 4k braces, never closed", "kind": "object",
+                   "text": "Let me think {about this " * 4000})
+    corpus.append({"name": "long list, 4k brackets, never closed", "kind": "array",
+                   "text": "Options [a or b " * 4000})
+    return corpus
+
+
+def main(rounds: int):
+    corpus = load_corpus()
+    totals = {"legacy": [0, 0.0], "lenient": [0, 0.0]}
+    print(f"{'case':44} {'legacy':>16} {'lenient':>16}")
+    for case in corpus:
+        kind, text = case["kind"], case["text"]
+        results = {}
+        for name, func in (("legacy", lambda: legacy_parse(text, LEGACY_PATTERNS[kind])),
+                           ("lenient", lambda: loads_lenient(text, kind))):
+            try:
+                func()
+                ok = True
+            except (ValueError, json.JSONDecodeError):
+                ok = False
+            n = rounds if len(text) < 10000 else 3
+            start = time.perf_counter()
+            for _ in range(n):
+                try:
+                    func()
+                except (ValueError, json.JSONDecodeError):
+                    pass
+            elapsed = (time.perf_counter() - start) / n * 1e6
+            totals[name][0] += ok
+            totals[name][1] += elapsed
+            results[name] = f"{'ok ' if ok else 'ERR'} {elapsed:10.1f}us"
+        print(f"{case['name'][:44]:44} {results['legacy']:>16} {results['lenient']:>16}")
+    print(f"{'parsed / total time':44} "
+          f"{totals['legacy'][0]:>3}/{len(corpus)} {totals['legacy'][1]:8.0f}us "
+          f"{totals['lenient'][0]:>3}/{len(corpus)} {totals['lenient'][1]:8.0f}us")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
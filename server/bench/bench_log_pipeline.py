@@ -0,0 +1,94 @@
+# server/bench/bench_log_pipeline.py
+"""Logging cost on the calling thread per request: the old basicConfig handlers vs the queue pipeline.
+
+Runs once with a healthy disk and once with a 5 ms stall on every 200th
+file write, which is where synchronous handlers hurt the event loop.
+
+    python bench/bench_log_pipeline.py [requests]
+"""
+from logging.handlers import RotatingFileHandler
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_pipeline import configure_logging
+
+RECORDS_PER_REQUEST = 4
+
+
+class StallingStream:
+    """File wrapper that sleeps on every `every`-th write, to mimic disk writeback stalls."""
+
+    def __init__(self, stream, stall_ms: float, every: int = 200):
+        self._stream = stream
+        self._stall = stall_ms / 1000
+        self._every = every
+        self._writes = 0
+
+    def write(self, data):
+        self._writes += 1
+        if self._stall and self._writes % self._every == 0:
+            time.sleep(self._stall)
+        return self._stream.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def run(logger: logging.Logger, requests: int):
+    reply = "That sounds great! You went to the park yesterday. " * 6
+    timings = []
+    for i in range(requests):
+        start = time.perf_counter()
+        logger.info(f"Processing message: user message number {i}...")
+        for _ in range(RECORDS_PER_REQUEST - 2):
+            logger.info("Ollama model call finished")
+        logger.info(f"Generated response: {reply}")
+        timings.append((time.perf_counter() - start) * 1e6)
+    timings.sort()
+    return sum(timings) / len(timings), timings[int(len(timings) * 0.99)], timings[-1]
+
+
+def main(requests: int):
+    plain = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    print(f"{requests} requests x {RECORDS_PER_REQUEST} records, cost on the calling thread (us/request)")
+    print(f"  {'':28} {'mean':>8} {'p99':>8} {'max':>9}")
+    with tempfile.TemporaryDirectory() as tmp, open(os.devnull, "w") as devnull:
+        for stall_ms in (0, 5):
+            label = f"stall {stall_ms}ms/200 writes" if stall_ms else "healthy disk"
+
+            # Old setup: StreamHandler + FileHandler, both synchronous
+            sync_logger = logging.getLogger(f"bench.sync{stall_ms}")
+            sync_logger.propagate = False
+            sync_logger.setLevel(logging.INFO)
+            console = logging.StreamHandler(devnull)
+            file_handler = logging.FileHandler(os.path.join(tmp, f"sync{stall_ms}.log"))
+            file_handler.stream = StallingStream(file_handler.stream, stall_ms)
+            for handler in (console, file_handler):
+                handler.setFormatter(plain)
+                sync_logger.addHandler(handler)
+            sync = run(sync_logger, requests)
+            file_handler.close()
+
+            listener = configure_logging(
+                log_file=os.path.join(tmp, f"queued{stall_ms}.log"),
+                queue_size=requests * RECORDS_PER_REQUEST
+            )
+            for handler in listener.handlers:
+                if isinstance(handler, RotatingFileHandler):
+                    handler.stream = StallingStream(handler.stream, stall_ms)
+                else:
+                    handler.setStream(devnull)
+            queued = run(logging.getLogger(f"bench.queued{stall_ms}"), requests)
+            listener.stop()
+
+            for name, (mean, p99, worst) in ((f"sync ({label})", sync), (f"queue ({label})", queued)):
+                print(f"  {name:28} {mean:8.1f} {p99:8.1f} {worst:9.1f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000)
@@ -0,0 +1,64 @@
+# server/bench/bench_micro_batch.py
+"""Latency and model calls for a burst of evaluations, unbatched vs batched, with a simulated model.
+
+The fake model handles a call of n prompts in 0.3 s + 0.15 s per prompt,
+as Ollama does when its parallel slots share one forward pass; calls run
+one at a time, like a single LLM scheduler slot. 200 requests arrive at
+random over 2 seconds.
+
+    python bench/bench_micro_batch.py
+"""
+from typing import Any, Dict, List
+import asyncio
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from micro_batch import MicroBatcher
+
+REQUESTS = 200
+SPREAD_SECONDS = 2.0
+
+
+async def run(max_batch: int, max_wait_ms: float) -> Dict[str, Any]:
+    model = asyncio.Lock()
+
+    async def dispatch(items: List[int]) -> List[int]:
+        async with model:
+            await asyncio.sleep((0.3 + 0.15 * len(items)) / 10)
+        return items
+
+    batcher = MicroBatcher("bench", dispatch, max_batch=max_batch, max_wait=max_wait_ms / 1000 / 10)
+    rng = random.Random(1)
+    latencies = []
+
+    async def one(i: int):
+        await asyncio.sleep(rng.uniform(0, SPREAD_SECONDS) / 10)
+        start = time.perf_counter()
+        await batcher.submit(i)
+        latencies.append((time.perf_counter() - start) * 10)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(REQUESTS)))
+    latencies.sort()
+    # Sleeps are scaled down 10x; report simulated seconds
+    return {
+        "calls": batcher.batches.value,
+        "mean": sum(latencies) / len(latencies),
+        "p95": latencies[int(len(latencies) * 0.95)],
+        "total": (time.perf_counter() - start) * 10,
+    }
+
+
+def main():
+    print(f"{'max_batch':>9} {'wait ms':>8} {'calls':>6} {'mean s':>8} {'p95 s':>8} {'total s':>8}")
+    for max_batch, max_wait_ms in ((1, 0), (4, 10), (8, 25), (16, 50)):
+        r = asyncio.run(run(max_batch, max_wait_ms))
+        print(f"{max_batch:>9} {max_wait_ms:>8} {r['calls']:>6} {r['mean']:8.1f} {r['p95']:8.1f} {r['total']:8.1f}")
+
+
+if __name__ == "__main__":
+    main()
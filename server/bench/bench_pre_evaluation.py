@@ -0,0 +1,48 @@
+# server/bench/bench_pre_evaluation.py
+"""Offload rate and a sanity check of the pre-evaluation rules on the labeled answers in pre_evaluation_corpus.json.
+
+Each entry has the question, the transcribed answer and a hand-given
+score on the oral_evaluation rubric. The labels were written alongside
+the rules, so agreement here only shows the rules do what they were
+meant to; agreement with the model is measured on live traffic by the
+shadow sample (`pre_evaluation.shadow` in /metrics). Offloaded answers
+agree if the rule score is within 1 of the label.
+
+    python bench/bench_pre_evaluation.py [corpus.json]
+"""
+import json
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pre_evaluation import pre_evaluate, stats
+
+CORPUS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pre_evaluation_corpus.json")
+
+
+def main(corpus_path: str):
+    with open(corpus_path, encoding="utf-8") as f:
+        corpus = json.load(f)
+
+    offloaded_cases, agree, wrongly_offloaded = 0, 0, []
+    for case in corpus:
+        result = pre_evaluate(case["question"], case["response"])
+        if result is None:
+            continue
+        offloaded_cases += 1
+        if abs(result["score"] - case["score"]) <= 1:
+            agree += 1
+        else:
+            wrongly_offloaded.append((result["pre_evaluation"], result["score"], case["score"], case["response"]))
+
+    print(f"{len(corpus)} labeled answers, {offloaded_cases} offloaded ({offloaded_cases / len(corpus):.0%})")
+    print(f"Sanity check, within 1 point of the hand-given label: {agree}/{offloaded_cases}")
+    print("Agreement with the model is measured by the shadow sample: pre_evaluation.shadow in /metrics")
+    for reason, rule_score, label, response in wrongly_offloaded:
+        print(f"  {reason}: rules {rule_score}, label {label}: {response[:70]!r}")
+    print(f"Offloaded by reason: {stats()['offloaded']}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1] if len(sys.argv) > 1 else CORPUS_PATH)
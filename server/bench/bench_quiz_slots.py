@@ -0,0 +1,66 @@
+# server/bench/bench_quiz_slots.py
+"""Wall time of one batched quiz generation vs per-slot generation, with a simulated model.
+
+The fake model produces 40 tokens/s per request across `slots` parallel
+Ollama slots (OLLAMA_NUM_PARALLEL or several hosts); a question is ~120
+tokens. One in five outputs is unparseable (e.g. cut off): the batch
+mode then has to regenerate everything, per-slot mode only that question.
+
+    python bench/bench_quiz_slots.py
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from quiz_slots import assign_topics, fill_slots
+
+TOKENS_PER_QUESTION = 120
+TOKENS_PER_SECOND = 40.0
+QUESTIONS = 8
+
+
+async def run(mode: str, parallel: int, seed: int) -> float:
+    rng = random.Random(seed)
+    model = asyncio.Semaphore(parallel)
+
+    async def generate(prompt: str, count: int = 1) -> str:
+        async with model:
+            await asyncio.sleep(count * TOKENS_PER_QUESTION / TOKENS_PER_SECOND / 100)
+        if rng.random() < 0.2:
+            return "{not json"
+        item = {"type": "oral", "question": f"Question {rng.random()}?", "topic": "food"}
+        return json.dumps([item] * count if count > 1 else item)
+
+    start = time.perf_counter()
+    if mode == "batch":
+        while True:
+            try:
+                json.loads(await generate("quiz", QUESTIONS))
+                break
+            except ValueError:
+                continue
+    else:
+        slots = [("oral", topic) for topic in assign_topics("BASIC", QUESTIONS, set())]
+        await fill_slots("BASIC", slots, generate, lambda q: None)
+    # Sleeps are scaled down 100x; report simulated seconds
+    return (time.perf_counter() - start) * 100
+
+
+def main():
+    print(f"{'ollama slots':>12} {'mode':10} {'mean s':>8} {'p95 s':>8}")
+    for parallel in (1, 2, 4, 8):
+        for mode in ("batch", "per-slot"):
+            times = sorted(asyncio.run(run(mode, parallel, seed)) for seed in range(40))
+            print(f"{parallel:>12} {mode:10} {sum(times) / len(times):8.1f} {times[int(len(times) * 0.95)]:8.1f}")
+    print(f"One question alone takes {TOKENS_PER_QUESTION / TOKENS_PER_SECOND:.1f} s")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    main()
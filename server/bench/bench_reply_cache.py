@@ -0,0 +1,52 @@
+# server/bench/bench_reply_cache.py
+"""Reply cache hit rate for a Zipf-distributed stream of utterances with recognition typos.
+
+300 distinct short utterances, ranked by popularity; one in four
+arrives with a dropped or doubled letter. A fifth of the traffic is
+long or personal and never cacheable.
+
+    python bench/bench_reply_cache.py [requests]
+"""
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from reply_cache import ReplyCache
+
+WORDS = ["hello", "how", "are", "you", "i", "am", "fine", "good", "morning", "thank", "what", "is", "your",
+         "favourite", "food", "like", "to", "play", "football", "today", "tired", "happy", "nice", "day"]
+
+
+def main(requests: int):
+    rng = random.Random(7)
+    phrases = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 6))) for _ in range(300)]
+    weights = [1 / (rank + 1) for rank in range(len(phrases))]
+
+    def utterance() -> str:
+        if rng.random() < 0.2:
+            return "My friend Anna and I went to the cinema on Saturday to see a new film"
+        text = rng.choices(phrases, weights)[0]
+        if rng.random() < 0.25 and len(text) > 4:
+            i = rng.randrange(1, len(text) - 1)
+            text = text[:i] + (text[i] * 2 if rng.random() < 0.5 else "") + text[i + 1:]
+        return text
+
+    print(f"{'max_entries':>11} {'hit rate':>9} {'near hits':>10} {'lookup us':>10}")
+    for max_entries in (50, 200, 1000):
+        cache = ReplyCache(max_entries=max_entries)
+        start = time.perf_counter()
+        for _ in range(requests):
+            text = utterance()
+            if cache.lookup(text) is None:
+                cache.store(text, "".join(rng.choices(string.ascii_lowercase, k=12)), "llama3.1")
+        elapsed = (time.perf_counter() - start) / requests * 1e6
+        s = cache.stats()
+        print(f"{max_entries:>11} {s['hit_rate']:9.1%} {s['near_hits']:>10} {elapsed:10.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000)
@@ -0,0 +1,91 @@
+# server/bench/bench_transcript_store.py
+"""Stored bytes and decode time of the inline, chunked and archived transcript layouts.
+
+Firestore network latency is not simulated; "docs read" is the number of
+document reads (round trips are one `get_all` per layout) needed to show
+the first 50 turns and the whole conversation.
+
+    python bench/bench_transcript_store.py
+"""
+from typing import Any, Dict, List
+from datetime import datetime
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import orjson
+
+from transcript_store import (
+    ARCHIVE_COLLECTION, ARCHIVE_LEVEL, CHUNK_COLLECTION, CHUNK_TURNS, chunk_documents, decode_turns,
+    document_size, encode_turns,
+)
+
+SESSION_PATH = "projects/p/databases/(default)/documents/voice_sessions/abcdefghijklmnopqrst"
+ARCHIVE_PATH = f"projects/p/databases/(default)/documents/{ARCHIVE_COLLECTION}/abcdefghijklmnopqrst"
+
+
+def sample_turns(count: int) -> List[Dict[str, Any]]:
+    rng = random.Random(7)
+    words = ("I", "went", "to", "the", "market", "yesterday", "and", "bought", "some", "fresh", "vegetables",
+             "because", "my", "friend", "was", "coming", "for", "dinner", "we", "talked", "about", "travel",
+             "plans", "next", "summer", "which", "sounds", "really", "exciting", "you", "should", "try", "saying")
+    turns = []
+    for i in range(count):
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(8, 40)))
+        turns.append({
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": sentence[0].upper() + sentence[1:] + ".",
+            "timestamp": f"2025-05-01T10:{i // 60 % 60:02d}:{i % 60:02d}.000Z",
+        })
+    return turns
+
+
+def timed(func, repeat: int = 20) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def main():
+    print(f"{'turns':>6} {'layout':8} {'stored bytes':>13} {'largest doc':>12} "
+          f"{'docs read (50 / all)':>21} {'ms first 50':>12} {'ms all':>8}")
+    for count in (20, 200, 1000, 3000):
+        turns = sample_turns(count)
+        session = {"userId": "u" * 28, "status": "completed", "title": "Practice", "createdAt": datetime.now()}
+
+        inline_doc = {**session, "messages": turns}
+        inline_size = document_size(SESSION_PATH, inline_doc)
+        raw = orjson.dumps(inline_doc, default=str)
+
+        chunks = chunk_documents(turns)
+        chunk_sizes = [document_size(f"{SESSION_PATH}/{CHUNK_COLLECTION}/{c['index']:05d}", c) for c in chunks]
+        chunk_meta = {"transcript": {"storage": "chunks", "codec": "zstd", "chunk_turns": CHUNK_TURNS,
+                                     "chunks": len(chunks), "turns": count, "raw_bytes": 0, "stored_bytes": 0}}
+        head_size = document_size(SESSION_PATH, {**session, **chunk_meta})
+
+        blob = encode_turns(turns, ARCHIVE_LEVEL)
+        archive_size = document_size(ARCHIVE_PATH, {"session_id": "a" * 20, "codec": "zstd", "turns": count, "data": blob})
+
+        # Reading the inline layout always means decoding the whole document
+        inline_ms = timed(lambda: orjson.loads(raw))
+        first_chunks = chunks[:max(1, -(-50 // CHUNK_TURNS))]
+        chunk_first_ms = timed(lambda: [decode_turns(c["data"]) for c in first_chunks])
+        chunk_all_ms = timed(lambda: [decode_turns(c["data"]) for c in chunks])
+        archive_ms = timed(lambda: decode_turns(blob))
+
+        rows = [
+            ("inline", inline_size, inline_size, "1 / 1", inline_ms, inline_ms),
+            ("chunks", head_size + sum(chunk_sizes), max([head_size] + chunk_sizes),
+             f"{1 + len(first_chunks)} / {1 + len(chunks)}", chunk_first_ms, chunk_all_ms),
+            ("archive", head_size + archive_size, max(head_size, archive_size), "2 / 2", archive_ms, archive_ms),
+        ]
+        for layout, size, largest, docs, first_ms, all_ms in rows:
+            print(f"{count:>6} {layout:8} {size:>13} {largest:>12} {docs:>21} {first_ms:>12.2f} {all_ms:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
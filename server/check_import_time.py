@@ -0,0 +1,86 @@
+# server/check_import_time.py
+from typing import Dict, List, Tuple
+import argparse
+import os
+import subprocess
+import sys
+
+# SDKs that main.py must only import on first use or in the lifespan
+LAZY_MODULES = (
+    "langchain_core", "langchain_ollama", "ollama", "google.cloud.firestore", "google.oauth2",
+    "firebase_admin", "aiohttp",
+)
+DEFAULT_BUDGET_MS = float(os.getenv("IMPORT_BUDGET_MS", "1200"))
+# Modules loaded by `import main`; about 420 with the SDKs deferred
+DEFAULT_MODULE_BUDGET = int(os.getenv("IMPORT_MODULE_BUDGET", "500"))
+
+
+def measure(module: str = "main") -> Tuple[float, List[Tuple[str, float, float]]]:
+    """Import `module` in a fresh interpreter with `-X importtime`.
+
+    Returns the module's cumulative import time in ms, and every imported
+    module as (name, self ms, cumulative ms). Credentials are removed from
+    the environment, since importing must not need them.
+    """
+    env = {key: value for key, value in os.environ.items() if key != "FIREBASE_CREDENTIAL_JSON"}
+    env["LOG_FILE"] = os.devnull
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+    total, modules = 0.0, []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+        if name.strip() == module:
+            total = int(cumulative_us) / 1000
+    return total, modules
+
+
+def eager_imports(modules: List[Tuple[str, float, float]]) -> List[str]:
+    """The LAZY_MODULES (or their submodules) among the imported modules."""
+    return sorted({name for name, _, _ in modules
+                   if any(name == lazy or name.startswith(lazy + ".") for lazy in LAZY_MODULES)})
+
+
+def check(budget_ms: float = DEFAULT_BUDGET_MS, module_budget: int = DEFAULT_MODULE_BUDGET, top: int = 15) -> bool:
+    total, modules = measure()
+    eager = eager_imports(modules)
+    packages: Dict[str, float] = {}
+    for name, self_ms, _ in modules:
+        root = name.split(".")[0]
+        packages[root] = packages.get(root, 0.0) + self_ms
+
+    print(f"import main: {total:.0f} ms (budget {budget_ms:.0f} ms), {len(modules)} modules (budget {module_budget})")
+    print(f"\n{'package':30} {'ms':>8}")
+    for root, ms in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"{root:30} {ms:8.1f}")
+
+    ok = True
+    if eager:
+        ok = False
+        print(f"\nFAIL: imported at startup, should be lazy: {', '.join(eager)}")
+    if total > budget_ms:
+        ok = False
+        print(f"\nFAIL: import took {total:.0f} ms, over the {budget_ms:.0f} ms budget")
+    if len(modules) > module_budget:
+        ok = False
+        print(f"\nFAIL: import loaded {len(modules)} modules, over the budget of {module_budget}")
+    if ok:
+        print("\nOK")
+    return ok
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that importing main.py stays within its time budget")
+    parser.add_argument("--budget-ms", type=float, default=DEFAULT_BUDGET_MS,
+                        help="maximum cumulative import time of main (or set IMPORT_BUDGET_MS)")
+    parser.add_argument("--module-budget", type=int, default=DEFAULT_MODULE_BUDGET,
+                        help="maximum number of modules importing main may load (or set IMPORT_MODULE_BUDGET)")
+    parser.add_argument("--top", type=int, default=15, help="number of slowest packages to list")
+    args = parser.parse_args()
+    sys.exit(0 if check(args.budget_ms, args.module_budget, args.top) else 1)
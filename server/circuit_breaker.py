@@ -0,0 +1,72 @@
+# server/circuit_breaker.py
+from typing import Any, Dict
+import logging
+import time
+
+from shared_store import SharedStore
+
+logger = logging.getLogger(__name__)
+
+
+class CircuitBreaker:
+    """Stop calling a failing dependency for a while after repeated errors.
+
+    State lives in the shared store so that once one worker sees Ollama fail
+    `failure_threshold` times in a row, every worker fails fast for
+    `reset_timeout` seconds instead of each discovering the outage itself.
+    Each worker reads that state at most once per `refresh_interval`
+    seconds, so the checks made on every call rarely touch the store.
+    The methods block when they do, so async callers run them in a thread.
+    """
+
+    def __init__(self, store: SharedStore, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0,
+                 refresh_interval: float = 1.0):
+        self.store = store
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.refresh_interval = refresh_interval
+        self._state: Dict[str, Any] = {}
+        self._read_at = float("-inf")
+
+    @property
+    def _key(self) -> str:
+        return f"breaker:{self.name}"
+
+    def _current(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        if now - self._read_at >= self.refresh_interval:
+            self._state = self.store.get(self._key) or {}
+            self._read_at = now
+        return self._state
+
+    def is_open(self) -> bool:
+        return self._current().get("open_until", 0) > time.time()
+
+    def record_success(self):
+        if self._current():
+            self.store.delete(self._key)
+            self._state, self._read_at = {}, time.monotonic()
+
+    def record_failure(self, error: str):
+        def bump(state):
+            state = state or {"failures": 0, "open_until": 0}
+            state["failures"] += 1
+            state["last_error"] = error
+            if state["failures"] >= self.failure_threshold:
+                state["open_until"] = time.time() + self.reset_timeout
+                state["failures"] = 0
+            return state
+
+        state = self.store.update(self._key, bump, ttl=self.reset_timeout * 10)
+        self._state, self._read_at = state, time.monotonic()
+        if state["open_until"] > time.time():
+            logger.error(f"Circuit breaker {self.name} open for {self.reset_timeout}s: {error}")
+
+    def stats(self) -> Dict[str, Any]:
+        state = self._current()
+        return {
+            "open": self.is_open(),
+            "consecutive_failures": state.get("failures", 0),
+            "last_error": state.get("last_error"),
+        }
@@ -0,0 +1,173 @@
+# server/compression.py
+from typing import Dict, Optional
+import logging
+import zlib
+
+from metrics import Counter
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional; fall back to gzip only
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_TYPES = ("application/json", "application/x-ndjson", "text/")
+
+responses_compressed = {"zstd": Counter(), "gzip": Counter()}
+bytes_in = Counter()
+bytes_out = Counter()
+
+
+def parse_accept_encoding(header: str) -> Dict[str, float]:
+    """Parse an Accept-Encoding header into {coding: q}."""
+    codings = {}
+    for part in header.split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        codings[coding] = q
+    return codings
+
+
+def choose_encoding(header: str) -> Optional[str]:
+    """Pick zstd or gzip from the client's Accept-Encoding, preferring zstd on ties."""
+    codings = parse_accept_encoding(header)
+    wildcard = codings.get("*", 0.0)
+    candidates = (["zstd"] if zstandard is not None else []) + ["gzip"]
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = codings.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+class _Compressor:
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "zstd":
+            self._obj = zstandard.ZstdCompressor(level=level).compressobj()
+        else:
+            self._obj = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """Compress a chunk; non-final chunks are flushed so streamed output reaches the client promptly."""
+        out = self._obj.compress(data)
+        if self.encoding == "zstd":
+            mode = zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+            return out + self._obj.flush(mode)
+        return out + (self._obj.flush() if final else self._obj.flush(zlib.Z_SYNC_FLUSH))
+
+
+class CompressionMiddleware:
+    """ASGI middleware that zstd- or gzip-compresses responses per Accept-Encoding.
+
+    Bodies are buffered until `minimum_size` bytes; smaller responses are sent
+    untouched. Larger ones, including streamed responses, are compressed
+    incrementally. Only JSON, NDJSON and text content types are compressed,
+    and responses that already have a Content-Encoding are left alone.
+    Every response that could have been compressed, including small ones
+    and those to clients without Accept-Encoding, carries
+    `Vary: Accept-Encoding`, so caches keep the variants apart.
+    """
+
+    def __init__(self, app, minimum_size: int = 1024, gzip_level: int = 6, zstd_level: int = 3):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "zstd": zstd_level}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        accept = ""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept = value.decode("latin-1")
+                break
+        encoding = choose_encoding(accept) if accept else None
+        state = {"start": None, "buffer": b"", "compressor": None, "passthrough": False}
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = [(k.lower(), v) for k, v in message.get("headers", [])]
+                content_type = next((v.decode("latin-1") for k, v in headers if k == b"content-type"), "")
+                already_encoded = any(k == b"content-encoding" for k, _ in headers)
+                if already_encoded or not content_type.startswith(COMPRESSIBLE_TYPES):
+                    state["passthrough"] = True
+                    await send(message)
+                    return
+                if encoding is None:
+                    state["passthrough"] = True
+                    await send(self._vary_start(message))
+                    return
+                state["start"] = message
+                return
+
+            if message["type"] != "http.response.body" or state["passthrough"]:
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if state["compressor"] is None:
+                state["buffer"] += body
+                if len(state["buffer"]) < self.minimum_size and more_body:
+                    return
+                if len(state["buffer"]) < self.minimum_size:
+                    # Whole response is small - send it unchanged
+                    await send(self._vary_start(state["start"]))
+                    await send({"type": "http.response.body", "body": state["buffer"], "more_body": False})
+                    return
+                state["compressor"] = _Compressor(encoding, self.levels[encoding])
+                await send(self._compressed_start(state["start"], encoding))
+                body, state["buffer"] = state["buffer"], b""
+
+            bytes_in.inc(len(body))
+            chunk = state["compressor"].compress(body, final=not more_body)
+            if not more_body:
+                responses_compressed[encoding].inc()
+            bytes_out.inc(len(chunk))
+            await send({"type": "http.response.body", "body": chunk, "more_body": more_body})
+
+        await self.app(scope, receive, send_wrapper)
+
+    @staticmethod
+    def _vary_start(start, drop=()):
+        headers, vary = [], b""
+        for k, v in start.get("headers", []):
+            if k.lower() == b"vary":
+                vary = v
+            elif k.lower() not in drop:
+                headers.append((k, v))
+        if b"accept-encoding" not in vary.lower():
+            vary = vary + b", Accept-Encoding" if vary else b"Accept-Encoding"
+        headers.append((b"vary", vary))
+        return {**start, "headers": headers}
+
+    @classmethod
+    def _compressed_start(cls, start, encoding: str):
+        start = cls._vary_start(start, drop=(b"content-length",))
+        return {**start, "headers": start["headers"] + [(b"content-encoding", encoding.encode("latin-1"))]}
+
+
+def stats() -> Dict[str, int]:
+    return {
+        "zstd_responses": responses_compressed["zstd"].value,
+        "gzip_responses": responses_compressed["gzip"].value,
+        "bytes_in": bytes_in.value,
+        "bytes_out": bytes_out.value,
+    }
+
@@ -0,0 +1,206 @@
+# server/deadlines.py
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from contextvars import ContextVar
+import asyncio
+import logging
+import os
+import time
+
+from fastapi import HTTPException
+
+from metrics import Counter, Samples
+
+logger = logging.getLogger(__name__)
+
+# Total time a request may take, by endpoint class; retries, Firestore reads and LLM calls all draw from it
+DEADLINE_SECONDS = {
+    "interactive": float(os.getenv("DEADLINE_INTERACTIVE_SECONDS", "20")),
+    "evaluation": float(os.getenv("DEADLINE_EVALUATION_SECONDS", "45")),
+    "generation": float(os.getenv("DEADLINE_GENERATION_SECONDS", "120")),
+    "default": float(os.getenv("DEADLINE_DEFAULT_SECONDS", "30")),
+}
+# Path prefix -> endpoint class; the first match wins, anything else is "default"
+ENDPOINT_CLASSES: List[Tuple[str, str]] = [
+    ("/voice_chat", "interactive"),
+    ("/api/oral-quiz/evaluate", "evaluation"),
+    ("/submit_quiz", "evaluation"),
+    ("/generate_assessment", "generation"),
+]
+HEDGING_ENABLED = os.getenv("LLM_HEDGING", "true").lower() not in ("0", "false", "no")
+# A call is hedged once it has run for this multiple of its model's observed p95
+HEDGE_AFTER_P95 = float(os.getenv("LLM_HEDGE_AFTER_P95", "1.0"))
+# Below this much time left neither a hedge nor a retry could finish
+MIN_USEFUL_SECONDS = float(os.getenv("DEADLINE_MIN_USEFUL_SECONDS", "1.0"))
+
+# time.monotonic() by which the current request must be answered
+current_deadline: ContextVar[Optional[float]] = ContextVar("request_deadline", default=None)
+
+requests: Dict[str, Counter] = {name: Counter() for name in DEADLINE_SECONDS}
+latency_ms: Dict[str, Samples] = {name: Samples() for name in DEADLINE_SECONDS}
+timed_out: Dict[str, Counter] = {name: Counter() for name in DEADLINE_SECONDS}
+exceeded_in: Dict[str, Counter] = {}
+retries_skipped = Counter()
+hedges = Counter()
+hedge_wins = Counter()
+hedges_without_capacity = Counter()
+
+
+class DeadlineExceeded(HTTPException):
+    """The request's deadline passed while waiting on `stage` ("llm", "firestore", ...)."""
+
+    def __init__(self, stage: str):
+        super().__init__(status_code=504, detail="This is taking too long. Please try again.")
+        self.stage = stage
+        if stage not in exceeded_in:
+            exceeded_in[stage] = Counter()
+        exceeded_in[stage].inc()
+
+
+def endpoint_class(path: str) -> str:
+    for prefix, name in ENDPOINT_CLASSES:
+        if path.startswith(prefix):
+            return name
+    return "default"
+
+
+def remaining() -> Optional[float]:
+    """Seconds left before the current request's deadline, or None outside a request."""
+    deadline = current_deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+def timeout(default: float) -> float:
+    """A client timeout that ends no later than the deadline; `default` outside a request."""
+    left = remaining()
+    return default if left is None else max(0.0, min(default, left))
+
+
+def retry_allowed(delay: float = 0.0) -> bool:
+    """Whether a retry after `delay` seconds would still have useful time left."""
+    left = remaining()
+    if left is None or left - delay >= MIN_USEFUL_SECONDS:
+        return True
+    retries_skipped.inc()
+    return False
+
+
+async def bounded(awaitable: Awaitable[Any], stage: str) -> Any:
+    """Await `awaitable`, cancelling it and raising DeadlineExceeded when the request's deadline passes."""
+    left = remaining()
+    if left is None:
+        return await awaitable
+    task = asyncio.ensure_future(awaitable)
+    if left <= 0:
+        task.cancel()
+        raise DeadlineExceeded(stage)
+    try:
+        done, _ = await asyncio.wait({task}, timeout=left)
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+    if not done:
+        task.cancel()
+        raise DeadlineExceeded(stage)
+    return task.result()
+
+
+async def to_thread(func: Callable[..., Any], *args, stage: str = "firestore") -> Any:
+    """`asyncio.to_thread` bounded by the deadline. The thread itself can't be stopped, so only use it for reads."""
+    return await bounded(asyncio.to_thread(func, *args), stage)
+
+
+async def hedged(call: Callable[[], Awaitable[Any]], p95: Optional[float], spare_slot) -> Any:
+    """Run `call()`, and if it is still running after `HEDGE_AFTER_P95` times `p95` seconds run a second copy too.
+
+    The hedge is only sent if `spare_slot()` (an async context manager
+    yielding a bool) grants an idle model slot and the deadline leaves
+    time for it; the first copy to succeed wins and the other is
+    cancelled. With `p95` None (too few latency samples) the call is
+    never hedged.
+    """
+    first = asyncio.ensure_future(call())
+    tasks = {first}
+    try:
+        hedge_after = p95 * HEDGE_AFTER_P95 if p95 is not None else None
+        left = remaining()
+        if not HEDGING_ENABLED or hedge_after is None or (left is not None and left - hedge_after < MIN_USEFUL_SECONDS):
+            return await first
+        done, _ = await asyncio.wait(tasks, timeout=hedge_after)
+        if done:
+            return first.result()
+        async with spare_slot() as granted:
+            if not granted:
+                hedges_without_capacity.inc()
+                return await first
+            hedges.inc()
+            second = asyncio.ensure_future(call())
+            tasks.add(second)
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            hedge_wins.inc()
+                        return task.result()
+                    error = task.exception()
+            raise error
+    finally:
+        for task in tasks:
+            if not task.done():
+                task.cancel()
+
+
+class DeadlineMiddleware:
+    """ASGI middleware that sets each request's deadline from its endpoint class and records how long it took."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        name = endpoint_class(scope["path"])
+        started = time.monotonic()
+        token = current_deadline.set(started + DEADLINE_SECONDS[name])
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_deadline.reset(token)
+            requests[name].inc()
+            latency_ms[name].observe((time.monotonic() - started) * 1000)
+            if status_code == 504:
+                timed_out[name].inc()
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "endpoints": {
+            name: {
+                "deadline_seconds": seconds,
+                "requests": requests[name].value,
+                "timed_out": timed_out[name].value,
+                "latency_ms": latency_ms[name].summary(),
+            }
+            for name, seconds in DEADLINE_SECONDS.items()
+        },
+        "exceeded_in": {stage: counter.value for stage, counter in exceeded_in.items()},
+        "retries_skipped": retries_skipped.value,
+        "hedging": {
+            "enabled": HEDGING_ENABLED,
+            "after_p95": HEDGE_AFTER_P95,
+            "sent": hedges.value,
+            "won": hedge_wins.value,
+            "no_spare_capacity": hedges_without_capacity.value,
+        },
+    }
@@ -0,0 +1,184 @@
+# server/export_stream.py
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+from datetime import datetime
+import asyncio
+import csv
+import io
+import logging
+import time
+
+import orjson
+
+from metrics import Counter
+
+try:
+    import zstandard
+except ImportError:  # zstd output is optional
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "ndjson": ("application/x-ndjson", "ndjson"),
+}
+
+exports_started = Counter()
+exports_completed = Counter()
+rows_exported = Counter()
+last_export: Dict[str, Any] = {}
+
+
+class ExportSpec:
+    """One exportable dataset: the query to page through, the fields to project and how rows are built."""
+
+    def __init__(self, columns: List[str], query: Callable[[Any], Any], fields: Dict[str, str],
+                 include: Optional[Callable[[Dict[str, Any]], bool]] = None):
+        self.columns = columns
+        self.query = query
+        # Output column -> Firestore field; "id" is the document ID
+        self.fields = fields
+        self.include = include
+
+    def row(self, snapshot) -> Optional[List[Any]]:
+        data = snapshot.to_dict() or {}
+        if self.include is not None and not self.include(data):
+            return None
+        return [snapshot.id if column == "id" else _plain(data.get(self.fields[column])) for column in self.columns]
+
+
+def _plain(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+EXPORTS: Dict[str, ExportSpec] = {
+    "users": ExportSpec(
+        columns=["id", "email", "display_name", "created_at", "assessment_level",
+                 "assessment_completed", "quiz_completed", "email_verified", "role"],
+        query=lambda db: db.collection("users"),
+        fields={"email": "email", "display_name": "displayName", "created_at": "createdAt",
+                "assessment_level": "assessmentLevel", "assessment_completed": "assessmentCompleted",
+                "quiz_completed": "quizCompleted", "email_verified": "emailVerified", "role": "role"},
+    ),
+    "sessions": ExportSpec(
+        columns=["id", "user_id", "status", "title", "created_at", "ended_at", "message_count"],
+        query=lambda db: db.collection("voice_sessions"),
+        fields={"user_id": "userId", "status": "status", "title": "title", "created_at": "createdAt",
+                "ended_at": "endedAt", "message_count": "messageCount"},
+    ),
+    # Filtered here rather than in the query, so no collection-group index is needed
+    "quiz_results": ExportSpec(
+        columns=["id", "user_id", "assessment_level", "created_at", "attempted_at",
+                 "total_questions", "total_score", "percentage"],
+        query=lambda db: db.collection_group("ai_quizzes"),
+        fields={"user_id": "user_id", "assessment_level": "assessment_level", "created_at": "created_at",
+                "attempted_at": "attempted_at", "total_questions": "total_questions",
+                "total_score": "total_score", "percentage": "percentage", "attempted": "attempted"},
+        include=lambda data: bool(data.get("attempted")),
+    ),
+}
+
+
+async def iter_pages(query, page_size: int) -> AsyncIterator[List[Any]]:
+    """Yield successive pages of a document-ID-ordered query.
+
+    The next page is fetched while the caller processes the current one, so
+    at most two pages are held in memory at a time.
+    """
+    query = query.order_by("__name__").limit(page_size)
+
+    loop = asyncio.get_running_loop()
+
+    def fetch(q) -> asyncio.Future:
+        # run_in_executor submits right away; a to_thread task would not start until we next yield to the loop
+        return loop.run_in_executor(None, lambda: list(q.get()))
+
+    page = await fetch(query)
+    next_page = None
+    try:
+        while page:
+            next_page = fetch(query.start_after(page[-1])) if len(page) == page_size else None
+            yield page
+            page = await next_page if next_page is not None else []
+            next_page = None
+    finally:
+        if next_page is not None:
+            next_page.cancel()
+
+
+class _CsvEncoder:
+    def __init__(self, columns: List[str]):
+        self._buffer = io.StringIO()
+        self._writer = csv.writer(self._buffer)
+        self._writer.writerow(columns)
+
+    def encode(self, rows: List[List[Any]]) -> bytes:
+        self._writer.writerows(["" if v is None else v for v in row] for row in rows)
+        data = self._buffer.getvalue().encode("utf-8")
+        self._buffer.seek(0)
+        self._buffer.truncate()
+        return data
+
+
+class _NdjsonEncoder:
+    def __init__(self, columns: List[str]):
+        self.columns = columns
+
+    def encode(self, rows: List[List[Any]]) -> bytes:
+        return b"".join(orjson.dumps(dict(zip(self.columns, row)), option=orjson.OPT_APPEND_NEWLINE) for row in rows)
+
+
+async def stream_export(dataset: str, query, spec: ExportSpec, fmt: str = "csv",
+                        compress: Optional[str] = None, page_size: int = 500) -> AsyncIterator[bytes]:
+    """Encode a dataset page by page as CSV or NDJSON, optionally as one zstd stream.
+
+    Memory stays bounded by the page size whatever the number of rows.
+    Throughput is logged and published on /metrics when the export ends.
+    """
+    encoder = _CsvEncoder(spec.columns) if fmt == "csv" else _NdjsonEncoder(spec.columns)
+    compressor = zstandard.ZstdCompressor(level=3).compressobj() if compress == "zstd" else None
+    exports_started.inc()
+    rows = 0
+    started = time.perf_counter()
+    completed = False
+    try:
+        header = encoder.encode([])
+        async for page in iter_pages(query, page_size):
+            batch = [row for row in (spec.row(snapshot) for snapshot in page) if row is not None]
+            rows += len(batch)
+            chunk = header + encoder.encode(batch)
+            header = b""
+            if compressor is not None:
+                chunk = compressor.compress(chunk) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+            if chunk:
+                yield chunk
+        tail = header
+        if compressor is not None:
+            tail = compressor.compress(tail) + compressor.flush(zstandard.COMPRESSOBJ_FLUSH_FINISH)
+        if tail:
+            yield tail
+        completed = True
+    finally:
+        elapsed = time.perf_counter() - started
+        rows_exported.inc(rows)
+        if completed:
+            exports_completed.inc()
+        rate = rows / elapsed if elapsed > 0 else 0.0
+        last_export.update({
+            "dataset": dataset, "format": fmt, "compress": compress, "rows": rows,
+            "seconds": round(elapsed, 3), "rows_per_sec": round(rate, 1), "completed": completed,
+        })
+        logger.info(f"Export {dataset} ({fmt}{'+' + compress if compress else ''}) "
+                    f"{'finished' if completed else 'aborted'}: {rows} rows in {elapsed:.2f}s ({rate:.0f} rows/sec)")
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "started": exports_started.value,
+        "completed": exports_completed.value,
+        "rows": rows_exported.value,
+        "last": dict(last_export),
+    }
+
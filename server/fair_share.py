@@ -0,0 +1,423 @@
+# server/fair_share.py
+from typing import Any, Dict, List, Optional, Set, Tuple
+from contextlib import asynccontextmanager
+from fastapi import HTTPException
+import asyncio
+import heapq
+import itertools
+import logging
+import os
+import random
+import time
+
+from shared_store import SharedStore
+
+logger = logging.getLogger(__name__)
+
+
+class RoleLimits:
+    """Quota settings for one user role.
+
+    `rate` is LLM wall-clock seconds refilled per minute, `burst` the bucket
+    capacity in seconds, and `weight` the user's share when the model is
+    contended (an admin with weight 2 gets twice a student's throughput).
+    """
+
+    def __init__(self, rate: float, burst: float, weight: float):
+        self.rate = rate
+        self.burst = burst
+        self.weight = weight
+
+    @classmethod
+    def from_env(cls, role: str, rate: float, burst: float, weight: float) -> "RoleLimits":
+        prefix = f"QUOTA_{role.upper()}"
+        return cls(
+            rate=float(os.getenv(f"{prefix}_LLM_SECONDS_PER_MIN", rate)),
+            burst=float(os.getenv(f"{prefix}_BURST_SECONDS", burst)),
+            weight=float(os.getenv(f"{prefix}_WEIGHT", weight)),
+        )
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"rate": self.rate, "burst": self.burst, "weight": self.weight}
+
+
+# Idle users' quota records are dropped after a week
+ACCOUNT_TTL_SECONDS = 7 * 24 * 60 * 60
+
+DEFAULT_ROLE_LIMITS = {
+    "student": RoleLimits.from_env("student", rate=60, burst=120, weight=1),
+    "admin": RoleLimits.from_env("admin", rate=240, burst=480, weight=2),
+}
+
+
+def token_usage(result: Any) -> Tuple[int, int]:
+    """Return (prompt_tokens, completion_tokens) reported by Ollama for a generation result."""
+    prompt_tokens = completion_tokens = 0
+    try:
+        for generations in result.generations:
+            for gen in generations:
+                usage = getattr(getattr(gen, "message", None), "usage_metadata", None)
+                if usage:
+                    prompt_tokens += usage.get("input_tokens", 0) or 0
+                    completion_tokens += usage.get("output_tokens", 0) or 0
+                    continue
+                info = gen.generation_info or {}
+                prompt_tokens += info.get("prompt_eval_count", 0) or 0
+                completion_tokens += info.get("eval_count", 0) or 0
+    except Exception as e:
+        logger.debug(f"Could not read token usage: {str(e)}")
+    return prompt_tokens, completion_tokens
+
+
+class UserAccount:
+    """One user's quota bucket and usage totals, plus this worker's fair-queue state.
+
+    The bucket and totals are kept in the shared store so every worker debits
+    the same quota; the virtual finish tag and cost estimate only order this
+    worker's own queue and stay local.
+    """
+
+    def __init__(self, user_id: str, role: str, limits: RoleLimits, store: SharedStore):
+        self.user_id = user_id
+        self.role = role
+        self.limits = limits
+        self.store = store
+        self.last_finish = 0.0
+        self.avg_cost = 1.0
+
+    @property
+    def _key(self) -> str:
+        return f"quota:{self.user_id}"
+
+    def _refilled(self, record: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        now = time.time()
+        if record is None:
+            record = {
+                "tokens": self.limits.burst, "refilled_at": now, "requests": 0, "llm_seconds": 0.0,
+                "prompt_tokens": 0, "completion_tokens": 0, "throttled_seconds": 0.0,
+                "rejected": 0, "last_used": None,
+            }
+        record["role"] = self.role
+        record["tokens"] = min(
+            self.limits.burst, record["tokens"] + (now - record["refilled_at"]) * self.limits.rate / 60
+        )
+        record["refilled_at"] = now
+        return record
+
+    def _update(self, func) -> Dict[str, Any]:
+        return self.store.update(self._key, lambda r: func(self._refilled(r)), ttl=ACCOUNT_TTL_SECONDS)
+
+    def throttle_delay(self) -> float:
+        """Seconds until the bucket is back above zero; only reads, the refill is applied on the next write."""
+        record = self._refilled(self.store.get(self._key))
+        if record["tokens"] >= 0:
+            return 0.0
+        return -record["tokens"] * 60 / self.limits.rate
+
+    def record_throttle(self, delay: float):
+        def apply(r):
+            r["throttled_seconds"] += delay
+            return r
+        self._update(apply)
+
+    def record_rejection(self):
+        def apply(r):
+            r["rejected"] += 1
+            return r
+        self._update(apply)
+
+    def charge(self, elapsed: float, usage: Dict[str, int]):
+        def apply(r):
+            r["tokens"] -= elapsed
+            r["requests"] += 1
+            r["llm_seconds"] += elapsed
+            r["prompt_tokens"] += usage.get("prompt_tokens", 0)
+            r["completion_tokens"] += usage.get("completion_tokens", 0)
+            r["last_used"] = time.time()
+            return r
+        self._update(apply)
+        self.avg_cost = 0.8 * self.avg_cost + 0.2 * max(elapsed, 0.01)
+
+
+def _usage_view(user_id: str, record: Dict[str, Any], limits: Dict[str, RoleLimits]) -> Dict[str, Any]:
+    role_limits = limits.get(record.get("role"), limits["student"])
+    tokens = min(role_limits.burst, record["tokens"] + (time.time() - record["refilled_at"]) * role_limits.rate / 60)
+    return {
+        "user_id": user_id,
+        "role": record.get("role", "student"),
+        "limits": role_limits.to_dict(),
+        "quota_remaining_seconds": round(tokens, 3),
+        "requests": record["requests"],
+        "llm_seconds": round(record["llm_seconds"], 3),
+        "prompt_tokens": record["prompt_tokens"],
+        "completion_tokens": record["completion_tokens"],
+        "throttled_seconds": round(record["throttled_seconds"], 3),
+        "rejected": record["rejected"],
+        "last_used": record["last_used"],
+    }
+
+
+class HostSlots:
+    """`total` model slots shared by every worker on the host, held as leases in the shared store.
+
+    Only needed when there are more workers than slots, so that an even
+    per-worker share can't keep to the total. A held lease is renewed while
+    the generation runs; if its worker dies, the slot frees up once the
+    lease lapses after LEASE_SECONDS.
+    """
+
+    LEASE_SECONDS = 30.0
+    POLL_SECONDS = 0.05
+
+    def __init__(self, store: SharedStore, total: int):
+        self.store = store
+        self.total = total
+        self.owner = f"{os.getpid()}-{id(self):x}"
+        self._renewers: Dict[int, asyncio.Task] = {}
+
+    def _take(self) -> Optional[int]:
+        for index in range(self.total):
+            if self.store.add(f"llm_slot:{index}", self.owner, ttl=self.LEASE_SECONDS):
+                return index
+        return None
+
+    async def try_acquire(self) -> Optional[int]:
+        """Take a free slot without waiting; None if all are held."""
+        index = await asyncio.to_thread(self._take)
+        if index is not None:
+            self._renewers[index] = asyncio.create_task(self._renew(index))
+        return index
+
+    async def acquire(self) -> int:
+        while True:
+            index = await self.try_acquire()
+            if index is not None:
+                return index
+            await asyncio.sleep(self.POLL_SECONDS * random.uniform(0.5, 1.5))
+
+    async def _renew(self, index: int):
+        while True:
+            await asyncio.sleep(self.LEASE_SECONDS / 3)
+            await asyncio.to_thread(
+                self.store.update, f"llm_slot:{index}", lambda owner: owner or self.owner, self.LEASE_SECONDS
+            )
+
+    def release(self, index: int):
+        renewer = self._renewers.pop(index, None)
+        if renewer is not None:
+            renewer.cancel()
+        task = asyncio.ensure_future(asyncio.to_thread(self.store.delete, f"llm_slot:{index}"))
+        task.add_done_callback(_log_release_failure)
+
+
+def _log_release_failure(task: asyncio.Future):
+    if not task.cancelled() and task.exception() is not None:
+        logger.warning(f"Could not release a host LLM slot (it lapses on its own): {task.exception()}")
+
+
+class FairShareScheduler:
+    """Weighted fair queue with per-user token buckets in front of the LLM.
+
+    At most `max_concurrency` generations run at once in this worker, and with
+    `host_concurrency` set at most that many across all workers on the
+    host (see HostSlots). Waiting requests are
+    served in order of their virtual finish time, so each user's share of the
+    model is proportional to their role weight no matter how many requests
+    they queue. Every generation's wall time is debited from the user's
+    bucket; a user whose bucket is empty is delayed until it refills (up to
+    `max_throttle_wait`, after which the request is rejected with 429).
+    """
+
+    def __init__(
+        self,
+        store: SharedStore,
+        max_concurrency: int = 2,
+        role_limits: Optional[Dict[str, RoleLimits]] = None,
+        max_throttle_wait: float = 30.0,
+        host_concurrency: Optional[int] = None,
+    ):
+        self.store = store
+        self.max_concurrency = max_concurrency
+        self.host_slots = HostSlots(store, host_concurrency) if host_concurrency else None
+        self.role_limits = role_limits or DEFAULT_ROLE_LIMITS
+        self.max_throttle_wait = max_throttle_wait
+        self._accounts: Dict[str, UserAccount] = {}
+        self._queue: List[Tuple[float, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._running = 0
+        self._virtual_time = 0.0
+        self._charging: Set[asyncio.Future] = set()
+
+    def account(self, user_id: str, role: str = "student") -> UserAccount:
+        role = role if role in self.role_limits else "student"
+        account = self._accounts.get(user_id)
+        if account is None or account.role != role:
+            account = UserAccount(user_id, role, self.role_limits[role], self.store)
+            self._accounts[user_id] = account
+        return account
+
+    async def admit(self, user_id: str, role: str = "student") -> UserAccount:
+        """Apply the user's quota: wait while their bucket refills, or reject with 429 if that takes too long."""
+        account = self.account(user_id, role)
+
+        # Quota records live in SQLite; reads and writes run in a thread so a busy store can't stall the loop
+        delay = await asyncio.to_thread(account.throttle_delay)
+        if delay > self.max_throttle_wait:
+            await asyncio.to_thread(account.record_rejection)
+            raise HTTPException(
+                status_code=429,
+                detail="You're sending requests too quickly. Please wait a moment and try again.",
+                headers={"Retry-After": str(int(delay) + 1)}
+            )
+        if delay > 0:
+            await asyncio.to_thread(account.record_throttle, delay)
+            logger.info(f"Throttling user {user_id} for {delay:.1f}s (quota exhausted)")
+            await asyncio.sleep(delay)
+        return account
+
+    @asynccontextmanager
+    async def slot(self, user_id: str, role: str = "student"):
+        """Wait for this user's fair turn at the model, then charge the time spent in the block."""
+        account = await self.admit(user_id, role)
+        await self._acquire(account)
+        host_slot = await self._acquire_host_slot()
+        started = time.monotonic()
+        usage = {"prompt_tokens": 0, "completion_tokens": 0}
+        try:
+            yield usage
+        finally:
+            self._release([account], time.monotonic() - started, [usage], host_slot)
+
+    @asynccontextmanager
+    async def batch_slot(self, members: List[Tuple[str, str]]):
+        """One model slot for a batch of already admitted (user_id, role) requests.
+
+        The batch queues with the fair turn of its member who is owed the
+        most. Yields one usage dict per member; each member is charged an
+        equal share of the wall time plus its own tokens.
+        """
+        accounts = [self.account(user_id, role) for user_id, role in members]
+        await self._acquire(min(accounts, key=lambda account: account.last_finish))
+        host_slot = await self._acquire_host_slot()
+        started = time.monotonic()
+        usages = [{"prompt_tokens": 0, "completion_tokens": 0} for _ in accounts]
+        try:
+            yield usages
+        finally:
+            self._release(accounts, (time.monotonic() - started) / len(accounts), usages, host_slot)
+
+    @asynccontextmanager
+    async def spare_slot(self):
+        """A model slot only if one is idle and nobody is waiting, for speculative work like hedged calls.
+
+        Yields False without taking a slot otherwise. Nothing is charged to any user.
+        """
+        if self._running >= self.max_concurrency or self._queue:
+            yield False
+            return
+        self._running += 1
+        host_slot = None
+        try:
+            if self.host_slots is not None:
+                host_slot = await self.host_slots.try_acquire()
+                if host_slot is None:
+                    yield False
+                    return
+            yield True
+        finally:
+            if host_slot is not None:
+                self.host_slots.release(host_slot)
+            self._running -= 1
+            self._dispatch()
+
+    async def _acquire(self, account: UserAccount):
+        start_tag = max(self._virtual_time, account.last_finish)
+        finish_tag = start_tag + account.avg_cost / account.limits.weight
+        account.last_finish = finish_tag
+
+        if self._running < self.max_concurrency and not self._queue:
+            self._running += 1
+            self._virtual_time = max(self._virtual_time, start_tag)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        entry = (finish_tag, next(self._seq), future)
+        heapq.heappush(self._queue, entry)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Slot was handed to us just as we were cancelled - pass it on
+                self._running -= 1
+                self._dispatch()
+            else:
+                self._queue.remove(entry)
+                heapq.heapify(self._queue)
+            raise
+        self._virtual_time = max(self._virtual_time, start_tag)
+
+    async def _acquire_host_slot(self) -> Optional[int]:
+        """Wait for a host-wide slot while holding this worker's; gives the local one back if cancelled."""
+        if self.host_slots is None:
+            return None
+        try:
+            return await self.host_slots.acquire()
+        except BaseException:
+            self._running -= 1
+            self._dispatch()
+            raise
+
+    def _release(self, accounts: List[UserAccount], elapsed: float, usages: List[Dict[str, int]],
+                 host_slot: Optional[int] = None):
+        if host_slot is not None:
+            self.host_slots.release(host_slot)
+        self._running -= 1
+        self._dispatch()
+        # Charged in the background: the caller shouldn't wait on the store, and the next admit
+        # only needs the bucket to be roughly current
+        task = asyncio.ensure_future(asyncio.to_thread(self._charge, accounts, elapsed, usages))
+        self._charging.add(task)
+        task.add_done_callback(self._charging.discard)
+
+    @staticmethod
+    def _charge(accounts: List[UserAccount], elapsed: float, usages: List[Dict[str, int]]):
+        for account, usage in zip(accounts, usages):
+            try:
+                account.charge(elapsed, usage)
+            except Exception as e:
+                logger.warning(f"Could not record LLM usage for {account.user_id}: {str(e)}")
+
+    def _dispatch(self):
+        while self._running < self.max_concurrency and self._queue:
+            _, _, future = heapq.heappop(self._queue)
+            if future.done():
+                continue
+            self._running += 1
+            future.set_result(None)
+
+    @property
+    def queued(self) -> int:
+        """Generations waiting in this worker for a free slot."""
+        return len(self._queue)
+
+    def usage(self, user_id: str) -> Optional[Dict[str, Any]]:
+        record = self.store.get(f"quota:{user_id}")
+        return _usage_view(user_id, record, self.role_limits) if record else None
+
+    def top_users(self, limit: int = 20) -> List[Dict[str, Any]]:
+        records = [(key[len("quota:"):], r) for key, r in self.store.items("quota:")]
+        records.sort(key=lambda item: item[1]["llm_seconds"], reverse=True)
+        return [_usage_view(user_id, r, self.role_limits) for user_id, r in records[:limit]]
+
+    def stats(self) -> Dict[str, Any]:
+        records = [r for _, r in self.store.items("quota:")]
+        return {
+            "max_concurrency": self.max_concurrency,
+            "host_concurrency": self.host_slots.total if self.host_slots else None,
+            "running": self._running,
+            "queued": len(self._queue),
+            "users": len(records),
+            "llm_seconds": round(sum(r["llm_seconds"] for r in records), 3),
+            "throttled_seconds": round(sum(r["throttled_seconds"] for r in records), 3),
+            "rejected": sum(r["rejected"] for r in records),
+        }
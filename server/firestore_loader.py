@@ -0,0 +1,174 @@
+# server/firestore_loader.py
+from typing import Any, Callable, Dict, List, Optional
+from contextvars import ContextVar
+import asyncio
+import logging
+import os
+
+from metrics import Counter
+import deadlines
+
+logger = logging.getLogger(__name__)
+
+# Per-call limit for reads outside a request; inside one the request's deadline applies
+FIRESTORE_TIMEOUT_SECONDS = float(os.getenv("FIRESTORE_TIMEOUT_SECONDS", "30"))
+
+
+class DocumentLoader:
+    """Per-request Firestore document loader.
+
+    Document reads requested in the same event-loop turn (for example from
+    `asyncio.gather`) are sent together as one `get_all` call, and every
+    snapshot is memoized for the rest of the request, so helpers that each
+    need the user doc share a single read. Snapshots reflect the first read;
+    writes made later in the request are not reflected unless `forget` is
+    called. Blocking client calls run in a worker thread.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.round_trips = 0
+        self.documents = 0
+        self._cache: Dict[str, asyncio.Future] = {}
+        self._pending: Dict[str, Any] = {}
+        self._tasks = set()
+
+    def load(self, ref) -> "asyncio.Future":
+        """Return a future for the snapshot of `ref`, batching it with other loads this turn."""
+        future = self._cache.get(ref.path)
+        if future is not None:
+            return future
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._cache[ref.path] = future
+        if not self._pending:
+            # Dispatch after the other ready tasks have had a chance to queue their loads
+            loop.call_soon(self._schedule_dispatch)
+        self._pending[ref.path] = ref
+        return future
+
+    async def load_many(self, refs: List[Any]) -> List[Any]:
+        return list(await asyncio.gather(*(self.load(ref) for ref in refs)))
+
+    def forget(self, ref):
+        """Drop a memoized snapshot, e.g. after writing the document."""
+        self._cache.pop(ref.path, None)
+
+    def _schedule_dispatch(self):
+        task = asyncio.ensure_future(self._dispatch())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _dispatch(self):
+        batch, self._pending = self._pending, {}
+        self.round_trips += 1
+        self.documents += len(batch)
+        futures = {path: self._cache[path] for path in batch}
+        try:
+            rpc_timeout = deadlines.timeout(FIRESTORE_TIMEOUT_SECONDS)
+            snapshots = await deadlines.bounded(
+                asyncio.to_thread(lambda: list(self.db.get_all(list(batch.values()), timeout=rpc_timeout))), "firestore"
+            )
+        except Exception as e:
+            for path, future in futures.items():
+                self._cache.pop(path, None)
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for snapshot in snapshots:
+            future = futures.get(snapshot.reference.path)
+            if future is not None and not future.done():
+                future.set_result(snapshot)
+        for path, future in futures.items():
+            if not future.done():
+                self._cache.pop(path, None)
+                future.set_exception(LookupError(f"get_all returned no snapshot for {path}"))
+
+    async def query(self, query) -> List[Any]:
+        """Run a query (or collection read) in a worker thread; not memoized."""
+        self.round_trips += 1
+        rpc_timeout = deadlines.timeout(FIRESTORE_TIMEOUT_SECONDS)
+        snapshots = await deadlines.bounded(asyncio.to_thread(lambda: list(query.get(timeout=rpc_timeout))), "firestore")
+        self.documents += len(snapshots)
+        return snapshots
+
+
+class EndpointStats:
+    def __init__(self):
+        self.requests = Counter()
+        self.round_trips = Counter()
+        self.documents = Counter()
+        self.max_round_trips = 0
+
+    def record(self, loader: DocumentLoader):
+        self.requests.inc()
+        self.round_trips.inc(loader.round_trips)
+        self.documents.inc(loader.documents)
+        self.max_round_trips = max(self.max_round_trips, loader.round_trips)
+
+    def as_dict(self) -> Dict[str, Any]:
+        requests = self.requests.value
+        return {
+            "requests": requests,
+            "round_trips": self.round_trips.value,
+            "documents": self.documents.value,
+            "avg_round_trips": round(self.round_trips.value / requests, 2) if requests else 0.0,
+            "max_round_trips": self.max_round_trips,
+        }
+
+
+current_loader: ContextVar[Optional[DocumentLoader]] = ContextVar("firestore_loader", default=None)
+endpoint_stats: Dict[str, EndpointStats] = {}
+
+
+def get_loader(db) -> DocumentLoader:
+    """Return the current request's loader, or a throwaway one outside a request."""
+    loader = current_loader.get()
+    if loader is None or loader.db is not db:
+        loader = DocumentLoader(db)
+    return loader
+
+
+async def load_document(db, ref):
+    return await get_loader(db).load(ref)
+
+
+class FirestoreLoaderMiddleware:
+    """ASGI middleware that gives each HTTP request its own DocumentLoader.
+
+    Firestore round trips are recorded per endpoint and reported to the
+    client in an `X-Firestore-Round-Trips` response header.
+    """
+
+    def __init__(self, app, db_getter: Callable[[], Any]):
+        self.app = app
+        self.db_getter = db_getter
+
+    async def __call__(self, scope, receive, send):
+        db = self.db_getter()
+        if scope["type"] != "http" or db is None:
+            await self.app(scope, receive, send)
+            return
+
+        loader = DocumentLoader(db)
+        token = current_loader.set(loader)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-firestore-round-trips", str(loader.round_trips).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_loader.reset(token)
+            endpoint = scope.get("endpoint")
+            if endpoint is not None:
+                name = getattr(endpoint, "__name__", str(endpoint))
+                endpoint_stats.setdefault(name, EndpointStats()).record(loader)
+
+
+def stats() -> Dict[str, Any]:
+    return {name: endpoint.as_dict() for name, endpoint in sorted(endpoint_stats.items())}
@@ -0,0 +1,217 @@
+# server/generation_profiles.py
+from typing import Any, Dict, List, Optional
+import logging
+import os
+import re
+
+from metrics import Counter, Samples
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MODEL = os.getenv("OLLAMA_MODEL", "llama3.1")
+# Smaller model for tasks that degrade gracefully, e.g. "llama3.2:3b". Off unless set, since on a
+# CPU-only host the primary's p95 is over budget from the start and everything would fall back;
+# set LLM_<PROFILE>_FALLBACK_MODEL="" to turn it off for one task
+SMALL_MODEL = os.getenv("OLLAMA_SMALL_MODEL", "")
+# Llama chat templates add a header and end-of-turn markers around every message
+TEMPLATE_TOKENS_PER_MESSAGE = 8
+_PIECES = re.compile(r"\w+|[^\w\s]")
+
+
+class GenerationProfile:
+    """Sampling and context settings for one kind of LLM task.
+
+    `prompt_budget` is the most prompt tokens the task may send; by default
+    whatever `num_ctx` leaves after reserving `num_predict` for the output,
+    so the prompt is never truncated to make room for the reply.
+    `fallback_model` is the smaller model the router switches to when
+    `model`'s p95 latency goes over `p95_budget_ms` (see model_router.py).
+    """
+
+    def __init__(self, name: str, model: str, temperature: float, num_ctx: int, num_predict: int,
+                 stop: Optional[List[str]] = None, keep_alive: str = "30m", timeout: int = 120,
+                 prompt_budget: Optional[int] = None, fallback_model: Optional[str] = None,
+                 p95_budget_ms: float = 30000):
+        self.name = name
+        self.model = model
+        self.fallback_model = fallback_model or None
+        self.p95_budget_ms = p95_budget_ms
+        self.temperature = temperature
+        self.num_ctx = num_ctx
+        self.num_predict = num_predict
+        self.stop = stop or []
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.prompt_budget = prompt_budget if prompt_budget is not None else num_ctx - num_predict
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> "GenerationProfile":
+        prefix = f"LLM_{name.upper()}"
+        return cls(
+            name=name,
+            model=os.getenv(f"{prefix}_MODEL", defaults.pop("model", DEFAULT_MODEL)),
+            temperature=float(os.getenv(f"{prefix}_TEMPERATURE", defaults.pop("temperature"))),
+            num_ctx=int(os.getenv(f"{prefix}_NUM_CTX", defaults.pop("num_ctx"))),
+            num_predict=int(os.getenv(f"{prefix}_NUM_PREDICT", defaults.pop("num_predict"))),
+            keep_alive=os.getenv(f"{prefix}_KEEP_ALIVE", defaults.pop("keep_alive", "30m")),
+            fallback_model=os.getenv(f"{prefix}_FALLBACK_MODEL", defaults.pop("fallback_model", None)),
+            p95_budget_ms=float(os.getenv(f"{prefix}_P95_BUDGET_MS", defaults.pop("p95_budget_ms", 30000))),
+            **defaults,
+        )
+
+    def chat_model(self, model: Optional[str] = None):
+        from langchain_ollama import ChatOllama
+
+        return ChatOllama(
+            model=model or self.model,
+            temperature=self.temperature,
+            num_ctx=self.num_ctx,
+            num_predict=self.num_predict,
+            stop=self.stop or None,
+            keep_alive=self.keep_alive,
+            client_kwargs={"timeout": self.timeout}
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "model": self.model, "temperature": self.temperature, "num_ctx": self.num_ctx,
+            "num_predict": self.num_predict, "stop": self.stop, "keep_alive": self.keep_alive,
+            "prompt_budget": self.prompt_budget, "fallback_model": self.fallback_model,
+            "p95_budget_ms": self.p95_budget_ms,
+        }
+
+
+PROFILES: Dict[str, GenerationProfile] = {
+    # 2-3 short sentences; the stops end a reply that starts writing the learner's next turn
+    "voice_chat": GenerationProfile.from_env(
+        "voice_chat", temperature=0.7, num_ctx=2048, num_predict=120,
+        stop=["\nUser said:", "\nUser:", "\nLearner:"], fallback_model=SMALL_MODEL, p95_budget_ms=4000
+    ),
+    "oral_evaluation": GenerationProfile.from_env(
+        "oral_evaluation", temperature=0.3, num_ctx=2048, num_predict=512,
+        fallback_model=SMALL_MODEL, p95_budget_ms=10000
+    ),
+    # Eight questions of JSON run to ~1000 tokens on top of a ~550-token prompt, too close to 2048
+    "quiz_generation": GenerationProfile.from_env(
+        "quiz_generation", temperature=0.7, num_ctx=4096, num_predict=1536
+    ),
+    # One question per call, so many can run side by side on a multi-slot Ollama
+    "quiz_question": GenerationProfile.from_env(
+        "quiz_question", temperature=0.8, num_ctx=2048, num_predict=256,
+        fallback_model=SMALL_MODEL, p95_budget_ms=12000
+    ),
+    "quiz_evaluator": GenerationProfile.from_env(
+        "quiz_evaluator", temperature=0.3, num_ctx=4096, num_predict=384, timeout=60
+    ),
+}
+
+
+def get_profile(name: str) -> GenerationProfile:
+    return PROFILES[name]
+
+
+def configured_models() -> List[str]:
+    """Every model some profile may use, primaries first."""
+    models = [profile.model for profile in PROFILES.values()]
+    models += [profile.fallback_model for profile in PROFILES.values() if profile.fallback_model]
+    return list(dict.fromkeys(models))
+
+
+def disable_fallback(model: str):
+    """Stop routing any profile to `model`, e.g. because Ollama could not load it."""
+    for profile in PROFILES.values():
+        if profile.fallback_model == model:
+            profile.fallback_model = None
+            logger.warning(f"Fallback model {model} disabled for {profile.name}")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough Llama 3 token count: one per word or symbol, plus one per further 8 letters of long words."""
+    return sum(1 + (len(piece) - 1) // 8 for piece in _PIECES.findall(text))
+
+
+def estimate_prompt_tokens(messages: List[str]) -> int:
+    return sum(estimate_tokens(message) + TEMPLATE_TOKENS_PER_MESSAGE for message in messages)
+
+
+class ProfileStats:
+    def __init__(self):
+        self.calls = Counter()
+        self.failures = Counter()
+        self.hit_token_cap = Counter()
+        self.over_budget = Counter()
+        self.prompt_tokens = Samples()
+        self.output_tokens = Samples()
+        self.latency_ms = Samples()
+        self.by_model: Dict[str, Counter] = {}
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls.value,
+            "failures": self.failures.value,
+            "hit_token_cap": self.hit_token_cap.value,
+            "prompt_over_budget": self.over_budget.value,
+            "prompt_tokens": self.prompt_tokens.summary(),
+            "output_tokens": self.output_tokens.summary(),
+            "latency_ms": self.latency_ms.summary(),
+            "calls_by_model": {model: counter.value for model, counter in self.by_model.items()},
+        }
+
+
+profile_stats: Dict[str, ProfileStats] = {name: ProfileStats() for name in PROFILES}
+startup_budgets: Dict[str, Dict[str, Any]] = {}
+
+
+def record(name: str, prompt_tokens: int, output_tokens: int, seconds: float, model: Optional[str] = None):
+    """Record one finished generation; warns when Ollama's prompt count is over the budget."""
+    profile, usage = PROFILES[name], profile_stats[name]
+    usage.calls.inc()
+    model = model or profile.model
+    if model not in usage.by_model:
+        usage.by_model[model] = Counter()
+    usage.by_model[model].inc()
+    usage.latency_ms.observe(seconds * 1000)
+    if prompt_tokens:
+        usage.prompt_tokens.observe(prompt_tokens)
+        if prompt_tokens > profile.prompt_budget:
+            usage.over_budget.inc()
+            logger.warning(f"Prompt for profile {name} used {prompt_tokens} tokens, "
+                           f"over its budget of {profile.prompt_budget} (num_ctx {profile.num_ctx})")
+    if output_tokens:
+        usage.output_tokens.observe(output_tokens)
+        if output_tokens >= profile.num_predict:
+            usage.hit_token_cap.inc()
+
+
+def record_failure(name: str):
+    profile_stats[name].failures.inc()
+
+
+def check_prompt_budgets(samples: Dict[str, List[List[str]]]) -> Dict[str, Dict[str, Any]]:
+    """Estimate the largest sample prompt of each profile and alert when it exceeds the budget.
+
+    `samples` maps a profile name to representative prompts, each a list of
+    message texts.
+    """
+    for name, prompts in samples.items():
+        profile = PROFILES[name]
+        largest = max(estimate_prompt_tokens(prompt) for prompt in prompts)
+        within = largest <= profile.prompt_budget
+        startup_budgets[name] = {
+            "estimated_prompt_tokens": largest,
+            "prompt_budget": profile.prompt_budget,
+            "within_budget": within,
+        }
+        if within:
+            logger.info(f"Profile {name}: largest prompt ~{largest} tokens, budget {profile.prompt_budget}")
+        else:
+            logger.error(f"ALERT: profile {name} prompt is ~{largest} tokens, over its budget of "
+                         f"{profile.prompt_budget}; Ollama will truncate it at num_ctx {profile.num_ctx}")
+    return startup_budgets
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        name: {**profile.to_dict(), "startup": startup_budgets.get(name), **profile_stats[name].as_dict()}
+        for name, profile in PROFILES.items()
+    }
@@ -0,0 +1,122 @@
+# server/idempotency.py
+from typing import Any, Awaitable, Callable, Dict, Optional
+from fastapi import HTTPException
+import asyncio
+import hashlib
+import json
+import logging
+import time
+
+from metrics import Counter
+from shared_store import SharedStore
+
+logger = logging.getLogger(__name__)
+
+
+def request_fingerprint(payload: Dict[str, Any]) -> str:
+    body = json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+
+class IdempotencyStore:
+    """Remember the outcome of POST requests carrying an Idempotency-Key header.
+
+    The first request for a key claims it in the shared store as in progress;
+    retries wait for that outcome (on the same worker by awaiting the running
+    task, on other workers by polling). Once it succeeds the response is kept
+    for `ttl_seconds` and replayed without re-running the handler. Failed
+    requests release their key so the client can try again.
+    """
+
+    def __init__(self, store: SharedStore, ttl_seconds: float = 24 * 60 * 60,
+                 in_progress_ttl: float = 300, poll_interval: float = 0.1):
+        self.store = store
+        self.ttl_seconds = ttl_seconds
+        self.in_progress_ttl = in_progress_ttl
+        self.poll_interval = poll_interval
+        self._local: Dict[str, asyncio.Future] = {}
+        self.executed = Counter()
+        self.replayed = Counter()
+        self.conflicts = Counter()
+
+    async def run(
+        self,
+        scope: str,
+        key: Optional[str],
+        payload: Dict[str, Any],
+        func: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        if not key:
+            return await func()
+
+        store_key = f"idempotency:{scope}:{key}"
+        fingerprint = request_fingerprint(payload)
+        deadline = time.monotonic() + self.in_progress_ttl
+
+        while True:
+            claimed = await asyncio.to_thread(
+                self.store.add, store_key, {"state": "in_progress", "fingerprint": fingerprint}, self.in_progress_ttl
+            )
+            if claimed:
+                return await self._execute(store_key, fingerprint, func)
+
+            entry = await asyncio.to_thread(self.store.get, store_key)
+            if entry is None:
+                # Released or expired between our claim attempt and read - try again
+                continue
+            if entry["fingerprint"] != fingerprint:
+                self.conflicts.inc()
+                raise HTTPException(
+                    status_code=422,
+                    detail="Idempotency-Key was already used with a different request"
+                )
+            if entry["state"] == "completed":
+                self.replayed.inc()
+                logger.info(f"Replaying idempotent {scope} request for key {key}")
+                return entry["response"]
+
+            local = self._local.get(store_key)
+            if local is not None:
+                self.replayed.inc()
+                return await asyncio.shield(local)
+            if time.monotonic() > deadline:
+                raise HTTPException(
+                    status_code=409,
+                    detail="A request with this Idempotency-Key is still being processed"
+                )
+            await asyncio.sleep(self.poll_interval)
+
+    async def _execute(self, store_key: str, fingerprint: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        self._local[store_key] = future
+        self.executed.inc()
+        try:
+            response = await func()
+        except BaseException as e:
+            # Release the key so a retry can run the request again; synchronous, as this may be a cancellation
+            self.store.delete(store_key)
+            if isinstance(e, Exception):
+                future.set_exception(e)
+                future.exception()
+            else:
+                future.cancel()
+            raise
+        finally:
+            self._local.pop(store_key, None)
+
+        await asyncio.to_thread(
+            self.store.set,
+            store_key,
+            {"state": "completed", "fingerprint": fingerprint, "response": response},
+            self.ttl_seconds
+        )
+        future.set_result(response)
+        return response
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_progress_local": len(self._local),
+            "executed": self.executed.value,
+            "replayed": self.replayed.value,
+            "conflicts": self.conflicts.value,
+        }
@@ -0,0 +1,362 @@
+# server/job_queue.py
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from collections import deque
+import asyncio
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import uuid
+
+from metrics import Counter, Samples
+
+logger = logging.getLogger(__name__)
+
+FINISHED_RETENTION_SECONDS = 7 * 24 * 60 * 60
+THROUGHPUT_WINDOW_SECONDS = 300
+
+
+class PermanentJobError(Exception):
+    """Raised by a handler when retrying cannot help (e.g. missing configuration); the job fails at once."""
+
+
+class JobQueue:
+    """Durable job queue in a SQLite file shared by every worker process on this host.
+
+    A claimed job carries a lease; the worker renews it while the job runs.
+    If the worker dies the lease lapses and any worker may claim the job
+    again, so handlers must be safe to run more than once. Uses the same
+    per-process connection scheme as SharedStore.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, type TEXT NOT NULL, payload TEXT NOT NULL, status TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, max_attempts INTEGER NOT NULL, dedupe_key TEXT, "
+                "run_at REAL NOT NULL, created_at REAL NOT NULL, started_at REAL, finished_at REAL, "
+                "lease_owner TEXT, lease_expires REAL, result TEXT, error TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (type, status, run_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_dedupe ON jobs (dedupe_key, status)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _transaction(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def initialize(self):
+        """Create the schema and drop old finished jobs; called once before workers start."""
+        cutoff = time.time() - FINISHED_RETENTION_SECONDS
+        removed = self._transaction(lambda conn: conn.execute(
+            "DELETE FROM jobs WHERE status IN ('succeeded', 'failed') AND finished_at < ?", (cutoff,)
+        ).rowcount)
+        logger.info(f"Job queue ready at {self.path} ({removed} old jobs removed)")
+
+    def enqueue(self, job_type: str, payload: Dict[str, Any], max_attempts: int = 5,
+                delay: float = 0.0, dedupe_key: Optional[str] = None) -> str:
+        """Add a job and return its ID.
+
+        With a `dedupe_key`, a job with the same key that is still queued or
+        running is returned instead of adding another.
+        """
+        now = time.time()
+
+        def insert(conn):
+            if dedupe_key:
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE dedupe_key = ? AND status IN ('queued', 'running')", (dedupe_key,)
+                ).fetchone()
+                if row:
+                    return row["id"]
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, type, payload, status, max_attempts, dedupe_key, run_at, created_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?, ?, ?)",
+                (job_id, job_type, json.dumps(payload, default=str), max_attempts, dedupe_key, now + delay, now)
+            )
+            return job_id
+
+        return self._transaction(insert)
+
+    def claim(self, job_type: str, owner: str, lease_seconds: float,
+              max_running: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Lease the next due job of a type, including running jobs whose lease has lapsed.
+
+        With `max_running`, nothing is claimed while that many jobs of the type
+        hold a live lease, whichever worker runs them.
+        """
+        now = time.time()
+
+        def take(conn):
+            if max_running is not None:
+                running = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE type = ? AND status = 'running' AND lease_expires >= ?",
+                    (job_type, now)
+                ).fetchone()[0]
+                if running >= max_running:
+                    return None
+            row = conn.execute(
+                "SELECT * FROM jobs WHERE type = ? AND ("
+                "(status = 'queued' AND run_at <= ?) OR (status = 'running' AND lease_expires < ?)"
+                ") ORDER BY run_at LIMIT 1",
+                (job_type, now, now)
+            ).fetchone()
+            if row is None:
+                return None
+            if row["status"] == "running":
+                logger.warning(f"Reclaiming job {row['id']} ({job_type}) from {row['lease_owner']}, whose lease lapsed")
+            conn.execute(
+                "UPDATE jobs SET status = 'running', attempts = attempts + 1, started_at = ?, "
+                "lease_owner = ?, lease_expires = ? WHERE id = ?",
+                (now, owner, now + lease_seconds, row["id"])
+            )
+            return {**dict(row), "attempts": row["attempts"] + 1, "started_at": now}
+
+        job = self._transaction(take)
+        if job is not None:
+            job["payload"] = json.loads(job["payload"])
+        return job
+
+    def renew(self, job_id: str, owner: str, lease_seconds: float) -> bool:
+        with self._lock:
+            cursor = self._connection().execute(
+                "UPDATE jobs SET lease_expires = ? WHERE id = ? AND lease_owner = ? AND status = 'running'",
+                (time.time() + lease_seconds, job_id, owner)
+            )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: str, owner: str, result: Any = None):
+        with self._lock:
+            self._connection().execute(
+                "UPDATE jobs SET status = 'succeeded', finished_at = ?, result = ?, error = NULL, "
+                "lease_owner = NULL, lease_expires = NULL WHERE id = ? AND lease_owner = ?",
+                (time.time(), json.dumps(result, default=str), job_id, owner)
+            )
+
+    def fail(self, job_id: str, owner: str, error: str, retry_in: Optional[float]):
+        """Record a failed attempt; requeue after `retry_in` seconds, or fail for good if None."""
+        now = time.time()
+        with self._lock:
+            if retry_in is None:
+                self._connection().execute(
+                    "UPDATE jobs SET status = 'failed', finished_at = ?, error = ?, "
+                    "lease_owner = NULL, lease_expires = NULL WHERE id = ? AND lease_owner = ?",
+                    (now, error, job_id, owner)
+                )
+            else:
+                self._connection().execute(
+                    "UPDATE jobs SET status = 'queued', run_at = ?, error = ?, "
+                    "lease_owner = NULL, lease_expires = NULL WHERE id = ? AND lease_owner = ?",
+                    (now + retry_in, error, job_id, owner)
+                )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._connection().execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["payload"] = json.loads(job["payload"])
+        job["result"] = json.loads(job["result"]) if job["result"] is not None else None
+        return job
+
+    def depth(self) -> Dict[str, Dict[str, int]]:
+        """Number of jobs per type and status."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT type, status, COUNT(*) AS n FROM jobs GROUP BY type, status"
+            ).fetchall()
+        depth: Dict[str, Dict[str, int]] = {}
+        for row in rows:
+            depth.setdefault(row["type"], {})[row["status"]] = row["n"]
+        return depth
+
+
+class JobType:
+    """A kind of job: its handler, how many run at once per process (and, optionally, across
+    all processes with `max_running`), and its retry policy."""
+
+    def __init__(self, name: str, handler: Callable[[Dict[str, Any]], Awaitable[Any]], concurrency: int = 1,
+                 max_attempts: int = 5, base_delay: float = 5.0, max_delay: float = 600.0,
+                 lease_seconds: float = 120.0, max_running: Optional[int] = None):
+        self.name = name
+        self.handler = handler
+        self.concurrency = concurrency
+        self.max_running = max_running
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lease_seconds = lease_seconds
+
+    def retry_delay(self, attempts: int) -> float:
+        """Exponential backoff with full jitter."""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (attempts - 1)))
+
+
+class JobTypeStats:
+    def __init__(self):
+        self.succeeded = Counter()
+        self.failed = Counter()
+        self.retried = Counter()
+        self.reclaimed = Counter()
+        self.queue_latency = Samples()
+        self.run_seconds = Samples()
+        self._finished = deque()
+
+    def record_finish(self):
+        now = time.monotonic()
+        self._finished.append(now)
+        while self._finished and self._finished[0] < now - THROUGHPUT_WINDOW_SECONDS:
+            self._finished.popleft()
+
+    def as_dict(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        recent = sum(1 for t in self._finished if t >= now - THROUGHPUT_WINDOW_SECONDS)
+        return {
+            "succeeded": self.succeeded.value,
+            "failed": self.failed.value,
+            "retried": self.retried.value,
+            "reclaimed": self.reclaimed.value,
+            "per_minute": round(recent * 60 / THROUGHPUT_WINDOW_SECONDS, 2),
+            "queue_latency_seconds": self.queue_latency.summary(),
+            "run_seconds": self.run_seconds.summary(),
+        }
+
+
+class JobRunner:
+    """Runs queued jobs in this process with a fixed number of workers per job type.
+
+    Workers poll the queue every `poll_interval` seconds and are woken
+    straight away for jobs enqueued by this process.
+    """
+
+    def __init__(self, queue: JobQueue, poll_interval: float = 1.0):
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self.types: Dict[str, JobType] = {}
+        self.type_stats: Dict[str, JobTypeStats] = {}
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._tasks: List[asyncio.Task] = []
+
+    def register(self, job_type: JobType):
+        self.types[job_type.name] = job_type
+        self.type_stats[job_type.name] = JobTypeStats()
+
+    async def submit(self, job_type: str, payload: Dict[str, Any], dedupe_key: Optional[str] = None) -> str:
+        """Queue a job of a registered type and return its ID."""
+        spec = self.types[job_type]
+        job_id = await asyncio.to_thread(self.queue.enqueue, job_type, payload, spec.max_attempts, 0.0, dedupe_key)
+        wakeup = self._wakeups.get(job_type)
+        if wakeup is not None:
+            wakeup.set()
+        return job_id
+
+    def start(self):
+        for name, spec in self.types.items():
+            self._wakeups[name] = asyncio.Event()
+            for _ in range(spec.concurrency):
+                self._tasks.append(asyncio.create_task(self._worker(spec)))
+        logger.info(f"Job runner {self.owner} started: "
+                    f"{', '.join(f'{name} x{spec.concurrency}' for name, spec in self.types.items())}")
+
+    async def stop(self):
+        """Stop the workers; jobs they were running are reclaimed once their leases lapse."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks.clear()
+
+    async def _worker(self, spec: JobType):
+        wakeup = self._wakeups[spec.name]
+        while True:
+            try:
+                job = await asyncio.to_thread(
+                    self.queue.claim, spec.name, self.owner, spec.lease_seconds, spec.max_running
+                )
+            except Exception as e:
+                logger.warning(f"Could not claim {spec.name} job: {e}")
+                job = None
+            if job is None:
+                wakeup.clear()
+                try:
+                    await asyncio.wait_for(wakeup.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run(spec, job)
+
+    async def _run(self, spec: JobType, job: Dict[str, Any]):
+        usage = self.type_stats[spec.name]
+        # `status` is the job's state before this claim
+        if job["status"] == "running":
+            usage.reclaimed.inc()
+        elif job["attempts"] == 1:
+            usage.queue_latency.observe(job["started_at"] - job["created_at"])
+
+        async def keep_lease():
+            while True:
+                await asyncio.sleep(spec.lease_seconds / 3)
+                await asyncio.to_thread(self.queue.renew, job["id"], self.owner, spec.lease_seconds)
+
+        renewer = asyncio.create_task(keep_lease())
+        started = time.perf_counter()
+        try:
+            result = await spec.handler(job["payload"])
+        except Exception as e:
+            retryable = job["attempts"] < job["max_attempts"] and not isinstance(e, PermanentJobError)
+            retry_in = spec.retry_delay(job["attempts"]) if retryable else None
+            await asyncio.to_thread(self.queue.fail, job["id"], self.owner, str(e), retry_in)
+            if retry_in is None:
+                usage.failed.inc()
+                usage.record_finish()
+                logger.error(f"Job {job['id']} ({spec.name}) failed after {job['attempts']} attempts: {e}")
+            else:
+                usage.retried.inc()
+                logger.warning(f"Job {job['id']} ({spec.name}) attempt {job['attempts']} failed, "
+                               f"retrying in {retry_in:.0f}s: {e}")
+        else:
+            await asyncio.to_thread(self.queue.complete, job["id"], self.owner, result)
+            usage.succeeded.inc()
+            usage.record_finish()
+        finally:
+            renewer.cancel()
+            usage.run_seconds.observe(time.perf_counter() - started)
+
+    def stats(self) -> Dict[str, Any]:
+        try:
+            depth = self.queue.depth()
+        except Exception as e:
+            depth = {"error": str(e)}
+        return {
+            "types": {name: {"concurrency": spec.concurrency, **self.type_stats[name].as_dict(),
+                             "depth": depth.get(name, {})} for name, spec in self.types.items()},
+        }
+
+
+job_queue = JobQueue(os.getenv("TALKBUDDY_JOB_STORE", "talkbuddy_jobs.db"))
@@ -0,0 +1,392 @@
+# server/llm_parsing.py
+from typing import Any, Dict, List, Literal, Optional, Tuple
+from pydantic import BaseModel, TypeAdapter, ValidationError, field_validator, model_validator
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+_CLOSERS = {"{": "}", "[": "]"}
+_SMART_DOUBLE = {"“": "”", "„": "”", "«": "»"}
+_SMART_SINGLE = "‘’‚"
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_STRUCTURAL = re.compile(r'[{}\[\]"]')
+_VALUE_START = re.compile(r'\s*(?:["“\'{\[\]}\d-]|true|false|null|True|False|None|$)')
+# How far below the top of the bracket stack a closer may match; deeper mismatches are ignored
+_MAX_MISMATCH_DEPTH = 8
+
+
+class LLMParseError(ValueError):
+    """Raised when no usable JSON value can be recovered from model output."""
+
+
+# ==================== JSON LOCATION AND REPAIR ====================
+
+def scan_json_spans(text: str, kind: Optional[str] = None) -> Tuple[List[Tuple[int, int]], Optional[int]]:
+    """Find balanced JSON-looking values in one linear pass.
+
+    Returns the (start, end) spans of outermost balanced values of the
+    requested kind ("object", "array" or either), ordered by start, and the
+    start of the outermost value still open when the text ends (model output
+    that was cut off), if any. Brackets inside double-quoted strings are
+    ignored and a stray "{" in prose only leaves an unclosed opener behind,
+    so it can't hide a real value that follows it.
+    """
+    openers = "{" if kind == "object" else "[" if kind == "array" else "{["
+    stack: List[Tuple[str, int]] = []
+    spans: List[Tuple[int, int]] = []
+    pos = 0
+    while True:
+        match = _STRUCTURAL.search(text, pos)
+        if match is None:
+            break
+        ch, i = match.group(), match.start()
+        if ch == '"':
+            pos = _string_end(text, i + 1)
+            if pos == -1:
+                # Unterminated string: the output stops mid-value
+                break
+            continue
+        pos = i + 1
+        if ch in _CLOSERS:
+            stack.append((_CLOSERS[ch], i))
+            continue
+        for depth in range(len(stack) - 1, max(-1, len(stack) - 1 - _MAX_MISMATCH_DEPTH), -1):
+            if stack[depth][0] == ch:
+                start = stack[depth][1]
+                del stack[depth:]
+                if text[start] in openers:
+                    spans.append((start, i + 1))
+                break
+
+    # Spans close inner-first and never cross, so walking back from the last
+    # one, a span is nested exactly when an already-seen span starts earlier.
+    outermost = []
+    min_start = len(text)
+    for start, end in reversed(spans):
+        if start < min_start:
+            outermost.append((start, end))
+            min_start = start
+    outermost.reverse()
+    unclosed = next((start for _, start in stack if text[start] in openers and _looks_like_json(text, start)), None)
+    return outermost, unclosed
+
+
+def _looks_like_json(text: str, start: int) -> bool:
+    """True if the opener at `start` is followed by something a JSON value could contain, not prose."""
+    match = _VALUE_START.match(text, start + 1)
+    return match is not None
+
+
+def _string_end(text: str, pos: int) -> int:
+    """Return the index just past the closing quote of a string whose body starts at `pos`, or -1."""
+    while True:
+        quote = text.find('"', pos)
+        if quote == -1:
+            return -1
+        backslashes = 0
+        while text[quote - 1 - backslashes] == "\\":
+            backslashes += 1
+        if backslashes % 2 == 0:
+            return quote + 1
+        pos = quote + 1
+
+
+def _first_opener(text: str, openers: str) -> int:
+    starts = [i for i in (text.find(c) for c in openers) if i != -1]
+    return min(starts) if starts else -1
+
+
+def iter_json_values(text: str, kind: Optional[str] = None):
+    """Yield every JSON value that can be recovered from `text`, best candidates first.
+
+    After a fast path for well-formed output, each balanced span is tried
+    as-is, then after `repair_json`. Finally the
+    value left open at the end of the text is repaired and closed, on the
+    assumption that the model stopped mid-value.
+    """
+    # Fast path for well-formed output: from the first opener to the last
+    # matching closer. If that decodes, it is the first outermost value.
+    openers = "{" if kind == "object" else "[" if kind == "array" else "{["
+    start = _first_opener(text, openers)
+    if start == -1:
+        return
+    end = text.rfind(_CLOSERS[text[start]]) + 1
+    if end > start:
+        try:
+            yield json.loads(text[start:end])
+        except json.JSONDecodeError:
+            pass
+
+    spans, unclosed = scan_json_spans(text, kind)
+    for start, end in spans:
+        candidate = text[start:end]
+        try:
+            yield json.loads(candidate)
+            continue
+        except json.JSONDecodeError:
+            pass
+        try:
+            yield json.loads(repair_json(candidate))
+        except json.JSONDecodeError:
+            continue
+    if unclosed is not None:
+        try:
+            yield json.loads(repair_json(text[unclosed:]))
+        except json.JSONDecodeError:
+            pass
+
+
+def repair_json(text: str) -> str:
+    """Fix the defects models commonly put in JSON, in one string-aware pass.
+
+    Handles smart quotes used as delimiters (and escapes them inside strings),
+    single-quoted strings, trailing commas, // and /* */ comments, Python
+    literals (True/False/None), raw newlines inside strings, and output cut
+    off mid-value (open strings and brackets are closed).
+    """
+    text = text.replace("```json", "").replace("```", "")
+    out: List[str] = []
+    stack: List[str] = []
+    closer = None  # closing delimiter of the string we are in, if any
+    i = 0
+    n = len(text)
+    while i < n:
+        ch = text[i]
+        if closer is not None:
+            if ch == "\\" and i + 1 < n:
+                out.append(text[i:i + 2])
+                i += 2
+                continue
+            if ch == closer:
+                out.append('"')
+                closer = None
+            elif ch == '"' or ch in _SMART_DOUBLE or ch == "”":
+                out.append('\\"')
+            elif ch in _SMART_SINGLE:
+                out.append("'")
+            elif ch == "\n":
+                out.append("\\n")
+            else:
+                out.append(ch)
+            i += 1
+            continue
+
+        if ch == '"':
+            closer = '"'
+            out.append('"')
+        elif ch in _SMART_DOUBLE:
+            closer = _SMART_DOUBLE[ch]
+            out.append('"')
+        elif ch == "'" or ch in _SMART_SINGLE:
+            closer = "’" if ch in _SMART_SINGLE else "'"
+            out.append('"')
+        elif ch == "/" and text.startswith("//", i):
+            newline = text.find("\n", i)
+            i = n if newline == -1 else newline
+            continue
+        elif ch == "/" and text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            continue
+        elif ch in _CLOSERS:
+            stack.append(_CLOSERS[ch])
+            out.append(ch)
+        elif ch == "}" or ch == "]":
+            _drop_trailing_comma(out)
+            if stack and stack[-1] == ch:
+                stack.pop()
+            out.append(ch)
+        elif ch.isalpha():
+            j = i
+            while j < n and text[j].isalpha():
+                j += 1
+            word = text[i:j]
+            out.append(_LITERALS.get(word, word))
+            i = j
+            continue
+        else:
+            out.append(ch)
+        i += 1
+
+    # Output cut off mid-value: close what is still open
+    if closer is not None:
+        out.append('"')
+    while stack:
+        _drop_trailing_comma(out)
+        out.append(stack.pop())
+    return "".join(out)
+
+
+def _drop_trailing_comma(out: List[str]):
+    j = len(out) - 1
+    while j >= 0 and out[j].isspace():
+        j -= 1
+    if j >= 0 and out[j] == ",":
+        del out[j]
+
+
+def loads_lenient(text: str, kind: Optional[str] = None) -> Any:
+    """Return the first JSON value of the given kind recoverable from model output."""
+    for value in iter_json_values(text or "", kind):
+        return value
+    raise LLMParseError(f"No valid JSON {kind or 'value'} found in model output")
+
+
+# ==================== RESPONSE MODELS ====================
+
+def _coerce_score(value: Any) -> int:
+    if isinstance(value, str):
+        match = re.search(r"\d+(?:\.\d+)?", value)
+        if not match:
+            raise ValueError("score is not a number")
+        value = float(match.group(0))
+    return max(1, min(10, int(round(float(value)))))
+
+
+def _as_text(value: Any) -> str:
+    if isinstance(value, dict):
+        return next((str(v) for v in value.values() if isinstance(v, str)), "")
+    return str(value)
+
+
+class Correction(BaseModel):
+    original: str = ""
+    corrected: str = ""
+    explanation: str = ""
+
+
+class OralEvaluation(BaseModel):
+    """Evaluation returned for /api/oral-quiz/evaluate."""
+    score: int
+    feedback: str
+    corrections: List[Correction] = []
+    suggestions: List[str]
+    encouragement: str = "Great effort! Keep improving!"
+
+    @field_validator("score", mode="before")
+    @classmethod
+    def _score(cls, value):
+        return _coerce_score(value)
+
+    @field_validator("suggestions", mode="before")
+    @classmethod
+    def _suggestions(cls, value):
+        if isinstance(value, str):
+            value = [value]
+        return [_as_text(s) for s in value][:3]
+
+    @field_validator("corrections", mode="before")
+    @classmethod
+    def _corrections(cls, value):
+        return [c for c in (value or []) if isinstance(c, dict)]
+
+
+class EvaluatorEvaluation(BaseModel):
+    """Evaluation format requested by QuizEvaluator's system prompt."""
+    score: int
+    correction: Optional[str] = None
+    feedback: str
+    suggestions: List[str]
+    is_appropriate: bool = True
+
+    @field_validator("score", mode="before")
+    @classmethod
+    def _score(cls, value):
+        return _coerce_score(value)
+
+    @field_validator("suggestions", mode="before")
+    @classmethod
+    def _suggestions(cls, value):
+        if isinstance(value, str):
+            value = [value]
+        return [_as_text(s) for s in value][:3]
+
+
+class QuizQuestion(BaseModel):
+    """One generated quiz question."""
+    id: Optional[str] = None
+    type: Literal["multiple_choice", "oral"]
+    question: str
+    options: Optional[List[str]] = None
+    correct: Optional[str] = None
+    topic: Optional[str] = None
+
+    @field_validator("question")
+    @classmethod
+    def _question(cls, value):
+        value = value.strip()
+        if not value:
+            raise ValueError("question is empty")
+        return value
+
+    @model_validator(mode="after")
+    def _multiple_choice(self):
+        if self.type == "multiple_choice":
+            if not self.options or len(self.options) < 2:
+                raise ValueError("multiple choice question needs at least two options")
+            if self.correct not in self.options:
+                raise ValueError("correct answer is not one of the options")
+        return self
+
+
+# Validators are built once at import and reused for every parse
+ORAL_EVALUATION = TypeAdapter(OralEvaluation)
+EVALUATOR_EVALUATION = TypeAdapter(EvaluatorEvaluation)
+QUIZ_QUESTION = TypeAdapter(QuizQuestion)
+
+
+def parse_model(text: str, adapter: TypeAdapter) -> Any:
+    """Return the first JSON object in model output that validates against `adapter`."""
+    error = None
+    for value in iter_json_values(text or "", "object"):
+        try:
+            return adapter.validate_python(value)
+        except ValidationError as e:
+            error = e
+    if error is not None:
+        raise LLMParseError(f"Model output failed validation: {error.error_count()} errors") from error
+    raise LLMParseError("No valid JSON object found in model output")
+
+
+def parse_items(text: str, adapter: TypeAdapter) -> Tuple[List[Any], List[str]]:
+    """Validate each item of the first JSON array in model output that has any valid items.
+
+    Returns (valid items, error messages for rejected items), so one bad item
+    doesn't discard the rest, and a stray "[5]" in the preamble is skipped.
+    """
+    errors: List[str] = []
+    for value in iter_json_values(text or "", "array"):
+        valid, errors = [], []
+        for index, item in enumerate(value):
+            try:
+                valid.append(adapter.validate_python(item))
+            except ValidationError as e:
+                errors.append(f"item {index}: {e.errors()[0]['msg']}")
+        if valid:
+            return valid, errors
+    raise LLMParseError(f"No valid items found in model output ({len(errors)} rejected)")
+
+
+# ==================== PLAIN-TEXT FALLBACK ====================
+
+_SCORE_RE = re.compile(r"(?i)\bscore\b[^\d\n]{0,20}(10|[1-9])")
+_FEEDBACK_RE = re.compile(r"(?i)\b(?:feedback|comment)\b[\"']?\s*[:=-]?\s*[\"']?([^\n\"]+)")
+_BULLET_RE = re.compile(r"(?m)^\s*(?:[-•*]|\d+\.)\s+(\S[^\n]*)")
+
+
+def fallback_fields(text: str) -> Dict[str, Any]:
+    """Best-effort score/feedback/suggestions from prose when no JSON is usable.
+
+    All patterns are anchored on short literal prefixes with bounded gaps, so
+    they run in linear time on long outputs.
+    """
+    score = _SCORE_RE.search(text)
+    feedback = _FEEDBACK_RE.search(text)
+    return {
+        "score": int(score.group(1)) if score else None,
+        "feedback": feedback.group(1).strip() if feedback else None,
+        "suggestions": [s.strip() for s in _BULLET_RE.findall(text)][:3],
+    }
+
@@ -0,0 +1,185 @@
+# server/log_pipeline.py
+from typing import Any, Dict, Optional
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+import json
+import logging
+import os
+import queue
+import random
+
+from metrics import Counter
+
+# Attributes every LogRecord has; anything else came from `extra=` and is emitted as a field
+_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "truncated"}
+
+dropped = Counter()
+sampled_out = Counter()
+truncated = Counter()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, pid, message and any `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "pid": record.process,
+            "msg": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exc"] = record.exc_text
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class TruncateFilter(logging.Filter):
+    """Cap the rendered message length so one huge payload can't bloat the queue or file."""
+
+    def __init__(self, max_chars: int):
+        super().__init__()
+        self.max_chars = max_chars
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        message = record.getMessage()
+        if len(message) > self.max_chars:
+            truncated.inc()
+            record.msg = f"{message[:self.max_chars]}... [truncated {len(message) - self.max_chars} chars]"
+            record.args = None
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keep only a fraction of INFO-and-below records from configured high-volume loggers.
+
+    Rates are matched on the logger name or any parent (``talkbuddy.payloads``
+    also covers ``talkbuddy.payloads.chat``). WARNING and above always pass.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def _rate(self, name: str) -> float:
+        while name:
+            if name in self.rates:
+                return self.rates[name]
+            name = name.rpartition(".")[0]
+        return 1.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        sampled_out.inc()
+        return False
+
+
+_exc_formatter = logging.Formatter()
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Cheaper than the stock prepare(): no record copy and no full format on the caller's thread
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _exc_formatter.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped.inc()
+
+
+def parse_sample_rates(spec: str) -> Dict[str, float]:
+    """Parse "logger=rate,other.logger=rate" into a dict."""
+    rates = {}
+    for part in spec.split(","):
+        name, _, rate = part.strip().partition("=")
+        if name and rate:
+            rates[name.strip()] = max(0.0, min(1.0, float(rate)))
+    return rates
+
+
+def configure_logging(
+    level: str = "INFO",
+    log_file: Optional[str] = "talkbuddy.log",
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    max_message_chars: int = 2000,
+    sample_rates: Optional[Dict[str, float]] = None,
+    queue_size: int = 10000,
+) -> QueueListener:
+    """Route all logging through a bounded queue drained by a background thread.
+
+    The calling thread (usually the event loop) only filters, truncates and
+    enqueues; formatting, console output and writes to the size-rotated JSON
+    log file happen on the listener thread. Returns the started listener so
+    the caller can stop it (flushing the queue) on shutdown.
+    """
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize=queue_size)
+
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rates or {}))
+    queue_handler.addFilter(TruncateFilter(max_message_chars))
+
+    console = logging.StreamHandler()
+    console.setFormatter(logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+    handlers = [console]
+    if log_file:
+        file_handler = RotatingFileHandler(log_file, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8")
+        file_handler.setFormatter(JsonFormatter())
+        handlers.append(file_handler)
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
+
+
+def configure_logging_from_env(worker_count: int = 1) -> QueueListener:
+    """Configure logging from LOG_* environment variables.
+
+    With several worker processes each one writes its own `<name>.<pid>.log`
+    file, since size-based rotation of a shared file is not multi-process safe.
+    """
+    log_file = os.getenv("LOG_FILE", "talkbuddy.log") or None
+    if log_file and worker_count > 1:
+        base, ext = os.path.splitext(log_file)
+        log_file = f"{base}.{os.getpid()}{ext}"
+    return configure_logging(
+        level=os.getenv("LOG_LEVEL", "INFO").upper(),
+        log_file=log_file,
+        max_bytes=int(os.getenv("LOG_MAX_BYTES", str(10 * 1024 * 1024))),
+        backup_count=int(os.getenv("LOG_BACKUP_COUNT", "5")),
+        max_message_chars=int(os.getenv("LOG_MAX_MESSAGE_CHARS", "2000")),
+        sample_rates=parse_sample_rates(os.getenv("LOG_SAMPLE_RATES", "talkbuddy.payloads=0.1")),
+        queue_size=int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+    )
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "dropped": dropped.value,
+        "sampled_out": sampled_out.value,
+        "truncated": truncated.value,
+    }
+
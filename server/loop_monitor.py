@@ -0,0 +1,185 @@
+# server/loop_monitor.py
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+from metrics import Counter, Histogram, Samples
+
+logger = logging.getLogger(__name__)
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+LAG_BUCKETS_MS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+STACK_FRAMES = 25
+# Innermost frames of a loop that is idle, waiting for I/O, rather than blocked
+_IDLE_FRAMES = {("selectors.py", "select"), ("base_events.py", "_run_once")}
+
+
+class LoopMonitor:
+    """Measures event-loop lag and captures the stack of whatever is blocking the loop.
+
+    A task sleeps for `interval` seconds at a time; how late it wakes up is
+    the loop's lag. A watchdog thread checks every `interval / 2` seconds
+    whether the task is overdue by `threshold` seconds, and if so grabs the
+    loop thread's current stack: that is the code holding the loop. Stacks
+    are grouped by the innermost server frame and the innermost frame
+    overall; the `max_offenders` most recent groups are kept, and each is
+    logged at most once per `log_interval` seconds.
+    """
+
+    def __init__(self, interval: float = 0.1, threshold: float = 0.1, log_interval: float = 60.0,
+                 max_offenders: int = 50):
+        self.interval = interval
+        self.threshold = threshold
+        self.log_interval = log_interval
+        self.max_offenders = max_offenders
+        self.lag_ms = Samples()
+        self.lag_histogram = Histogram(LAG_BUCKETS_MS)
+        self.stalls = Counter()
+        self.captures = Counter()
+        self.logged = Counter()
+        self.log_suppressed = Counter()
+        self._offenders: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_tick = time.monotonic()
+        self._stall_key: Optional[Tuple[str, str]] = None
+        self._captured = False
+        self._loop_thread: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls) -> "LoopMonitor":
+        return cls(
+            interval=float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100")) / 1000,
+            threshold=float(os.getenv("LOOP_LAG_THRESHOLD_MS", "100")) / 1000,
+            log_interval=float(os.getenv("LOOP_LAG_LOG_INTERVAL_SECONDS", "60")),
+        )
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self):
+        """Start measuring the running loop; call from a coroutine on it."""
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._last_tick = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._tick())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._watchdog.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _tick(self):
+        while True:
+            started = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            lag = max(0.0, now - started - self.interval)
+            with self._lock:
+                self._last_tick = now
+                key, self._stall_key, self._captured = self._stall_key, None, False
+            self.lag_ms.observe(lag * 1000)
+            self.lag_histogram.observe(lag * 1000)
+            if lag >= self.threshold:
+                self.stalls.inc()
+                if key is not None:
+                    with self._lock:
+                        offender = self._offenders.get(key)
+                        if offender is not None:
+                            offender["total_lag_ms"] += lag * 1000
+                            offender["max_lag_ms"] = max(offender["max_lag_ms"], round(lag * 1000, 1))
+
+    def _watch(self):
+        while not self._stop.wait(self.interval / 2):
+            with self._lock:
+                overdue = time.monotonic() - self._last_tick - self.interval
+                if overdue < self.threshold or self._captured:
+                    continue
+                self._captured = True
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)[-STACK_FRAMES:]
+            del frame
+            innermost = stack[-1] if stack else None
+            if innermost is None or (os.path.basename(innermost.filename), innermost.name) in _IDLE_FRAMES:
+                continue
+            self._record(stack, overdue)
+
+    @staticmethod
+    def _where(entry: traceback.FrameSummary) -> str:
+        if entry.filename.startswith(SERVER_DIR):
+            path = os.path.relpath(entry.filename, SERVER_DIR)
+        else:
+            path = os.path.basename(entry.filename)
+        return f"{path}:{entry.lineno} in {entry.name}"
+
+    def _record(self, stack: traceback.StackSummary, overdue: float):
+        own = next((entry for entry in reversed(stack) if entry.filename.startswith(SERVER_DIR)), stack[-1])
+        key = (self._where(own), self._where(stack[-1]))
+        now = time.time()
+        self.captures.inc()
+        with self._lock:
+            self._stall_key = key
+            offender = self._offenders.get(key)
+            if offender is None:
+                offender = {"where": key[0], "innermost": key[1], "count": 0, "total_lag_ms": 0.0, "max_lag_ms": 0.0,
+                            "first_seen": now, "last_logged": 0.0, "suppressed": 0}
+                self._offenders[key] = offender
+            offender["count"] += 1
+            offender["last_seen"] = now
+            offender["stack"] = [f"{self._where(entry)}: {entry.line}" for entry in stack]
+            self._offenders.move_to_end(key)
+            while len(self._offenders) > self.max_offenders:
+                self._offenders.popitem(last=False)
+            should_log = now - offender["last_logged"] >= self.log_interval
+            if should_log:
+                offender["last_logged"], suppressed, offender["suppressed"] = now, offender["suppressed"], 0
+            else:
+                offender["suppressed"] += 1
+        if not should_log:
+            self.log_suppressed.inc()
+            return
+        self.logged.inc()
+        logger.warning(
+            f"Event loop blocked for over {overdue * 1000:.0f} ms in {key[0]}"
+            f"{f' ({suppressed} more since last logged)' if suppressed else ''}:\n"
+            + "".join(traceback.format_list(stack))
+        )
+
+    def offenders(self, limit: int = 20) -> List[Dict[str, Any]]:
+        """The blocking call sites seen most recently, newest first, with their last captured stack."""
+        with self._lock:
+            items = [dict(offender) for offender in reversed(self._offenders.values())][:limit]
+        for offender in items:
+            offender["total_lag_ms"] = round(offender["total_lag_ms"], 1)
+            offender.pop("last_logged")
+        return items
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "lag_ms": self.lag_ms.summary(),
+            "lag_histogram_ms": self.lag_histogram.summary(),
+            "stalls": self.stalls.value,
+            "captures": self.captures.value,
+            "logged": self.logged.value,
+            "log_suppressed": self.log_suppressed.value,
+            "offenders": len(self._offenders),
+        }
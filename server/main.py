@@ -4,94 +4,305 @@ from dotenv import load_dotenv
 # Load environment variables from .env file
 load_dotenv()
 
-from fastapi import FastAPI, HTTPException, Request, Depends, status
+from fastapi import FastAPI, HTTPException, Request, Depends, Header, Query, Response, status
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional, Literal
-from langchain_ollama import ChatOllama
-from fastapi.responses import JSONResponse
-from langchain_core.messages import HumanMessage, SystemMessage
+from pydantic import BaseModel, ConfigDict, Field, RootModel
+from typing import List, Dict, Any, Optional, Literal, Set
+from fastapi.responses import ORJSONResponse, StreamingResponse
 import json
 import logging
 import asyncio
 import time
-import aiohttp
+import random
+import threading
 from functools import lru_cache
-import re
 import os
-from google.cloud.firestore import Client as FirestoreClient
-from datetime import datetime
-from google.oauth2 import service_account
+from datetime import datetime, timezone
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
-import firebase_admin
-from firebase_admin import credentials
-
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(),
-        logging.FileHandler('talkbuddy.log')
-    ]
-)
+import metrics
+from single_flight import SingleFlight, canonical_key
+from idempotency import IdempotencyStore
+from fair_share import FairShareScheduler, token_usage
+from question_bank import QUESTION_TYPES, QuestionBank
+import quiz_slots
+from micro_batch import MicroBatcher, split_result
+from reply_cache import ReplyCache
+from model_router import ModelTagMiddleware, model_router
+import model_warmup
+import pre_evaluation
+from shared_store import shared_store
+from job_queue import JobRunner, JobType, PermanentJobError, job_queue
+from circuit_breaker import CircuitBreaker
+from loop_monitor import LoopMonitor
+from token_ledger import GROUP_COLUMNS, LedgerEndpointMiddleware, current_scope, token_ledger
+import deadlines
+from deadlines import DeadlineExceeded, DeadlineMiddleware
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from compression import CompressionMiddleware
+import compression
+from firestore_loader import FirestoreLoaderMiddleware, get_loader, load_document
+import firestore_loader
+from export_stream import EXPORTS, FORMATS, stream_export
+import export_stream
+from pagination import decode_cursor, encode_cursor, etag_matches, snapshot_etag
+import progress_summary
+import transcript_store
+import generation_profiles
+from llm_parsing import LLMParseError, ORAL_EVALUATION, QUIZ_QUESTION, parse_items, parse_model
+
+import log_pipeline
+
+# Number of worker processes serving this app (set by the production launcher)
+WORKER_COUNT = max(1, int(os.getenv("TALKBUDDY_WORKERS", "1")))
+
+# Configure logging: records are queued and written by a background thread
+log_listener = log_pipeline.configure_logging_from_env(WORKER_COUNT)
 logger = logging.getLogger(__name__)
+# Full user messages and model replies; sampled and truncated (see LOG_SAMPLE_RATES)
+payload_logger = logging.getLogger("talkbuddy.payloads")
 
-# Initialize Firestore
+# Firestore and Firebase Admin clients; created by init_clients() in the lifespan, not at import,
+# so importing this module stays fast and works without credentials
 db_firestore = None
-try:
-    import json
-    
-    # Get Firebase credentials from environment variable (JSON string)
-    firebase_creds_json = os.getenv("FIREBASE_CREDENTIAL_JSON")
-    
-    if not firebase_creds_json:
-        raise ValueError("FIREBASE_CREDENTIAL_JSON environment variable is not set")
-    
-    # Parse credentials from environment variable
-    service_account_info = json.loads(firebase_creds_json)
-    project_id = service_account_info.get('project_id')
-    
-    logger.info("Firebase credentials loaded from FIREBASE_CREDENTIAL_JSON environment variable")
-    
-    # Create credentials
-    from google.oauth2 import service_account
-    from google.cloud import firestore
-    
-    credentials = service_account.Credentials.from_service_account_info(
-        service_account_info,
-        scopes=["https://www.googleapis.com/auth/cloud-platform"]
-    )
-    db_firestore = firestore.Client(credentials=credentials, project=project_id)
-    logger.info(f"Firestore initialized successfully for project {project_id}")
+firebase_admin_app = None
+
+
+def init_clients():
+    """Create the Firestore client and Firebase Admin app from FIREBASE_CREDENTIAL_JSON (blocking; run in a thread)."""
+    global db_firestore, firebase_admin_app
+    service_account_info = None
+    try:
+        # Get Firebase credentials from environment variable (JSON string)
+        firebase_creds_json = os.getenv("FIREBASE_CREDENTIAL_JSON")
+        
+        if not firebase_creds_json:
+            raise ValueError("FIREBASE_CREDENTIAL_JSON environment variable is not set")
+        
+        # Parse credentials from environment variable
+        service_account_info = json.loads(firebase_creds_json)
+        project_id = service_account_info.get('project_id')
         
-except Exception as e:
-    logger.error(f"Failed to initialize Firestore: {e}")
-    db_firestore = None
+        logger.info("Firebase credentials loaded from FIREBASE_CREDENTIAL_JSON environment variable")
+        
+        # Create credentials
+        from google.oauth2 import service_account
+        from google.cloud import firestore
+        
+        credentials = service_account.Credentials.from_service_account_info(
+            service_account_info,
+            scopes=["https://www.googleapis.com/auth/cloud-platform"]
+        )
+        db_firestore = firestore.Client(credentials=credentials, project=project_id)
+        logger.info(f"Firestore initialized successfully for project {project_id}")
+            
+    except Exception as e:
+        logger.error(f"Failed to initialize Firestore: {e}")
+        db_firestore = None
+
+    # Initialize Firebase Admin SDK
+    try:
+        import firebase_admin
+
+        if not firebase_admin._apps:
+            # Use the credentials dict to initialize Firebase Admin SDK
+            from firebase_admin import credentials as fb_credentials
+            cred = fb_credentials.Certificate(service_account_info)
+            firebase_admin_app = firebase_admin.initialize_app(cred)
+            logger.info("Firebase Admin SDK initialized successfully")
+        else:
+            # Use the existing app if already initialized
+            firebase_admin_app = list(firebase_admin._apps.values())[0]
+            logger.info("Firebase Admin SDK already initialized")
+    except Exception as e:
+        logger.error(f"Failed to initialize Firebase Admin SDK: {e}")
+        firebase_admin_app = None
+
+DRAIN_TIMEOUT_SECONDS = float(os.getenv("DRAIN_TIMEOUT_SECONDS", "60"))
+# After SIGTERM a worker keeps serving this long with /ready at 503, so load balancers stop sending it traffic
+DRAIN_READY_GRACE_SECONDS = float(os.getenv("DRAIN_READY_GRACE_SECONDS", "5"))
+
+# Readiness of this worker process, reported by /ready
+worker_state = {"ready": False, "draining": False, "started_at": None}
+inflight_llm_calls = 0
+
+
+async def wait_for_llm_drain(timeout: float) -> bool:
+    """Wait until no LLM call is running in this worker. Returns False on timeout."""
+    deadline = time.monotonic() + timeout
+    while inflight_llm_calls > 0:
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.1)
+    return True
+
+
+def install_drain_signal_hook():
+    """Flip this worker to draining as soon as uvicorn receives SIGTERM/SIGINT.
+
+    uvicorn stops accepting connections the moment it handles the signal
+    and only runs lifespan shutdown once they are gone, which is too late
+    for /ready to tell anyone. The hook marks the worker not ready right
+    away and delays uvicorn's own handling by DRAIN_READY_GRACE_SECONDS;
+    a second signal exits without waiting. Installed at import because
+    production workers are spawned processes that import this module.
+    """
+    try:
+        from uvicorn.server import Server
+    except ImportError:
+        return
+    handle_exit = Server.handle_exit
+    if getattr(handle_exit, "drain_hook", False):
+        return
+
+    def handle_exit_after_grace(server, sig, frame):
+        already_draining = worker_state["draining"]
+        worker_state["ready"] = False
+        worker_state["draining"] = True
+        if already_draining or DRAIN_READY_GRACE_SECONDS <= 0:
+            handle_exit(server, sig, frame)
+            return
+        # Nothing that takes locks (such as logging) runs in the signal handler itself; uvicorn's
+        # handler only sets flags its main loop polls, so calling it from a timer thread is safe
+        def exit_after_grace():
+            logger.info(f"Worker {os.getpid()} reported not ready for {DRAIN_READY_GRACE_SECONDS:.0f}s, "
+                        f"now closing connections")
+            handle_exit(server, sig, frame)
+
+        timer = threading.Timer(DRAIN_READY_GRACE_SECONDS, exit_after_grace)
+        timer.daemon = True
+        timer.start()
+
+    handle_exit_after_grace.drain_hook = True
+    Server.handle_exit = handle_exit_after_grace
+
+
+install_drain_signal_hook()
+
+
+SHARED_STORE_PURGE_INTERVAL_SECONDS = float(os.getenv("SHARED_STORE_PURGE_INTERVAL_SECONDS", "600"))
+
+
+async def worker_heartbeat():
+    """Advertise this worker as ready in the shared store until it shuts down, and purge expired entries."""
+    while True:
+        try:
+            await asyncio.to_thread(shared_store.set, f"worker:{os.getpid()}", {
+                "pid": os.getpid(),
+                "ready": worker_state["ready"],
+                "started_at": worker_state["started_at"],
+                "inflight_llm_calls": inflight_llm_calls
+            }, 30)
+        except Exception as e:
+            logger.warning(f"Worker heartbeat failed: {e}")
+        try:
+            removed = await asyncio.to_thread(shared_store.purge_if_due, SHARED_STORE_PURGE_INTERVAL_SECONDS)
+            if removed:
+                logger.info(f"Purged {removed} expired shared store entries")
+        except Exception as e:
+            logger.warning(f"Shared store purge failed: {e}")
+        await asyncio.sleep(10)
+
+
+TRANSCRIPT_ARCHIVE_INTERVAL_SECONDS = int(os.getenv("TRANSCRIPT_ARCHIVE_INTERVAL_SECONDS", "21600"))
+
+
+async def transcript_archiver():
+    """Periodically move old session transcripts into archive blobs; one worker runs each round."""
+    while True:
+        await asyncio.sleep(TRANSCRIPT_ARCHIVE_INTERVAL_SECONDS)
+        if not db_firestore or not await asyncio.to_thread(
+            shared_store.add, "transcript_archive:lock", os.getpid(), TRANSCRIPT_ARCHIVE_INTERVAL_SECONDS
+        ):
+            continue
+        try:
+            # Where the last round got to, so each round only reads sessions that aged past the cutoff since
+            since = await asyncio.to_thread(shared_store.get, "transcript_archive:watermark")
+            _, watermark = await asyncio.to_thread(
+                transcript_store.archive_old_sessions, db_firestore,
+                datetime.fromtimestamp(since, timezone.utc) if since is not None else None
+            )
+            if watermark is not None:
+                await asyncio.to_thread(shared_store.set, "transcript_archive:watermark", watermark.timestamp())
+        except Exception as e:
+            logger.warning(f"Transcript archival failed: {e}")
+
+
+WARMUP_ON_START = os.getenv("LLM_WARMUP_ON_START", "true").lower() not in ("0", "false", "no")
+
+
+async def model_keep_alive():
+    """Keep every configured model loaded while the keep-warm schedule is active; one worker pings each round."""
+    interval = model_warmup.KEEPALIVE_INTERVAL_SECONDS
+    was_active = None
+    while True:
+        await asyncio.sleep(interval)
+        active = model_warmup.schedule.active()
+        if await asyncio.to_thread(shared_store.add, "model_keepalive:lock", os.getpid(), interval / 2):
+            try:
+                await model_warmup.keep_alive_round(generation_profiles.configured_models(), active, was_active)
+            except Exception as e:
+                logger.warning(f"Model keep-alive round failed: {e}")
+        if active != was_active and was_active is not None:
+            logger.info(f"Keep-warm schedule {'started' if active else 'ended'}")
+        was_active = active
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    worker_state["started_at"] = time.time()
+    generation_profiles.check_prompt_budgets(prompt_budget_samples())
+    # Load models before reporting ready, so the first chat after a deploy doesn't pay the load time;
+    # the Firebase clients are created in a thread meanwhile
+    startup = [asyncio.to_thread(init_clients)]
+    if WARMUP_ON_START:
+        startup.append(model_warmup.warm_up(generation_profiles.configured_models()))
+    results = await asyncio.gather(*startup)
+    if WARMUP_ON_START:
+        # A fallback that won't load (usually not pulled) would fail every call routed to it
+        fallbacks = {p.fallback_model for p in generation_profiles.PROFILES.values() if p.fallback_model}
+        for model, loaded in results[1].items():
+            if model in fallbacks and not loaded:
+                generation_profiles.disable_fallback(model)
+    worker_state["ready"] = True
+    heartbeat = asyncio.create_task(worker_heartbeat())
+    keep_alive = asyncio.create_task(model_keep_alive()) if model_warmup.KEEPALIVE_INTERVAL_SECONDS > 0 else None
+    archiver = asyncio.create_task(transcript_archiver()) if TRANSCRIPT_ARCHIVE_INTERVAL_SECONDS > 0 else None
+    job_runner.start()
+    if LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+    token_ledger.start()
+    logger.info(f"Worker {os.getpid()} ready")
+    try:
+        yield
+    finally:
+        # Already set on SIGTERM (install_drain_signal_hook); by now uvicorn has closed the connections, so
+        # this only waits for LLM calls not tied to a request, such as queued jobs
+        worker_state["ready"] = False
+        worker_state["draining"] = True
+        if not await wait_for_llm_drain(DRAIN_TIMEOUT_SECONDS):
+            logger.warning(f"Worker {os.getpid()} shutting down with {inflight_llm_calls} LLM calls still running")
+        heartbeat.cancel()
+        if keep_alive is not None:
+            keep_alive.cancel()
+        await job_runner.stop()
+        await token_ledger.stop()
+        if archiver is not None:
+            archiver.cancel()
+        loop_monitor.stop()
+        shared_store.delete(f"worker:{os.getpid()}")
+        logger.info(f"Worker {os.getpid()} drained and stopped")
+        log_listener.stop()
 
-# Initialize Firebase Admin SDK
-firebase_admin_app = None
-try:
-    if not firebase_admin._apps:
-        # Use the credentials dict to initialize Firebase Admin SDK
-        from firebase_admin import credentials as fb_credentials
-        cred = fb_credentials.Certificate(service_account_info)
-        firebase_admin_app = firebase_admin.initialize_app(cred)
-        logger.info("Firebase Admin SDK initialized successfully")
-    else:
-        # Use the existing app if already initialized
-        firebase_admin_app = list(firebase_admin._apps.values())[0]
-        logger.info("Firebase Admin SDK already initialized")
-except Exception as e:
-    logger.error(f"Failed to initialize Firebase Admin SDK: {e}")
-    firebase_admin_app = None
 
 app = FastAPI(
     title="TalkBuddy AI API",
     description="API for English language learning with voice interaction",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # CORS Middleware
@@ -102,6 +313,85 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Compress JSON responses above the threshold with zstd or gzip, per Accept-Encoding
+app.add_middleware(CompressionMiddleware, minimum_size=int(os.getenv("COMPRESSION_MIN_BYTES", "1024")))
+# Per-request batched and memoized Firestore document reads
+app.add_middleware(FirestoreLoaderMiddleware, db_getter=lambda: db_firestore)
+# Name the LLM models a request used in an X-LLM-Model header
+app.add_middleware(ModelTagMiddleware)
+# One deadline per request, by endpoint class, that retries, Firestore reads and LLM calls draw from
+app.add_middleware(DeadlineMiddleware)
+metrics.register("deadlines", deadlines.stats)
+# Tag each LLM call in the token ledger with the route it was made for
+app.add_middleware(LedgerEndpointMiddleware)
+metrics.register("token_ledger", token_ledger.stats)
+
+# Event-loop lag, with the stack of whatever blocks the loop past LOOP_LAG_THRESHOLD_MS
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() not in ("0", "false", "no")
+# /admin/loop-offenders exposes stack traces, so it has to be switched on as well as behind the admin token
+LOOP_OFFENDERS_ENDPOINT = os.getenv("LOOP_OFFENDERS_ENDPOINT", "false").lower() in ("1", "true", "yes")
+loop_monitor = LoopMonitor.from_env()
+metrics.register("loop_lag", loop_monitor.stats)
+
+# Identical LLM-backed requests that arrive while one is already running share its result
+llm_single_flight = SingleFlight("llm")
+metrics.register("single_flight", llm_single_flight.stats)
+
+# Completed POST responses keyed by the client's Idempotency-Key header
+idempotency_store = IdempotencyStore(shared_store, ttl_seconds=int(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400")))
+metrics.register("idempotency", idempotency_store.stats)
+
+# Per-user quotas and weighted fair queuing in front of the model. LLM_MAX_CONCURRENCY is
+# the total across workers, so each worker gets its share of the slots; with more workers
+# than slots each gets one and also takes a host-wide slot from the shared store.
+LLM_MAX_CONCURRENCY = max(1, int(os.getenv("LLM_MAX_CONCURRENCY", "2")))
+llm_scheduler = FairShareScheduler(
+    shared_store,
+    max_concurrency=max(1, LLM_MAX_CONCURRENCY // WORKER_COUNT),
+    max_throttle_wait=float(os.getenv("QUOTA_MAX_THROTTLE_WAIT_SECONDS", "30")),
+    host_concurrency=LLM_MAX_CONCURRENCY if WORKER_COUNT > LLM_MAX_CONCURRENCY else None
+)
+metrics.register("fair_share", llm_scheduler.stats, blocking=True)
+
+# Generated questions are deduplicated into a bank and reused across quizzes
+QUIZ_MC_COUNT = 3
+QUIZ_ORAL_COUNT = 5
+QUIZ_FRESH_QUESTIONS = int(os.getenv("QUIZ_FRESH_QUESTIONS", "2"))
+# "per_question" generates each fresh slot separately and in parallel; "batch" asks for them in one prompt
+QUIZ_GENERATION_MODE = os.getenv("QUIZ_GENERATION_MODE", "per_question")
+question_bank = QuestionBank(
+    lambda: db_firestore,
+    duplicate_threshold=float(os.getenv("QUESTION_BANK_DUPLICATE_THRESHOLD", "0.7"))
+)
+metrics.register("question_bank", question_bank.stats)
+
+# Replies to short, common voice chat utterances, reused for exact and near-duplicate messages
+reply_cache = ReplyCache.from_env()
+metrics.register("reply_cache", reply_cache.stats)
+
+# Shared across workers: after repeated Ollama failures every worker fails fast for a while
+ollama_breaker = CircuitBreaker(
+    shared_store, "ollama",
+    failure_threshold=int(os.getenv("OLLAMA_BREAKER_FAILURES", "5")),
+    reset_timeout=float(os.getenv("OLLAMA_BREAKER_RESET_SECONDS", "30"))
+)
+metrics.register("ollama_breaker", ollama_breaker.stats, blocking=True)
+metrics.register("shared_store", shared_store.stats, blocking=True)
+metrics.register("logging", log_pipeline.stats)
+metrics.register("compression", compression.stats)
+metrics.register("firestore_round_trips", firestore_loader.stats)
+metrics.register("export", export_stream.stats)
+metrics.register("progress_summary", progress_summary.stats)
+metrics.register("transcripts", transcript_store.stats)
+metrics.register("generation_profiles", generation_profiles.stats)
+metrics.register("model_routing", model_router.stats)
+metrics.register("model_warmup", model_warmup.stats)
+metrics.register("pre_evaluation", pre_evaluation.stats)
+metrics.register("quiz_slots", quiz_slots.stats)
+
+# Durable background jobs (emails, account deletion, summary rebuilds); types are registered in the JOBS section
+job_runner = JobRunner(job_queue, poll_interval=float(os.getenv("JOB_POLL_INTERVAL_SECONDS", "1")))
+metrics.register("jobs", job_runner.stats, blocking=True)
 # VOICE_CHAT_PROMPT = """
 # You are TalkBuddy, a friendly and encouraging English tutor.
 # Your responses must always be short, natural, and conversational (2–3 sentences maximum).
@@ -236,6 +526,7 @@ class ChatMessage(BaseModel):
 class ChatRequest(BaseModel):
     messages: List[ChatMessage]
     user_name: Optional[str] = None
+    user_id: Optional[str] = None
 
 class QuizEvaluationRequest(BaseModel):
     userId: str
@@ -251,6 +542,252 @@ class HealthCheckResponse(BaseModel):
 class GenerateAssessmentRequest(BaseModel):
     user_id: str
 
+class VoiceChatResponse(BaseModel):
+    reply: str
+    audio_text: str
+    model: Optional[str] = None
+
+class OralEvaluationResponse(BaseModel):
+    score: int
+    feedback: str
+    corrections: List[Any] = []
+    suggestions: List[Any] = []
+    encouragement: Optional[str] = None
+    model: Optional[str] = None
+
+class GenerateAssessmentResponse(BaseModel):
+    success: bool
+    quiz_id: str
+    questions: List[Dict[str, Any]]
+    assessment_level: str
+    created_at: str
+
+class QuizSubmissionResponse(BaseModel):
+    success: bool
+    promoted: bool
+    new_level: str
+    percentage: float
+
+class EmailSentResponse(BaseModel):
+    success: bool
+    message: str
+    job_id: Optional[str] = None
+
+class EndpointStatusResponse(BaseModel):
+    message: str
+    status: str
+
+class AccountDeletionResponse(BaseModel):
+    success: bool
+    message: str
+    userId: str
+    job_id: Optional[str] = None
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    type: str
+    status: Literal["queued", "running", "succeeded", "failed"]
+    attempts: int
+    max_attempts: int
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    error: Optional[str] = None
+
+class ReadinessResponse(BaseModel):
+    worker_pid: int
+    ready: bool
+    draining: bool
+    started_at: Optional[float]
+    inflight_llm_calls: int
+    firestore: bool
+    workers: List[Dict[str, Any]]
+
+class UserUsageResponse(BaseModel):
+    user_id: str
+    role: str
+    limits: Dict[str, float]
+    quota_remaining_seconds: float
+    requests: int
+    llm_seconds: float
+    prompt_tokens: int
+    completion_tokens: int
+    throttled_seconds: float
+    rejected: int
+    last_used: Optional[float]
+
+class UsageOverviewResponse(BaseModel):
+    scheduler: Dict[str, Any]
+    users: List[UserUsageResponse]
+
+class TokenTotals(BaseModel):
+    calls: int
+    prompt_tokens: int
+    completion_tokens: int
+    llm_seconds: float
+
+class TokenUsageGroup(TokenTotals):
+    # The grouping column (user_id, endpoint, profile or model) and its value
+    model_config = ConfigDict(extra="allow")
+
+class TokenUsageHour(TokenTotals):
+    hour: int
+
+class TokenUsageResponse(BaseModel):
+    since: float
+    group_by: str
+    top: List[TokenUsageGroup]
+    trend: List[TokenUsageHour]
+
+class LoopOffender(BaseModel):
+    where: str
+    innermost: str
+    count: int
+    total_lag_ms: float
+    max_lag_ms: float
+    first_seen: float
+    last_seen: float
+    suppressed: int
+    stack: List[str]
+
+class MetricsResponse(RootModel[Dict[str, Dict[str, Any]]]):
+    """Each registered provider's stats under its name."""
+
+class SessionSummary(BaseModel):
+    id: str
+    title: Optional[str] = None
+    status: Optional[str] = None
+    created_at: Optional[datetime] = None
+    ended_at: Optional[datetime] = None
+    message_count: int = 0
+    preview: str = ""
+    has_summary: bool = False
+
+class SessionPageResponse(BaseModel):
+    items: List[SessionSummary]
+    next_cursor: Optional[str] = None
+
+class QuizSummary(BaseModel):
+    id: str
+    assessment_level: Optional[str] = None
+    created_at: Optional[datetime] = None
+    attempted: bool = False
+    attempted_at: Optional[datetime] = None
+    total_questions: int = 0
+    mc_questions: int = 0
+    oral_questions: int = 0
+    total_score: Optional[float] = None
+    percentage: Optional[float] = None
+
+class QuizPageResponse(BaseModel):
+    items: List[QuizSummary]
+    next_cursor: Optional[str] = None
+
+class TranscriptTurn(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    role: str
+    content: str = ""
+    timestamp: Optional[Any] = None
+    audioUrl: Optional[str] = None
+
+class SessionDetailResponse(BaseModel):
+    # Session documents carry other fields too (transcript metadata, legacy fields); they are passed through
+    model_config = ConfigDict(extra="allow")
+    id: str
+    userId: Optional[str] = None
+    title: Optional[str] = None
+    status: Optional[str] = None
+    createdAt: Optional[datetime] = None
+    endedAt: Optional[datetime] = None
+    summary: Optional[Dict[str, Any]] = None
+    messageCount: int = 0
+    preview: Optional[str] = None
+    messages: List[TranscriptTurn]
+    total_turns: int
+    next_turn: Optional[int] = None
+
+class TranscriptPageResponse(BaseModel):
+    messages: List[TranscriptTurn]
+    total_turns: int
+    next_offset: Optional[int] = None
+
+class QuizDetailResponse(BaseModel):
+    model_config = ConfigDict(extra="allow")
+    id: str
+    quiz_id: Optional[str] = None
+    user_id: Optional[str] = None
+    assessment_level: Optional[str] = None
+    questions: List[Dict[str, Any]] = []
+    created_at: Optional[datetime] = None
+    attempted: bool = False
+    attempted_at: Optional[datetime] = None
+    total_questions: int = 0
+    mc_questions: int = 0
+    oral_questions: int = 0
+    responses: Optional[List[Dict[str, Any]]] = None
+    scores: Optional[List[Dict[str, Any]]] = None
+    total_score: Optional[float] = None
+    percentage: Optional[float] = None
+
+class QuizLevelProgress(BaseModel):
+    count: int
+    percentage_total: float
+    average: float
+
+class RecentSession(BaseModel):
+    id: str
+    created_at: Optional[datetime] = None
+    minutes: float
+    correction_count: int
+    feedback: Optional[str] = None
+    tip: Optional[str] = None
+
+class RecentQuiz(BaseModel):
+    id: str
+    level: str
+    attempted_at: Optional[datetime] = None
+    percentage: float
+    oral_percentage: float
+
+class ProgressResponse(BaseModel):
+    version: int
+    session_count: int
+    minutes_practiced: float
+    quiz_count: int
+    quiz_levels: Dict[str, QuizLevelProgress]
+    current_streak: int
+    longest_streak: int
+    last_active_date: Optional[str] = None
+    recent_sessions: List[RecentSession]
+    recent_quizzes: List[RecentQuiz]
+    updated_at: Optional[datetime] = None
+
+class SessionTurnsResponse(BaseModel):
+    success: bool
+    session_id: str
+    turns: int
+
+class SessionCompletionResponse(BaseModel):
+    success: bool
+    session_id: str
+
+class JobAcceptedResponse(BaseModel):
+    job_id: str
+    status_url: str
+
+class SessionTurnsRequest(BaseModel):
+    user_id: str
+    # Position of turns[0] in the transcript, so a retried append isn't stored twice
+    first_turn: int = Field(ge=0)
+    turns: List[Dict[str, Any]] = Field(max_length=100)
+
+class SessionCompletionRequest(BaseModel):
+    user_id: str
+    title: Optional[str] = None
+    summary: Dict[str, Any]
+    # Only sent by clients from before turns were appended during the session
+    messages: Optional[List[Dict[str, Any]]] = None
+
 class QuizSubmissionRequest(BaseModel):
     user_id: str
     quiz_id: str
@@ -262,7 +799,7 @@ class QuizSubmissionRequest(BaseModel):
 # Service to manage Ollama connections
 class OllamaService:
     _instance = None
-    _model = None
+    _models: Dict[Any, Any] = {}
     _last_error = None
     _retry_after = 0
 
@@ -274,32 +811,241 @@ class OllamaService:
 
     @classmethod
     def _initialize_model(cls):
+        """Create chat models for each generation profile's primary and fallback model."""
         try:
-            cls._model = ChatOllama(
-                model="llama3.1",
-                temperature=0.7,
-                num_ctx=2048,
-                timeout=120
-            )
+            cls._models = {
+                (name, model): profile.chat_model(model)
+                for name, profile in generation_profiles.PROFILES.items()
+                for model in filter(None, (profile.model, profile.fallback_model))
+            }
             cls._last_error = None
-            logger.info("Ollama model initialized successfully")
+            logger.info(f"Ollama models initialized for profiles: {', '.join(generation_profiles.PROFILES)}")
         except Exception as e:
-            cls._model = None
+            cls._models = {}
             cls._last_error = str(e)
             logger.error(f"Failed to initialize Ollama model: {e}")
 
     @classmethod
-    async def get_model(cls):
-        if cls._model is None or (cls._last_error and time.time() > cls._retry_after):
+    async def get_model(cls, profile: str, model: Optional[str] = None):
+        # Reads the shared store at most once per refresh interval, but that read can wait on another worker's lock
+        if await asyncio.to_thread(ollama_breaker.is_open):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="AI service is currently unavailable. Please try again later."
+            )
+
+        if not cls._models or (cls._last_error and time.time() > cls._retry_after):
             cls._initialize_model()
         
-        if cls._model is None:
+        key = (profile, model or generation_profiles.get_profile(profile).model)
+        if key not in cls._models:
             raise HTTPException(
                 status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
                 detail="AI service is currently unavailable. Please try again later."
             )
         
-        return cls._model
+        return cls._models[key]
+
+
+async def llm_generate(profile: str, messages: List[List[Any]]):
+    """Run a generation with a task's profile through the fair-share scheduler and charge it to the caller.
+
+    The model is picked by the router when the call is queued: the profile's primary, or its
+    fallback while the primary is slow or the scheduler queue is saturated. Queueing and
+    generation are bounded by the request's deadline, and a generation still running after
+    the model's p95 is hedged with a duplicate if a scheduler slot is idle.
+    """
+    return await deadlines.bounded(_generate(profile, messages), "llm")
+
+
+# Uid from the Firebase ID token of the current request, set by `identify_caller`; None when anonymous
+current_caller: ContextVar[Optional[str]] = ContextVar("current_caller", default=None)
+
+
+async def decode_id_token(authorization: Optional[str]) -> str:
+    """Return the uid from the Firebase ID token in `Authorization: Bearer <token>`, or raise 401."""
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        raise HTTPException(status_code=401, detail="Missing ID token", headers={"WWW-Authenticate": "Bearer"})
+
+    from firebase_admin import auth
+
+    try:
+        # Blocking: fetches Google's public keys when its cached copy expires
+        decoded = await asyncio.to_thread(auth.verify_id_token, token.strip(), firebase_admin_app)
+    except Exception as e:
+        logger.info(f"Rejected ID token: {e}")
+        raise HTTPException(status_code=401, detail="Invalid or expired ID token", headers={"WWW-Authenticate": "Bearer"})
+    return decoded["uid"]
+
+
+async def identify_caller(authorization: Optional[str] = Header(None)) -> Optional[str]:
+    """Dependency for the LLM endpoints: the verified uid their quota is charged to.
+
+    Signing in is optional there, so a call without a token (or while Firebase isn't configured) is
+    anonymous, but a token that is sent must be valid. The `user_id` in the request body is never used
+    for quotas: a client could pick a new one for every call.
+    """
+    caller = None
+    if authorization and firebase_admin_app is not None:
+        caller = await decode_id_token(authorization)
+    current_caller.set(caller)
+    return caller
+
+
+def quota_key() -> str:
+    """The quota bucket the current call is charged to: the verified caller's, or for an anonymous call one
+    per client address, so a single anonymous client can't throttle every other anonymous caller."""
+    caller = current_caller.get()
+    if caller:
+        return caller
+    client = (current_scope.get() or {}).get("client")
+    return f"anonymous:{client[0]}" if client else "anonymous"
+
+
+async def record_llm_failure(profile: str, model: str, error: Exception):
+    """Count a failed generation. Only the primary model's failures count toward the Ollama-wide breaker:
+    a broken fallback (e.g. never pulled) must not shut off a healthy primary."""
+    generation_profiles.record_failure(profile)
+    if model == generation_profiles.get_profile(profile).model:
+        await asyncio.to_thread(ollama_breaker.record_failure, str(error))
+    else:
+        logger.warning(f"Fallback model {model} failed for {profile}: {error}")
+
+
+async def record_llm_success(profile: str, model: str):
+    if model == generation_profiles.get_profile(profile).model:
+        await asyncio.to_thread(ollama_breaker.record_success)
+
+
+async def _generate(profile: str, messages: List[List[Any]]):
+    global inflight_llm_calls
+    model = model_router.choose(profile, llm_scheduler.queued)
+    llm = await OllamaService.get_model(profile, model)
+    role = await get_user_role(current_caller.get())
+    account = quota_key()
+    async with llm_scheduler.slot(account, role) as usage:
+        inflight_llm_calls += 1
+        started = time.perf_counter()
+        try:
+            result = await deadlines.hedged(
+                lambda: llm.agenerate(messages), model_router.p95_seconds(profile, model), llm_scheduler.spare_slot
+            )
+        except Exception as e:
+            await record_llm_failure(profile, model, e)
+            raise
+        finally:
+            inflight_llm_calls -= 1
+        await record_llm_success(profile, model)
+        elapsed = time.perf_counter() - started
+        # Same key langchain's OpenAI integration uses; callers read the routed model from it
+        result.llm_output = {**(result.llm_output or {}), "model_name": model}
+        usage["prompt_tokens"], usage["completion_tokens"] = token_usage(result)
+        generation_profiles.record(profile, usage["prompt_tokens"], usage["completion_tokens"], elapsed, model)
+        token_ledger.record(account, profile, model, usage["prompt_tokens"], usage["completion_tokens"], elapsed)
+        model_router.record(profile, model, elapsed)
+        model_warmup.record_generation(model, elapsed, result)
+    return result
+
+
+async def _dispatch_batch(profile: str, items: List[Any]) -> List[Any]:
+    """Run several users' prompts for one profile as a single `agenerate` call in one scheduler slot."""
+    global inflight_llm_calls
+    model = model_router.choose(profile, llm_scheduler.queued)
+    llm = await OllamaService.get_model(profile, model)
+    async with llm_scheduler.batch_slot([(user_id, role) for user_id, role, _ in items]) as usages:
+        inflight_llm_calls += len(items)
+        started = time.perf_counter()
+        try:
+            result = await llm.agenerate([messages for _, _, messages in items])
+        except Exception as e:
+            await record_llm_failure(profile, model, e)
+            raise
+        finally:
+            inflight_llm_calls -= len(items)
+        await record_llm_success(profile, model)
+        elapsed = time.perf_counter() - started
+        result.llm_output = {**(result.llm_output or {}), "model_name": model}
+        results = split_result(result)
+        for (user_id, _, _), usage, item_result in zip(items, usages, results):
+            usage["prompt_tokens"], usage["completion_tokens"] = token_usage(item_result)
+            generation_profiles.record(profile, usage["prompt_tokens"], usage["completion_tokens"], elapsed, model)
+            # Each member is charged an equal share of the batch's wall time, as in the scheduler
+            token_ledger.record(user_id, profile, model, usage["prompt_tokens"], usage["completion_tokens"],
+                                elapsed / len(items))
+        model_router.record(profile, model, elapsed)
+        model_warmup.record_generation(model, elapsed, result)
+    return results
+
+
+# Evaluations arrive in bursts when a class submits together; batch them across users
+evaluation_batchers = {
+    profile: MicroBatcher(profile, lambda items, profile=profile: _dispatch_batch(profile, items))
+    for profile in ("oral_evaluation",)
+}
+metrics.register("micro_batch", lambda: {profile: batcher.stats() for profile, batcher in evaluation_batchers.items()})
+
+
+async def llm_generate_batched(profile: str, messages: List[Any]):
+    """Like `llm_generate` for a single prompt, but sent together with other users' prompts that arrive
+    within the batching window. The caller's quota is still applied before the prompt joins a batch."""
+    role = await get_user_role(current_caller.get())
+    user = quota_key()
+    await deadlines.bounded(llm_scheduler.admit(user, role), "queue")
+    result = await deadlines.bounded(evaluation_batchers[profile].submit((user, role, messages)), "llm")
+    # The batch ran in another task; tag this request with its model here
+    model_router.record_use(result.llm_output["model_name"])
+    return result
+
+
+# Shared secret for admin-only endpoints; they are disabled when it is not set
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN", "")
+
+
+def require_admin_token(x_admin_token: Optional[str] = Header(None, alias="X-Admin-Token")):
+    """Dependency guarding admin endpoints with the X-Admin-Token header."""
+    import hmac
+
+    if not ADMIN_API_TOKEN:
+        raise HTTPException(status_code=503, detail="Admin API is disabled (ADMIN_API_TOKEN is not set)")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_API_TOKEN):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+
+@app.get("/ready", response_model=ReadinessResponse)
+async def readiness_check():
+    """Report whether this worker is ready, plus every live worker on this host."""
+    body = {
+        "worker_pid": os.getpid(),
+        "ready": worker_state["ready"],
+        "draining": worker_state["draining"],
+        "started_at": worker_state["started_at"],
+        "inflight_llm_calls": inflight_llm_calls,
+        "firestore": db_firestore is not None,
+        "workers": [worker for _, worker in await asyncio.to_thread(shared_store.items, "worker:")]
+    }
+    return ORJSONResponse(status_code=200 if worker_state["ready"] else 503, content=body)
+
+@app.get("/usage", response_model=UsageOverviewResponse, dependencies=[Depends(require_admin_token)])
+async def get_usage_overview(limit: int = 20):
+    """List the heaviest LLM consumers since the process started."""
+    return {
+        "scheduler": await asyncio.to_thread(llm_scheduler.stats),
+        "users": await asyncio.to_thread(llm_scheduler.top_users, limit)
+    }
+
+@app.get("/usage/{user_id}", response_model=UserUsageResponse, dependencies=[Depends(require_admin_token)])
+async def get_user_usage(user_id: str):
+    """Return LLM time, token and quota accounting for one user."""
+    usage = await asyncio.to_thread(llm_scheduler.usage, user_id)
+    if usage is None:
+        raise HTTPException(status_code=404, detail="No usage recorded for this user")
+    return usage
+
+@app.get("/metrics", response_model=MetricsResponse)
+async def get_metrics():
+    """Expose in-process service counters."""
+    return await metrics.collect()
 
 # Health check endpoint
 @app.get("/health", response_model=HealthCheckResponse)
@@ -322,6 +1068,8 @@ async def health_check():
 
 async def check_ollama_running() -> bool:
     """Check if Ollama service is running and responding."""
+    import aiohttp
+
     try:
         async with aiohttp.ClientSession() as session:
             async with session.get('http://localhost:11434/api/tags', timeout=5) as response:
@@ -330,7 +1078,25 @@ async def check_ollama_running() -> bool:
         logger.warning(f"Ollama check failed: {str(e)}")
         return False
 
-@app.post("/voice_chat/")
+def voice_chat_prompt(user_message: str) -> str:
+    # Prepare a simple, direct prompt
+    return f"""
+    You are TalkBuddy, a friendly English tutor. 
+    Your responses must always be short (2–3 sentences) and focus mainly on improving the learner’s English.
+
+    For every user message, you MUST:
+    1. Give the corrected version of the user’s whole sentence, woven naturally into your reply (no labels).
+    2. Continue the conversation with one short question.
+    3. Never exceed 2–3 short sentences total.
+
+    Avoid long explanations, grammar terms, or storytelling. Stay simple, friendly, and conversational.
+
+
+    User said: "{user_message}
+    """
+
+
+@app.post("/voice_chat/", response_model=VoiceChatResponse, dependencies=[Depends(identify_caller)])
 async def voice_chat(request: ChatRequest):
     try:
         if not request.messages:
@@ -352,31 +1118,21 @@ async def voice_chat(request: ChatRequest):
             }
         
         user_message = last_user_message.content.strip()
-        logger.info(f"Processing message: {user_message[:100]}...")
-        
-        # Prepare a simple, direct prompt
-        prompt = f"""
-        You are TalkBuddy, a friendly English tutor. 
-        Your responses must always be short (2–3 sentences) and focus mainly on improving the learner’s English.
-
-        For every user message, you MUST:
-        1. Give the corrected version of the user’s whole sentence, woven naturally into your reply (no labels).
-        2. Continue the conversation with one short question.
-        3. Never exceed 2–3 short sentences total.
-
-        Avoid long explanations, grammar terms, or storytelling. Stay simple, friendly, and conversational.
+        payload_logger.info(f"Processing message: {user_message[:100]}...")
 
-
-        User said: "{user_message}
-        """
+        cached = reply_cache.lookup(user_message)
+        if cached:
+            reply, model = cached
+            payload_logger.info(f"Cached response: {reply}")
+            return {"reply": reply, "audio_text": reply, "model": model}
+        
+        prompt = voice_chat_prompt(user_message)
         
         try:
-            model = await OllamaService.get_model()
-            if not model:
-                raise Exception("Model not available")
-            
-            # Get response using the model's invoke method
-            response = await model.ainvoke(prompt)
+            from langchain_core.messages import HumanMessage
+
+            result = await llm_generate("voice_chat", [[HumanMessage(content=prompt)]])
+            response = result.generations[0][0].message
             
             # Extract the response text
             if hasattr(response, 'content'):
@@ -394,13 +1150,19 @@ async def voice_chat(request: ChatRequest):
             if not reply or len(reply) < 2:
                 reply = "I'm not sure how to respond to that. Could you try rephrasing?"
             
-            logger.info(f"Generated response: {reply}")
+            else:
+                reply_cache.store(user_message, reply, result.llm_output["model_name"])
+            
+            payload_logger.info(f"Generated response: {reply}")
             
             return {
                 "reply": reply,
-                "audio_text": reply
+                "audio_text": reply,
+                "model": result.llm_output["model_name"]
             }
             
+        except HTTPException:
+            raise
         except Exception as e:
             logger.error(f"Error getting model response: {str(e)}", exc_info=True)
             return {
@@ -408,6 +1170,8 @@ async def voice_chat(request: ChatRequest):
                 "audio_text": "I'm having trouble responding right now. Could you try again in a moment?"
             }
             
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Unexpected error in voice chat: {str(e)}", exc_info=True)
         return {
@@ -416,30 +1180,12 @@ async def voice_chat(request: ChatRequest):
         }
 
 
-# Quiz evaluation endpoint
-@app.post("/api/oral-quiz/evaluate")
-async def evaluate_oral_response(request: QuizEvaluationRequest):
-    """Evaluate a user's spoken response to an oral quiz question."""
-
-    from langchain_core.messages import HumanMessage
-    import json, re
-
-    if not request.userResponse.strip():
-        return {
-            "score": 0,
-            "feedback": "No response was provided. Please try speaking again.",
-            "suggestions": [
-                "Make sure to speak clearly into the microphone",
-                "Try to provide a complete sentence in your response"
-            ]
-        }
-
-    # Build evaluation prompt
-    evaluation_prompt = f"""
+def oral_evaluation_prompt(question: str, response: str) -> str:
+    return f"""
     You are an English language assessment AI. Please evaluate the following spoken response.
 
-    QUESTION: {request.questionText}
-    STUDENT RESPONSE: {request.userResponse}
+    QUESTION: {question}
+    STUDENT RESPONSE: {response}
 
     Respond ONLY with the JSON object in this exact format:
 
@@ -461,56 +1207,83 @@ async def evaluate_oral_response(request: QuizEvaluationRequest):
     }}
     """
 
-    max_retries = 3
 
-    for attempt in range(max_retries):
-        try:
-            # Load Ollama model
-            llm = await OllamaService.get_model()
-            if not llm:
-                raise HTTPException(
-                    status_code=503,
-                    detail="Ollama model is not available."
-                )
+# Quiz evaluation endpoint
+@app.post("/api/oral-quiz/evaluate", response_model=OralEvaluationResponse, dependencies=[Depends(identify_caller)])
+async def evaluate_oral_response(request: QuizEvaluationRequest):
+    """Evaluate a user's spoken response to an oral quiz question."""
+    key = canonical_key("oral_eval", request.model_dump())
+    return await llm_single_flight.do(key, lambda: _evaluate_oral_response(request))
 
-            # FIXED: agenerate now requires message objects, NOT raw strings
-            messages = [[HumanMessage(content=evaluation_prompt)]]
 
-            response = await llm.agenerate(messages)
+PRE_EVALUATION_ENABLED = os.getenv("PRE_EVAL_ENABLED", "true").lower() not in ("0", "false", "no")
+# Share of locally scored answers also sent to the model, to measure how often the two agree
+PRE_EVAL_SHADOW_RATE = float(os.getenv("PRE_EVAL_SHADOW_RATE", "0.02"))
+shadow_tasks: Set[asyncio.Task] = set()
 
-            # Extract model response
-            evaluation_text = response.generations[0][0].text
 
-            # Extract JSON segment
-            json_match = re.search(r"\{[\s\S]*\}", evaluation_text)
-            if not json_match:
-                raise ValueError("No JSON found in model output.")
+async def shadow_pre_evaluation(request: QuizEvaluationRequest, reason: str, rule_score: int):
+    """Score a pre-evaluated answer with the model too and record whether the scores agree."""
+    from langchain_core.messages import HumanMessage
 
-            clean_json = json_match.group(0)
+    try:
+        prompt = oral_evaluation_prompt(request.questionText, request.userResponse)
+        response = await llm_generate_batched("oral_evaluation", [HumanMessage(content=prompt)])
+        evaluation = parse_model(response.generations[0][0].text, ORAL_EVALUATION)
+        pre_evaluation.record_shadow(reason, rule_score, evaluation.score)
+    except Exception as e:
+        logger.info(f"Shadow evaluation skipped: {e}")
 
-            # Parse JSON
-            evaluation = json.loads(clean_json)
 
-            # Validate essential fields
-            required_fields = ["score", "feedback", "suggestions"]
-            if not all(field in evaluation for field in required_fields):
-                raise ValueError("AI response missing required fields.")
+async def _evaluate_oral_response(request: QuizEvaluationRequest):
+    from langchain_core.messages import HumanMessage
 
-            # Sanitize score (1–10)
-            score = max(1, min(10, int(evaluation.get("score", 5))))
+    if not request.userResponse.strip():
+        return {
+            "score": 0,
+            "feedback": "No response was provided. Please try speaking again.",
+            "suggestions": [
+                "Make sure to speak clearly into the microphone",
+                "Try to provide a complete sentence in your response"
+            ]
+        }
 
-            return {
-                "score": score,
-                "feedback": evaluation.get("feedback", ""),
-                "corrections": evaluation.get("corrections", []),
-                "suggestions": evaluation.get("suggestions", [])[:3],
-                "encouragement": evaluation.get("encouragement", "Great effort! Keep improving!")
-            }
+    # Too short, an echo of the question or recognition noise: scored locally, the model adds nothing
+    if PRE_EVALUATION_ENABLED:
+        local = pre_evaluation.pre_evaluate(request.questionText, request.userResponse)
+        if local is not None:
+            if random.random() < PRE_EVAL_SHADOW_RATE:
+                task = asyncio.create_task(shadow_pre_evaluation(request, local["pre_evaluation"], local["score"]))
+                shadow_tasks.add(task)
+                task.add_done_callback(shadow_tasks.discard)
+            return local
+
+    evaluation_prompt = oral_evaluation_prompt(request.questionText, request.userResponse)
+
+    max_retries = 3
+
+    for attempt in range(max_retries):
+        try:
+            # FIXED: agenerate now requires message objects, NOT raw strings
+            messages = [HumanMessage(content=evaluation_prompt)]
+
+            response = await llm_generate_batched("oral_evaluation", messages)
+
+            # Extract model response
+            evaluation_text = response.generations[0][0].text
+
+            # Extract, repair and validate the JSON object (score clamped to 1-10)
+            evaluation = parse_model(evaluation_text, ORAL_EVALUATION)
+            return {**evaluation.model_dump(), "model": response.llm_output["model_name"]}
 
         except Exception as e:
+            if isinstance(e, DeadlineExceeded) or \
+                    (isinstance(e, HTTPException) and e.status_code == status.HTTP_429_TOO_MANY_REQUESTS):
+                raise
             logger.error(f"Evaluation error (attempt {attempt + 1}): {str(e)}", exc_info=True)
 
-            if attempt == max_retries - 1:
+            # Retries share the request's deadline; stop once too little of it is left
+            if attempt == max_retries - 1 or not deadlines.retry_allowed():
                 # Final failure
                 raise HTTPException(
                     status_code=503,
@@ -535,7 +1308,7 @@ async def get_user_assessment_level(user_id: str) -> str:
     try:
         # Use document ID directly (user_id is the document ID)
         user_ref = db_firestore.collection("users").document(user_id)
-        user_doc = user_ref.get()
+        user_doc = await load_document(db_firestore, user_ref)
         
         if user_doc.exists:
             user_data = user_doc.to_dict()
@@ -559,12 +1332,83 @@ async def get_user_assessment_level(user_id: str) -> str:
         return "BASIC"
 
 
-def get_quiz_generation_prompt(level: str) -> str:
-    """Generate prompt for quiz generation based on level."""
+async def get_seen_bank_questions(user_id: str) -> List[str]:
+    """Return the question bank IDs already served to a user."""
+    if not db_firestore:
+        return []
+    try:
+        user_doc = await load_document(db_firestore, db_firestore.collection("users").document(user_id))
+        if user_doc.exists:
+            return (user_doc.to_dict() or {}).get("seenBankQuestions", [])
+    except Exception as e:
+        logger.warning(f"Could not load seen questions for user {user_id}: {e}")
+    return []
+
+
+# The seen list lives on the user document, which Firestore caps at 1 MiB; only the most recent are kept
+SEEN_BANK_QUESTIONS_MAX = int(os.getenv("SEEN_BANK_QUESTIONS_MAX", "500"))
+
+
+def mark_bank_questions_seen(user_id: str, bank_ids: List[str]):
+    """Record that bank questions were served to a user so they aren't repeated (blocking; run in a thread).
+
+    Keeps the `SEEN_BANK_QUESTIONS_MAX` most recently served IDs, oldest first, so a
+    long-time user may eventually see a question again rather than growing the document.
+    """
+    if not db_firestore or not bank_ids:
+        return
+    try:
+        from google.cloud import firestore
+
+        ref = db_firestore.collection("users").document(user_id)
+
+        @firestore.transactional
+        def run(transaction):
+            snapshot = ref.get(transaction=transaction)
+            if not snapshot.exists:
+                return
+            served = set(bank_ids)
+            seen = [i for i in (snapshot.to_dict() or {}).get("seenBankQuestions", []) if i not in served]
+            seen.extend(dict.fromkeys(bank_ids))
+            transaction.update(ref, {"seenBankQuestions": seen[-SEEN_BANK_QUESTIONS_MAX:]})
+
+        run(db_firestore.transaction())
+    except Exception as e:
+        logger.warning(f"Could not record seen questions for user {user_id}: {e}")
+
+
+async def get_user_role(user_id: Optional[str]) -> str:
+    """Return the quota role ("student" or "admin") for a user, cached for five minutes."""
+    if not user_id or not db_firestore:
+        return "student"
+
+    cached = await asyncio.to_thread(shared_store.get, f"role:{user_id}")
+    if cached:
+        return cached
+
+    role = "student"
+    try:
+        user_doc = await load_document(db_firestore, db_firestore.collection("users").document(user_id))
+        if user_doc.exists and (user_doc.to_dict() or {}).get("role") == "admin":
+            role = "admin"
+    except Exception as e:
+        logger.warning(f"Could not load role for user {user_id}: {e}")
+
+    await asyncio.to_thread(shared_store.set, f"role:{user_id}", role, 300)
+    return role
+
+
+def get_quiz_generation_prompt(level: str, mc_count: int = 3, oral_count: int = 5,
+                               avoid_topics: Optional[List[str]] = None) -> str:
+    """Generate prompt for quiz generation based on level.
+
+    `mc_count`/`oral_count` ask for only the slots the question bank could not
+    fill, and `avoid_topics` steers the model away from topics already covered.
+    """
     level_lower = level.lower()
     
     if level == "BASIC":
-        return """You are an expert English language teacher creating a quiz for a BASIC level learner (beginner). 
+        prompt = """You are an expert English language teacher creating a quiz for a BASIC level learner (beginner). 
 
 Create engaging, practical questions that test real understanding, not just memorization. Make questions relevant to everyday situations.
 
@@ -590,19 +1434,21 @@ Return ONLY a valid JSON array in this exact format:
     "type": "multiple_choice",
     "question": "What is the correct form?",
     "options": ["Option A", "Option B", "Option C", "Option D"],
-    "correct": "Option A"
+    "correct": "Option A",
+    "topic": "grammar"
   },
   {
     "id": "q2",
     "type": "oral",
-    "question": "Tell me about your favorite food."
+    "question": "Tell me about your favorite food.",
+    "topic": "food"
   }
 ]
 
 Generate exactly 3 multiple-choice and 5 oral questions. Return only the JSON array, no other text."""
     
     elif level == "INTERMEDIATE":
-        return """You are an expert English language teacher creating a quiz for an INTERMEDIATE level learner.
+        prompt = """You are an expert English language teacher creating a quiz for an INTERMEDIATE level learner.
 
 Create thought-provoking questions that test grammar accuracy, vocabulary usage, and ability to express ideas clearly. Questions should challenge learners while remaining achievable.
 
@@ -629,19 +1475,21 @@ Return ONLY a valid JSON array in this exact format:
     "type": "multiple_choice",
     "question": "What is the correct form?",
     "options": ["Option A", "Option B", "Option C", "Option D"],
-    "correct": "Option A"
+    "correct": "Option A",
+    "topic": "grammar"
   },
   {
     "id": "q2",
     "type": "oral",
-    "question": "Describe a memorable trip you took recently. What made it special?"
+    "question": "Describe a memorable trip you took recently. What made it special?",
+    "topic": "travel"
   }
 ]
 
 Generate exactly 3 multiple-choice and 5 oral questions. Return only the JSON array, no other text."""
     
     else:  # ADVANCED
-        return """You are an expert English language teacher creating a quiz for an ADVANCED level learner.
+        prompt = """You are an expert English language teacher creating a quiz for an ADVANCED level learner.
 
 Create sophisticated questions that test mastery of nuanced grammar, precise vocabulary, and ability to articulate complex ideas. Questions should reflect native-level proficiency expectations.
 
@@ -669,21 +1517,140 @@ Return ONLY a valid JSON array in this exact format:
     "type": "multiple_choice",
     "question": "What is the correct form?",
     "options": ["Option A", "Option B", "Option C", "Option D"],
-    "correct": "Option A"
+    "correct": "Option A",
+    "topic": "grammar"
   },
   {
     "id": "q2",
     "type": "oral",
-    "question": "Discuss the impact of technology on modern communication. How has it changed the way we interact, and what are the potential drawbacks of this evolution?"
+    "question": "Discuss the impact of technology on modern communication. How has it changed the way we interact, and what are the potential drawbacks of this evolution?",
+    "topic": "technology"
   }
 ]
 
 Generate exactly 3 multiple-choice and 5 oral questions. Return only the JSON array, no other text."""
 
+    if mc_count != 3 or oral_count != 5:
+        prompt = (
+            prompt.replace("- 3 multiple-choice questions", f"- {mc_count} multiple-choice questions")
+            .replace("- 5 oral/speaking questions", f"- {oral_count} oral/speaking questions")
+            .replace("Generate exactly 3 multiple-choice and 5 oral questions",
+                     f"Generate exactly {mc_count} multiple-choice and {oral_count} oral questions")
+        )
+    if avoid_topics:
+        prompt += f"\nDo not use these topics, they are already covered: {', '.join(sorted(avoid_topics))}."
+    return prompt
+
+
+# A minute of speech is about 170 words; samples use the longest input a user can produce
+SAMPLE_UTTERANCE = " ".join(["yesterday I practiced speaking English with my friends at the cafe"] * 20)
 
-@app.post("/generate_assessment/")
-async def generate_assessment(request: GenerateAssessmentRequest):
+
+def prompt_budget_samples() -> Dict[str, List[List[str]]]:
+    """Largest realistic prompt of each task, for the startup token budget check."""
+    topics = ["daily routines", "family", "hobbies", "food", "weather", "travel", "work", "opinions"]
+    return {
+        "voice_chat": [[voice_chat_prompt(SAMPLE_UTTERANCE)]],
+        "oral_evaluation": [[oral_evaluation_prompt(SAMPLE_UTTERANCE[:300], SAMPLE_UTTERANCE)]],
+        "quiz_generation": [
+            [get_quiz_generation_prompt(level, QUIZ_MC_COUNT, QUIZ_ORAL_COUNT, topics)]
+            for level in ("BASIC", "INTERMEDIATE", "ADVANCED")
+        ],
+        "quiz_question": [
+            [quiz_slots.question_slot_prompt(level, qtype, "daily_routine")]
+            for level in ("BASIC", "INTERMEDIATE", "ADVANCED") for qtype in QUESTION_TYPES
+        ],
+    }
+
+
+async def generate_questions_batch(level: str, needed: Dict[str, int],
+                                   picked: List[Dict[str, Any]], seen: Set[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """Generate every missing question in one prompt."""
+    from langchain_core.messages import HumanMessage
+
+    fresh = {"multiple_choice": [], "oral": []}
+    covered_topics = {q["topic"] for q in picked}
+    prompt = get_quiz_generation_prompt(
+        level, needed["multiple_choice"], needed["oral"], sorted(covered_topics)
+    )
+
+    messages = [[HumanMessage(content=prompt)]]
+    response = await llm_generate("quiz_generation", messages)
+    quiz_text = response.generations[0][0].text
+
+    # Extract the JSON array; malformed questions are dropped individually
+    parsed, rejected = parse_items(quiz_text, QUIZ_QUESTION)
+    if rejected:
+        logger.warning(f"Dropped {len(rejected)} invalid generated questions: {rejected}")
+    generated = [q.model_dump(exclude_none=True) for q in parsed]
+
+    # Bank new questions; near-duplicates are only used if nothing better is left
+    chosen = seen | {q["bank_id"] for q in picked}
+    records = question_bank.add_generated(level, generated)
+    for record in sorted(records, key=lambda r: r["duplicate_of"] is not None):
+        qtype = record["type"]
+        if len(fresh[qtype]) >= needed[qtype] or record["bank_id"] in chosen:
+            continue
+        record.pop("duplicate_of")
+        fresh[qtype].append(record)
+        chosen.add(record["bank_id"])
+    return fresh
+
+
+async def generate_questions_per_slot(level: str, needed: Dict[str, int],
+                                      picked: List[Dict[str, Any]], seen: Set[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """Generate each missing question with its own prompt and topic, concurrently.
+
+    A malformed or duplicate question only costs a retry of its own slot.
+    """
+    from langchain_core.messages import HumanMessage
+
+    topics = iter(quiz_slots.assign_topics(level, sum(needed.values()), {q["topic"] for q in picked}))
+    slots = [(qtype, next(topics)) for qtype in QUESTION_TYPES for _ in range(needed[qtype])]
+    chosen = seen | {q["bank_id"] for q in picked}
+
+    async def generate(prompt: str) -> str:
+        response = await llm_generate("quiz_question", [[HumanMessage(content=prompt)]])
+        return response.generations[0][0].text
+
+    def accept(question: Dict[str, Any]) -> Optional[str]:
+        # Banks the question; a near-duplicate is fine as long as this user hasn't had it
+        record = question_bank.add_generated(level, [question])[0]
+        if record["bank_id"] in chosen:
+            return "duplicate"
+        record.pop("duplicate_of")
+        question.update(record)
+        chosen.add(record["bank_id"])
+        return None
+
+    results = await quiz_slots.fill_slots(level, slots, generate, accept, fatal=(HTTPException,))
+    fresh = {"multiple_choice": [], "oral": []}
+    for (qtype, _), question in zip(slots, results):
+        if question is not None:
+            fresh[qtype].append(question)
+    return fresh
+
+
+@app.post(
+    "/generate_assessment/",
+    response_model=GenerateAssessmentResponse,
+    dependencies=[Depends(identify_caller)]
+)
+async def generate_assessment(
+    request: GenerateAssessmentRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """Generate an AI-powered quiz based on user's assessment level."""
+    key = canonical_key("generate_assessment", request.model_dump())
+    return await idempotency_store.run(
+        f"generate_assessment:{request.user_id}",
+        idempotency_key,
+        request.model_dump(),
+        lambda: llm_single_flight.do(key, lambda: _generate_assessment(request))
+    )
+
+
+async def _generate_assessment(request: GenerateAssessmentRequest):
     try:
         if not db_firestore:
             raise HTTPException(
@@ -691,36 +1658,48 @@ async def generate_assessment(request: GenerateAssessmentRequest):
                 detail="Database service unavailable"
             )
         
-        # Get user's assessment level
-        assessment_level = await get_user_assessment_level(request.user_id)
+        # Get user's assessment level and served bank questions (one batched user doc read)
+        assessment_level, seen = await asyncio.gather(
+            get_user_assessment_level(request.user_id),
+            get_seen_bank_questions(request.user_id)
+        )
+        seen = set(seen)
         logger.info(f"Generating quiz for user {request.user_id} at {assessment_level} level")
         
-        # Generate quiz using AI
-        prompt = get_quiz_generation_prompt(assessment_level)
-        
-        llm = await OllamaService.get_model()
-        if not llm:
-            raise HTTPException(
-                status_code=503,
-                detail="AI service is currently unavailable"
-            )
-        
-        messages = [[HumanMessage(content=prompt)]]
-        response = await llm.agenerate(messages)
-        quiz_text = response.generations[0][0].text
-        
-        # Extract JSON from response
-        json_match = re.search(r'\[[\s\S]*\]', quiz_text)
-        if not json_match:
-            raise ValueError("No valid JSON array found in AI response")
-        
-        quiz_json = json_match.group(0)
-        questions = json.loads(quiz_json)
+        # Fill most slots with bank questions this user hasn't seen yet
+        await question_bank.load_level(assessment_level)
+        fresh_mc = round(QUIZ_FRESH_QUESTIONS * QUIZ_MC_COUNT / (QUIZ_MC_COUNT + QUIZ_ORAL_COUNT))
+        fresh_oral = QUIZ_FRESH_QUESTIONS - fresh_mc
+        bank_mc = question_bank.pick(assessment_level, "multiple_choice", QUIZ_MC_COUNT - fresh_mc, seen)
+        bank_oral = question_bank.pick(
+            assessment_level, "oral", QUIZ_ORAL_COUNT - fresh_oral, seen,
+            avoid_topics={q["topic"] for q in bank_mc}
+        )
+        needed = {
+            "multiple_choice": QUIZ_MC_COUNT - len(bank_mc),
+            "oral": QUIZ_ORAL_COUNT - len(bank_oral),
+        }
+        fresh = {"multiple_choice": [], "oral": []}
+
+        # Generate only the remaining slots using AI
+        if needed["multiple_choice"] or needed["oral"]:
+            generate_fresh = generate_questions_batch if QUIZ_GENERATION_MODE == "batch" else generate_questions_per_slot
+            fresh = await generate_fresh(assessment_level, needed, bank_mc + bank_oral, seen)
+            await question_bank.save_new()
+
+        questions = bank_mc + fresh["multiple_choice"] + bank_oral + fresh["oral"]
+        for i, q in enumerate(questions, start=1):
+            q["id"] = f"q{i}"
         
         # Validate questions structure
-        if not isinstance(questions, list) or len(questions) < 5:
+        if len(questions) < 5:
             raise ValueError("Invalid quiz format: expected at least 5 questions")
         
+        question_bank.record_served(
+            len(bank_mc) + len(bank_oral),
+            len(fresh["multiple_choice"]) + len(fresh["oral"])
+        )
+        
         # Create quiz document
         quiz_id = f"quiz_{int(time.time() * 1000)}"
         timestamp = datetime.utcnow()
@@ -741,6 +1720,8 @@ async def generate_assessment(request: GenerateAssessmentRequest):
         quiz_ref = db_firestore.collection("users").document(request.user_id).collection("ai_quizzes").document(quiz_id)
         quiz_ref.set(quiz_data)
         
+        await asyncio.to_thread(mark_bank_questions_seen, request.user_id, [q["bank_id"] for q in questions])
+        
         logger.info(f"Quiz {quiz_id} generated and saved for user {request.user_id}")
         
         return {
@@ -751,8 +1732,10 @@ async def generate_assessment(request: GenerateAssessmentRequest):
             "created_at": timestamp.isoformat()
         }
         
-    except json.JSONDecodeError as e:
-        logger.error(f"JSON parsing error: {e}")
+    except HTTPException:
+        raise
+    except LLMParseError as e:
+        logger.error(f"Quiz parsing error: {e}")
         raise HTTPException(
             status_code=500,
             detail="Failed to parse AI-generated quiz. Please try again."
@@ -765,9 +1748,21 @@ async def generate_assessment(request: GenerateAssessmentRequest):
         )
 
 
-@app.post("/submit_quiz/")
-async def submit_quiz(request: QuizSubmissionRequest):
+@app.post("/submit_quiz/", response_model=QuizSubmissionResponse)
+async def submit_quiz(
+    request: QuizSubmissionRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
     """Submit quiz results and check for level promotion."""
+    return await idempotency_store.run(
+        f"submit_quiz:{request.user_id}",
+        idempotency_key,
+        request.model_dump(),
+        lambda: _submit_quiz(request)
+    )
+
+
+async def _submit_quiz(request: QuizSubmissionRequest):
     try:
         if not db_firestore:
             raise HTTPException(
@@ -775,12 +1770,14 @@ async def submit_quiz(request: QuizSubmissionRequest):
                 detail="Database service unavailable"
             )
         
-        # Get current user level
-        current_level = await get_user_assessment_level(request.user_id)
-        
-        # Update quiz document with results
-        quiz_ref = db_firestore.collection("users").document(request.user_id).collection("ai_quizzes").document(request.quiz_id)
-        quiz_doc = quiz_ref.get()
+        # Get current user level and the quiz document in one batched read
+        loader = get_loader(db_firestore)
+        user_ref = db_firestore.collection("users").document(request.user_id)
+        quiz_ref = user_ref.collection("ai_quizzes").document(request.quiz_id)
+        current_level, quiz_doc = await asyncio.gather(
+            get_user_assessment_level(request.user_id),
+            loader.load(quiz_ref)
+        )
         
         if not quiz_doc.exists:
             raise HTTPException(status_code=404, detail="Quiz not found")
@@ -800,6 +1797,15 @@ async def submit_quiz(request: QuizSubmissionRequest):
         
         quiz_ref.update(submission_data)
         
+        # Fold the result into the progress summary; a resubmission replaces the earlier result
+        previous_entry = progress_summary.quiz_entry(request.quiz_id, quiz_data) if quiz_data.get("attempted") else None
+        await record_progress(
+            request.user_id,
+            lambda summary: progress_summary.apply_quiz(
+                summary, progress_summary.quiz_entry(request.quiz_id, {**quiz_data, **submission_data}), previous_entry
+            )
+        )
+        
         # Check for level promotion
         promoted = False
         new_level = current_level
@@ -807,8 +1813,10 @@ async def submit_quiz(request: QuizSubmissionRequest):
         # Only check promotion if quiz level matches current level
         if quiz_level == current_level:
             # Get recent quiz attempts at current level
-            quizzes_ref = db_firestore.collection("users").document(request.user_id).collection("ai_quizzes")
-            recent_quizzes = quizzes_ref.where("assessment_level", "==", current_level).where("attempted", "==", True).limit(10).get()
+            quizzes_ref = user_ref.collection("ai_quizzes")
+            recent_quizzes = await loader.query(
+                quizzes_ref.where("assessment_level", "==", current_level).where("attempted", "==", True).limit(10)
+            )
             
             high_scores = 0
             for q in recent_quizzes:
@@ -827,7 +1835,6 @@ async def submit_quiz(request: QuizSubmissionRequest):
                 
                 if promoted:
                     # Update user document
-                    user_ref = db_firestore.collection("users").document(request.user_id)
                     user_ref.update({
                         "assessmentLevel": new_level,
                         "levelPromotedAt": datetime.utcnow(),
@@ -835,10 +1842,9 @@ async def submit_quiz(request: QuizSubmissionRequest):
                     })
                     logger.info(f"User {request.user_id} promoted from {current_level} to {new_level}")
         
-        # Get user email and display name for sending results email
+        # Get user email and display name for sending results email (memoized user doc, no extra read)
         try:
-            user_ref = db_firestore.collection("users").document(request.user_id)
-            user_doc = user_ref.get()
+            user_doc = await loader.load(user_ref)
             if user_doc.exists:
                 user_data = user_doc.to_dict()
                 user_email = user_data.get("email", "")
@@ -855,12 +1861,13 @@ async def submit_quiz(request: QuizSubmissionRequest):
                     "assessment_level": current_level
                 }
                 
-                # Send quiz results email asynchronously
-                if user_email:
-                    # Send email in background without blocking the response
-                    send_quiz_results_email(user_email, display_name, quiz_results)
+                # Queued so SMTP latency and outages never hold up the submission
+                if user_email and email_configured():
+                    await job_runner.submit("quiz_results_email", {
+                        "email": user_email, "display_name": display_name, "quiz_results": quiz_results
+                    }, dedupe_key=f"quiz_results_email:{request.quiz_id}")
         except Exception as email_error:
-            logger.warning(f"Could not send quiz results email: {str(email_error)}")
+            logger.warning(f"Could not queue quiz results email: {str(email_error)}")
             # Don't raise an exception, just log it - email sending is not critical to quiz submission
         
         return {
@@ -877,32 +1884,543 @@ async def submit_quiz(request: QuizSubmissionRequest):
             detail=f"Failed to submit quiz: {str(e)}"
         )
 
+
+# ==================== HISTORY ====================
+
+# Only these fields are read for history lists; transcripts and questions are fetched per item
+SESSION_SUMMARY_FIELDS = ["title", "status", "createdAt", "endedAt", "messageCount", "preview", "summary.final_feedback"]
+QUIZ_SUMMARY_FIELDS = [
+    "assessment_level", "created_at", "attempted", "attempted_at", "total_questions",
+    "mc_questions", "oral_questions", "total_score", "percentage"
+]
+SESSION_PREVIEW_CHARS = 60
+TRANSCRIPT_PAGE_TURNS = 50
+HISTORY_CACHE_CONTROL = "private, no-cache"
+
+
+def session_list_fields(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Denormalized list fields for a voice session, derived from its messages."""
+    first_user = next((m.get("content", "") for m in messages or [] if m.get("role") == "user"), "")
+    return {"messageCount": len(messages or []), "preview": first_user[:SESSION_PREVIEW_CHARS]}
+
+
+def keyset_page(query, order_field: str, limit: int, cursor: Optional[str]):
+    """Order newest first with the document ID as tie-breaker, fetching one extra row to detect more pages."""
+    from google.cloud.firestore import Query as FirestoreQuery
+
+    query = (
+        query.order_by(order_field, direction=FirestoreQuery.DESCENDING)
+        .order_by("__name__", direction=FirestoreQuery.DESCENDING)
+        .limit(limit + 1)
+    )
+    if cursor:
+        query = query.start_after(decode_cursor(cursor))
+    return query
+
+
+async def backfill_session_fields(snapshots: List[Any]) -> Dict[str, Dict[str, Any]]:
+    """Compute list fields for sessions saved before they were denormalized, and store them.
+
+    Reads the full documents for the page in one batch; afterwards these
+    sessions are served from the projection like any other.
+    """
+    loader = get_loader(db_firestore)
+    full_docs = await loader.load_many([snapshot.reference for snapshot in snapshots])
+    fields = {doc.id: session_list_fields((doc.to_dict() or {}).get("messages", [])) for doc in full_docs if doc.exists}
+
+    def write():
+        batch = db_firestore.batch()
+        for snapshot in snapshots:
+            if snapshot.id in fields:
+                batch.update(snapshot.reference, fields[snapshot.id])
+        batch.commit()
+
+    try:
+        await asyncio.to_thread(write)
+    except Exception as e:
+        logger.warning(f"Could not backfill session list fields: {e}")
+    return fields
+
+
+def not_modified(etag: str) -> Response:
+    return Response(status_code=304, headers={"ETag": etag, "Cache-Control": HISTORY_CACHE_CONTROL})
+
+
+async def verify_caller(authorization: Optional[str] = Header(None)) -> str:
+    """Dependency returning the uid from the Firebase ID token in `Authorization: Bearer <token>`.
+
+    These endpoints read with admin credentials, so Firestore security rules don't apply;
+    the token check stands in for them.
+    """
+    if firebase_admin_app is None:
+        raise HTTPException(status_code=503, detail="Authentication service unavailable")
+    return await decode_id_token(authorization)
+
+
+async def require_owner(user_id: str, caller: str = Depends(verify_caller)) -> str:
+    """Dependency for /users/{user_id}/... endpoints: the caller must be signed in as `user_id`."""
+    if caller != user_id:
+        raise HTTPException(status_code=403, detail="You can only access your own data")
+    return caller
+
+
+@app.get(
+    "/users/{user_id}/sessions",
+    response_model=SessionPageResponse,
+    dependencies=[Depends(require_owner)]
+)
+async def list_voice_sessions(
+    user_id: str,
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
+):
+    """Completed voice sessions, newest first, as summaries with a cursor for the next page."""
+    if not db_firestore:
+        raise HTTPException(status_code=503, detail="Database service unavailable")
+
+    query = (
+        db_firestore.collection("voice_sessions")
+        .where("userId", "==", user_id)
+        .where("status", "==", "completed")
+        .select(SESSION_SUMMARY_FIELDS)
+    )
+    snapshots = await get_loader(db_firestore).query(keyset_page(query, "createdAt", limit, cursor))
+    page = snapshots[:limit]
+
+    etag = snapshot_etag(page, "sessions", user_id, cursor, limit)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    legacy = [snapshot for snapshot in page if "messageCount" not in (snapshot.to_dict() or {})]
+    backfilled = await backfill_session_fields(legacy) if legacy else {}
+
+    items = []
+    for snapshot in page:
+        data = {**(snapshot.to_dict() or {}), **backfilled.get(snapshot.id, {})}
+        items.append({
+            "id": snapshot.id,
+            "title": data.get("title"),
+            "status": data.get("status"),
+            "created_at": data.get("createdAt"),
+            "ended_at": data.get("endedAt"),
+            "message_count": data.get("messageCount", 0),
+            "preview": data.get("preview", ""),
+            "has_summary": bool(data.get("summary")),
+        })
+
+    next_cursor = None
+    if len(snapshots) > limit:
+        next_cursor = encode_cursor(page[-1].get("createdAt"), page[-1].id)
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = HISTORY_CACHE_CONTROL
+    return {"items": items, "next_cursor": next_cursor}
+
+
+async def load_owned_session(user_id: str, session_id: str):
+    session_doc = await load_document(db_firestore, db_firestore.collection("voice_sessions").document(session_id))
+    data = session_doc.to_dict() if session_doc.exists else None
+    if not data or data.get("userId") != user_id:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session_doc, data
+
+
+@app.get(
+    "/users/{user_id}/sessions/{session_id}",
+    response_model=SessionDetailResponse,
+    dependencies=[Depends(require_owner)]
+)
+async def get_voice_session(
+    user_id: str,
+    session_id: str,
+    response: Response,
+    turn_limit: int = Query(TRANSCRIPT_PAGE_TURNS, ge=1, le=500),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
+):
+    """Voice session with its summary and the first `turn_limit` turns of the transcript.
+
+    `next_turn` is set when there are more turns; fetch them from the
+    transcript endpoint.
+    """
+    if not db_firestore:
+        raise HTTPException(status_code=503, detail="Database service unavailable")
+
+    session_doc, data = await load_owned_session(user_id, session_id)
+    etag = snapshot_etag([session_doc], turn_limit)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    try:
+        messages, total = await deadlines.to_thread(
+            transcript_store.read_turns, db_firestore, session_doc.reference, data, 0, turn_limit
+        )
+    except transcript_store.TranscriptUnavailable as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=404, detail="Part of this transcript is missing")
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = HISTORY_CACHE_CONTROL
+    return {
+        "id": session_doc.id,
+        **data,
+        "messages": messages,
+        "total_turns": total,
+        "next_turn": len(messages) if len(messages) < total else None
+    }
+
+
+@app.get(
+    "/users/{user_id}/sessions/{session_id}/transcript",
+    response_model=TranscriptPageResponse,
+    dependencies=[Depends(require_owner)]
+)
+async def get_voice_session_transcript(
+    user_id: str,
+    session_id: str,
+    response: Response,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(TRANSCRIPT_PAGE_TURNS, ge=1, le=500),
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
+):
+    """A window of a session's transcript; only the chunks covering it are read."""
+    if not db_firestore:
+        raise HTTPException(status_code=503, detail="Database service unavailable")
+
+    session_doc, data = await load_owned_session(user_id, session_id)
+    etag = snapshot_etag([session_doc], offset, limit)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    try:
+        messages, total = await deadlines.to_thread(
+            transcript_store.read_turns, db_firestore, session_doc.reference, data, offset, limit
+        )
+    except transcript_store.TranscriptUnavailable as e:
+        logger.error(str(e))
+        raise HTTPException(status_code=404, detail="Part of this transcript is missing")
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = HISTORY_CACHE_CONTROL
+    return {
+        "messages": messages,
+        "total_turns": total,
+        "next_offset": offset + len(messages) if offset + len(messages) < total else None
+    }
+
+
+@app.get(
+    "/users/{user_id}/quizzes",
+    response_model=QuizPageResponse,
+    dependencies=[Depends(require_owner)]
+)
+async def list_quizzes(
+    user_id: str,
+    response: Response,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
+):
+    """AI quizzes, newest first, as summaries with a cursor for the next page."""
+    if not db_firestore:
+        raise HTTPException(status_code=503, detail="Database service unavailable")
+
+    query = (
+        db_firestore.collection("users").document(user_id).collection("ai_quizzes")
+        .select(QUIZ_SUMMARY_FIELDS)
+    )
+    snapshots = await get_loader(db_firestore).query(keyset_page(query, "created_at", limit, cursor))
+    page = snapshots[:limit]
+
+    etag = snapshot_etag(page, "quizzes", user_id, cursor, limit)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+
+    items = [{"id": snapshot.id, **(snapshot.to_dict() or {})} for snapshot in page]
+    next_cursor = None
+    if len(snapshots) > limit:
+        next_cursor = encode_cursor(page[-1].get("created_at"), page[-1].id)
+
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = HISTORY_CACHE_CONTROL
+    return {"items": items, "next_cursor": next_cursor}
+
+
+@app.get(
+    "/users/{user_id}/quizzes/{quiz_id}",
+    response_model=QuizDetailResponse,
+    dependencies=[Depends(require_owner)]
+)
+async def get_quiz(
+    user_id: str,
+    quiz_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
+):
+    """Full quiz document including questions, responses and scores."""
+    if not db_firestore:
+        raise HTTPException(status_code=503, detail="Database service unavailable")
+
+    quiz_ref = db_firestore.collection("users").document(user_id).collection("ai_quizzes").document(quiz_id)
+    quiz_doc = await load_document(db_firestore, quiz_ref)
+    if not quiz_doc.exists:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+
+    etag = snapshot_etag([quiz_doc])
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = HISTORY_CACHE_CONTROL
+    return {"id": quiz_doc.id, **quiz_doc.to_dict()}
+
+
+# ==================== ADMIN EXPORT ====================
+
+@app.get(
+    "/admin/export/{dataset}",
+    response_class=StreamingResponse,
+    dependencies=[Depends(require_admin_token)]
+)
+async def export_dataset(
+    dataset: Literal["users", "sessions", "quiz_results"],
+    format: Literal["csv", "ndjson"] = "csv",
+    compress: Optional[Literal["zstd"]] = None,
+    page_size: int = Query(500, ge=50, le=2000)
+):
+    """Stream a dataset as CSV or NDJSON, paging through Firestore so memory stays flat."""
+    if not db_firestore:
+        raise HTTPException(status_code=503, detail="Database service unavailable")
+    if compress == "zstd" and export_stream.zstandard is None:
+        raise HTTPException(status_code=400, detail="zstd compression is not available on this server")
+
+    spec = EXPORTS[dataset]
+    query = spec.query(db_firestore).select(sorted(set(spec.fields.values())))
+    media_type, extension = FORMATS[format]
+    filename = f"{dataset}_{datetime.utcnow():%Y%m%d_%H%M%S}.{extension}"
+    if compress == "zstd":
+        media_type, filename = "application/zstd", f"{filename}.zst"
+
+    return StreamingResponse(
+        stream_export(dataset, query, spec, format, compress, page_size),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+
+# ==================== PROGRESS ====================
+
+async def record_progress(user_id: str, mutate) -> None:
+    """Apply an incremental change to the user's progress summary; failures only log, a rebuild repairs them."""
+    try:
+        await asyncio.to_thread(progress_summary.update_summary, db_firestore, user_id, mutate)
+    except Exception as e:
+        logger.warning(f"Could not update progress summary for user {user_id}: {e}")
+
+
+def appended_list_fields(data: Dict[str, Any], transcript: Dict[str, Any],
+                         added: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """List fields for a voice session after `added` turns were appended to its transcript."""
+    fields = {"messageCount": transcript["turns"]}
+    if not data.get("preview"):
+        fields["preview"] = session_list_fields(added)["preview"]
+    return fields
+
+
+@app.post("/voice_sessions/{session_id}/turns", response_model=SessionTurnsResponse)
+async def append_voice_session_turns(
+    session_id: str,
+    request: SessionTurnsRequest,
+    caller: str = Depends(verify_caller)
+):
+    """Append turns to an active voice session's chunked transcript as the conversation goes."""
+    if request.user_id != caller:
+        raise HTTPException(status_code=403, detail="You can only add to your own sessions")
+    if not db_firestore:
+        raise HTTPException(status_code=503, detail="Database service unavailable")
+
+    session_ref = db_firestore.collection("voice_sessions").document(session_id)
+    session_doc = await load_document(db_firestore, session_ref)
+    data = session_doc.to_dict() if session_doc.exists else None
+    if not data or data.get("userId") != request.user_id:
+        raise HTTPException(status_code=404, detail="Session not found")
+    if data.get("status") == "completed":
+        raise HTTPException(status_code=409, detail="Session is already completed")
+
+    try:
+        transcript = await asyncio.to_thread(
+            transcript_store.append_turns, db_firestore, session_ref, request.first_turn, request.turns,
+            appended_list_fields
+        )
+    except transcript_store.TranscriptUnavailable as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"success": True, "session_id": session_id, "turns": transcript.get("turns", 0)}
+
+
+@app.post("/voice_sessions/{session_id}/complete", response_model=SessionCompletionResponse)
+async def complete_voice_session(
+    session_id: str,
+    request: SessionCompletionRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    caller: str = Depends(verify_caller)
+):
+    """Store the summary of a voice session, and the transcript if sent, and update the progress summary."""
+    if request.user_id != caller:
+        raise HTTPException(status_code=403, detail="You can only complete your own sessions")
+    return await idempotency_store.run(
+        f"complete_session:{request.user_id}",
+        idempotency_key,
+        {"session_id": session_id, **request.model_dump()},
+        lambda: _complete_voice_session(session_id, request)
+    )
+
+
+async def _complete_voice_session(session_id: str, request: SessionCompletionRequest):
+    from google.cloud.firestore import DELETE_FIELD
+
+    if not db_firestore:
+        raise HTTPException(status_code=503, detail="Database service unavailable")
+
+    session_ref = db_firestore.collection("voice_sessions").document(session_id)
+    session_doc = await load_document(db_firestore, session_ref)
+    data = session_doc.to_dict() if session_doc.exists else None
+    if not data or data.get("userId") != request.user_id:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    already_completed = data.get("status") == "completed"
+    update = {
+        "status": "completed",
+        "endedAt": data.get("endedAt") if already_completed else datetime.utcnow(),
+        "summary": request.summary,
+        "title": request.title,
+    }
+    # Current clients append turns during the session; older ones send the whole transcript here
+    if request.messages is not None:
+        update["transcript"] = await asyncio.to_thread(
+            transcript_store.write_transcript, db_firestore, session_ref, request.messages, data.get("transcript")
+        )
+        update["messages"] = DELETE_FIELD
+        update.update(session_list_fields(request.messages))
+    await asyncio.to_thread(session_ref.update, update)
+
+    # Only the first completion counts towards totals and the streak
+    if not already_completed:
+        entry = progress_summary.session_entry(session_id, {**data, **update, "messages": request.messages or []})
+        await record_progress(request.user_id, lambda summary: progress_summary.apply_session(summary, entry))
+    return {"success": True, "session_id": session_id}
+
+
+@app.get(
+    "/users/{user_id}/progress",
+    response_model=ProgressResponse,
+    dependencies=[Depends(require_owner)]
+)
+async def get_progress(
+    user_id: str,
+    response: Response,
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match")
+):
+    """The user's materialized progress summary: one document read, built from history on first use."""
+    if not db_firestore:
+        raise HTTPException(status_code=503, detail="Database service unavailable")
+
+    summary_doc = await load_document(db_firestore, db_firestore.collection(progress_summary.COLLECTION).document(user_id))
+    summary = summary_doc.to_dict() if summary_doc.exists else None
+    if not summary or summary.get("version") != progress_summary.SUMMARY_VERSION:
+        summary = await asyncio.to_thread(progress_summary.rebuild_summary, db_firestore, user_id)
+
+    today = datetime.utcnow().date()
+    etag = snapshot_etag([], "progress", user_id, summary.get("updated_at"), today)
+    if etag_matches(if_none_match, etag):
+        return not_modified(etag)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = HISTORY_CACHE_CONTROL
+    return {**summary, "current_streak": progress_summary.effective_streak(summary, today)}
+
+
+@app.post(
+    "/users/{user_id}/progress/rebuild",
+    response_model=JobAcceptedResponse,
+    status_code=status.HTTP_202_ACCEPTED,
+    dependencies=[Depends(require_admin_token)]
+)
+async def rebuild_progress(user_id: str):
+    """Queue a recompute of a user's progress summary from their sessions and quizzes."""
+    if not db_firestore:
+        raise HTTPException(status_code=503, detail="Database service unavailable")
+    job_id = await job_runner.submit("progress_rebuild", {"user_id": user_id}, dedupe_key=f"progress_rebuild:{user_id}")
+    return {"job_id": job_id, "status_url": f"/jobs/{job_id}"}
+
+
+@app.get("/admin/loop-offenders", response_model=List[LoopOffender], dependencies=[Depends(require_admin_token)])
+async def get_loop_offenders(limit: int = Query(20, ge=1, le=100)):
+    """Code that recently blocked this worker's event loop, newest first, with its captured stack."""
+    if not LOOP_OFFENDERS_ENDPOINT:
+        raise HTTPException(status_code=404, detail="Not found")
+    return loop_monitor.offenders(limit)
+
+
+@app.get("/admin/token-usage", response_model=TokenUsageResponse, dependencies=[Depends(require_admin_token)])
+async def get_token_usage(
+    hours: int = Query(24, ge=1, le=24 * 90),
+    group_by: Literal["user_id", "endpoint", "profile", "model"] = "user_id",
+    limit: int = Query(20, ge=1, le=200),
+    user_id: Optional[str] = None,
+    endpoint: Optional[str] = None,
+    profile: Optional[str] = None,
+    model: Optional[str] = None
+):
+    """Top LLM consumers and hourly totals over the last `hours`, from the token ledger's rollups.
+
+    Filters narrow both, e.g. `endpoint=/voice_chat/&group_by=user_id` for the heaviest voice chat users.
+    """
+    # Include this worker's buffered calls; other workers' show up within a flush interval
+    await token_ledger.flush()
+    since = time.time() - hours * 3600
+    where = dict(zip(GROUP_COLUMNS, (user_id, endpoint, profile, model)))
+    top, trend = await asyncio.gather(
+        asyncio.to_thread(token_ledger.top, since, group_by, limit, where),
+        asyncio.to_thread(token_ledger.trend, since, where)
+    )
+    return {"since": since, "group_by": group_by, "top": top, "trend": trend}
+
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job(job_id: str):
+    """Status of a background job; the ID is the only handle, so payloads are never returned."""
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"job_id": job["id"], **{field: job[field] for field in JobStatusResponse.model_fields if field in job}}
+
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.detail},
+        headers=getattr(exc, "headers", None),
     )
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     logger.error(f"Unhandled exception: {str(exc)}", exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=500,
         content={"detail": "An internal server error occurred"},
     )
 # Error handlers
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request, exc):
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content={"detail": exc.detail},
+        headers=getattr(exc, "headers", None),
     )
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request, exc):
     logger.error(f"Unhandled exception: {str(exc)}", exc_info=True)
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
         content={"detail": "Internal server error"},
     )
@@ -914,23 +2432,19 @@ class DeletionEmailRequest(BaseModel):
     deletionToken: str
     confirmationUrl: str
 
-@app.post("/send-deletion-email")
+@app.post("/send-deletion-email", response_model=EmailSentResponse, status_code=status.HTTP_202_ACCEPTED)
 async def send_deletion_email_endpoint(request: DeletionEmailRequest):
-    """Send account deletion confirmation email to user."""
+    """Queue the account deletion confirmation email; it is retried until SMTP accepts it."""
+    if not email_configured():
+        logger.error("EMAIL_PASSWORD not set in environment")
+        raise HTTPException(status_code=503, detail="Email service unavailable")
     try:
-        success = send_deletion_email(
-            email=request.email,
-            display_name=request.displayName,
-            confirmation_url=request.confirmationUrl
-        )
-        
-        if success:
-            return {"success": True, "message": "Deletion confirmation email sent successfully"}
-        else:
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to send deletion confirmation email"
-            )
+        job_id = await job_runner.submit("deletion_email", {
+            "email": request.email,
+            "display_name": request.displayName,
+            "confirmation_url": request.confirmationUrl
+        }, dedupe_key=f"deletion_email:{request.userId}:{request.deletionToken}")
+        return {"success": True, "message": "Deletion confirmation email queued", "job_id": job_id}
     except Exception as e:
         logger.error(f"Error in send_deletion_email_endpoint: {str(e)}")
         raise HTTPException(
@@ -938,12 +2452,12 @@ async def send_deletion_email_endpoint(request: DeletionEmailRequest):
             detail=f"Failed to send deletion confirmation email: {str(e)}"
         )
 
-@app.get("/confirm-deletion")
+@app.get("/confirm-deletion", response_model=EndpointStatusResponse)
 async def get_confirm_deletion(request: Request):
     """Return a simple response for the GET request to the confirmation page."""
     return {"message": "Deletion confirmation endpoint ready", "status": "ok"}
 
-@app.post("/confirm-deletion")
+@app.post("/confirm-deletion", response_model=AccountDeletionResponse, status_code=status.HTTP_202_ACCEPTED)
 async def confirm_account_deletion(request: Request):
     """Confirm and process account deletion after email verification."""
     try:
@@ -965,7 +2479,7 @@ async def confirm_account_deletion(request: Request):
             )
         
         deletion_request_ref = db_firestore.collection("deletionRequests").document(uid)
-        deletion_request_doc = deletion_request_ref.get()
+        deletion_request_doc = await load_document(db_firestore, deletion_request_ref)
         
         if not deletion_request_doc.exists:
             raise HTTPException(
@@ -1000,20 +2514,14 @@ async def confirm_account_deletion(request: Request):
             "confirmedAt": time.time() * 1000
         })
         
-        # Actually delete the user account and all associated data
-        success = await delete_user_account(uid)
-        
-        if success:
-            return {
-                "success": True,
-                "message": "Account and all associated data have been successfully deleted.",
-                "userId": uid
-            }
-        else:
-            raise HTTPException(
-                status_code=500,
-                detail="Failed to delete user account"
-            )
+        # Deleting every collection can take a while; the client polls /jobs/{job_id}
+        job_id = await job_runner.submit("account_deletion", {"uid": uid}, dedupe_key=f"account_deletion:{uid}")
+        return {
+            "success": True,
+            "message": "Account deletion is in progress.",
+            "userId": uid,
+            "job_id": job_id
+        }
         
     except Exception as e:
         logger.error(f"Error in confirm_account_deletion: {str(e)}")
@@ -1245,109 +2753,211 @@ async def delete_user_account(uid: str) -> bool:
             return result[0], "success"
         
         # Get user data before deletion to access email
+        loader = get_loader(db_firestore)
         try:
             user_ref = db_firestore.collection("users").document(uid)
-            user_doc = user_ref.get()
+            user_doc = await loader.load(user_ref)
         except Exception as e:
             logger.error(f"Error accessing user document for deletion {uid}: {str(e)}")
             return False
         
-        if user_doc.exists:
-            user_data = user_doc.to_dict()
-            user_email = user_data.get("email", "")
-            
-            # Delete user's subcollections (like ai_quizzes)
+        # A job that was interrupted and reclaimed finds the user document already gone; every
+        # step below is safe to repeat, so carry on and finish the rest
+        if not user_doc.exists:
+            logger.warning(f"User document {uid} already deleted, finishing the remaining deletion steps")
+        user_email = (user_doc.to_dict() or {}).get("email", "") if user_doc.exists else ""
+        
+        # Read everything that has to be deleted concurrently; errors are handled per collection below
+        quizzes_docs, voice_sessions_docs, guided_sessions_docs = await asyncio.gather(
+            loader.query(user_ref.collection("ai_quizzes")),
+            loader.query(db_firestore.collection("voice_sessions").where("userId", "==", uid).limit(1000)),  # Limit to avoid timeout
+            loader.query(db_firestore.collection("guidedSessions").where("userId", "==", uid).limit(1000)),
+            return_exceptions=True
+        )
+        
+        # The deletes below are blocking Firestore calls; they run in a thread so the job doesn't hold the loop
+        def delete_docs(docs):
+            for doc in docs:
+                doc.reference.delete()
+        
+        def delete_voice_sessions(docs):
+            for session_doc in docs:
+                if transcript_store.storage_of(session_doc.to_dict() or {}) != "inline":
+                    transcript_store.delete_transcript(db_firestore, session_doc.reference)
+                session_doc.reference.delete()
+        
+        # Delete user's subcollections (like ai_quizzes)
+        try:
+            if isinstance(quizzes_docs, Exception):
+                raise quizzes_docs
+            await asyncio.to_thread(delete_docs, quizzes_docs)
+        except Exception as quiz_error:
+            logger.warning(f"Could not delete ai_quizzes for user {uid}: {str(quiz_error)}")
+        
+        # Delete from registeredEmails if exists; before the user document, which is the only record of the email
+        if user_email:
             try:
-                ai_quizzes_ref = user_ref.collection("ai_quizzes")
-                quizzes_docs = ai_quizzes_ref.get()
-                for quiz_doc in quizzes_docs:
-                    quiz_doc.reference.delete()
-            except Exception as quiz_error:
-                logger.warning(f"Could not delete ai_quizzes for user {uid}: {str(quiz_error)}")
-            
-            # Delete the main user document
+                email_key = user_email.lower().strip()
+                registered_email_ref = db_firestore.collection("registeredEmails").document(email_key)
+                await asyncio.to_thread(registered_email_ref.delete)
+            except Exception as email_error:
+                logger.warning(f"Could not delete registered email for user {uid}: {str(email_error)}")
+        
+        # Delete the main user document
+        if user_doc.exists:
             try:
-                user_ref.delete()
+                await asyncio.to_thread(user_ref.delete)
             except Exception as user_error:
                 logger.warning(f"Could not delete main user document {uid}: {str(user_error)}")
                 # If we can't delete the main document, return False
                 return False
-            
-            # Delete from registeredEmails if exists
-            if user_email:
+        
+        # Delete any deletion requests for this user
+        try:
+            deletion_request_ref = db_firestore.collection("deletionRequests").document(uid)
+            await asyncio.to_thread(deletion_request_ref.delete)
+        except Exception as deletion_error:
+            logger.warning(f"Could not delete deletion request for user {uid}: {str(deletion_error)}")
+        
+        # Delete the materialized progress summary
+        try:
+            await asyncio.to_thread(db_firestore.collection(progress_summary.COLLECTION).document(uid).delete)
+        except Exception as progress_error:
+            logger.warning(f"Could not delete progress summary for user {uid}: {str(progress_error)}")
+        
+        # Delete user's voice sessions - with specific error handling for JWT issues
+        try:
+            if isinstance(voice_sessions_docs, Exception):
+                raise voice_sessions_docs
+            await asyncio.to_thread(delete_voice_sessions, voice_sessions_docs)
+            logger.info(f"Deleted voice sessions for user {uid}")
+        except Exception as voice_error:
+            # Check if this is an authentication/JWT error
+            error_str = str(voice_error).lower()
+            if "invalid_grant" in error_str or "jwt" in error_str or "auth" in error_str:
+                logger.warning(f"Authentication error deleting voice sessions for user {uid}, skipping: {str(voice_error)}")
+            else:
+                logger.warning(f"Could not delete voice sessions for user {uid}: {str(voice_error)}")
+        
+        # Delete user's guided sessions - with specific error handling for JWT issues
+        try:
+            if isinstance(guided_sessions_docs, Exception):
+                raise guided_sessions_docs
+            await asyncio.to_thread(delete_docs, guided_sessions_docs)
+            logger.info(f"Deleted guided sessions for user {uid}")
+        except Exception as guided_error:
+            # Check if this is an authentication/JWT error
+            error_str = str(guided_error).lower()
+            if "invalid_grant" in error_str or "jwt" in error_str or "auth" in error_str:
+                logger.warning(f"Authentication error deleting guided sessions for user {uid}, skipping: {str(guided_error)}")
+            else:
+                logger.warning(f"Could not delete guided sessions for user {uid}: {str(guided_error)}")
+        
+        # Try to delete Firebase Auth user (this will work for both email/password and Google users)
+        try:
+            if firebase_admin_app:  # Only try if Firebase Admin SDK was initialized successfully
+                from firebase_admin import auth
                 try:
-                    email_key = user_email.lower().strip()
-                    registered_email_ref = db_firestore.collection("registeredEmails").document(email_key)
-                    registered_email_ref.delete()
-                except Exception as email_error:
-                    logger.warning(f"Could not delete registered email for user {uid}: {str(email_error)}")
-            
-            # Delete any deletion requests for this user
-            try:
-                deletion_request_ref = db_firestore.collection("deletionRequests").document(uid)
-                deletion_request_ref.delete()
-            except Exception as deletion_error:
-                logger.warning(f"Could not delete deletion request for user {uid}: {str(deletion_error)}")
-            
-            # Delete user's voice sessions - with specific error handling for JWT issues
-            try:
-                from google.cloud.firestore import Query
-                voice_sessions_query = db_firestore.collection("voice_sessions").where("userId", "==", uid).limit(1000)  # Limit to avoid timeout
-                voice_sessions_docs = voice_sessions_query.get()
-                for session_doc in voice_sessions_docs:
-                    session_doc.reference.delete()
-                logger.info(f"Deleted voice sessions for user {uid}")
-            except Exception as voice_error:
-                # Check if this is an authentication/JWT error
-                error_str = str(voice_error).lower()
-                if "invalid_grant" in error_str or "jwt" in error_str or "auth" in error_str:
-                    logger.warning(f"Authentication error deleting voice sessions for user {uid}, skipping: {str(voice_error)}")
-                else:
-                    logger.warning(f"Could not delete voice sessions for user {uid}: {str(voice_error)}")
-            
-            # Delete user's guided sessions - with specific error handling for JWT issues
-            try:
-                guided_sessions_query = db_firestore.collection("guidedSessions").where("userId", "==", uid).limit(1000)  # Limit to avoid timeout
-                guided_sessions_docs = guided_sessions_query.get()
-                for session_doc in guided_sessions_docs:
-                    session_doc.reference.delete()
-                logger.info(f"Deleted guided sessions for user {uid}")
-            except Exception as guided_error:
-                # Check if this is an authentication/JWT error
-                error_str = str(guided_error).lower()
-                if "invalid_grant" in error_str or "jwt" in error_str or "auth" in error_str:
-                    logger.warning(f"Authentication error deleting guided sessions for user {uid}, skipping: {str(guided_error)}")
-                else:
-                    logger.warning(f"Could not delete guided sessions for user {uid}: {str(guided_error)}")
-            
-            # Try to delete Firebase Auth user (this will work for both email/password and Google users)
-            try:
-                if firebase_admin_app:  # Only try if Firebase Admin SDK was initialized successfully
-                    from firebase_admin import auth
-                    auth.delete_user(uid)
+                    await asyncio.to_thread(auth.delete_user, uid)
                     logger.info(f"Firebase Auth user {uid} deleted successfully")
-                else:
-                    logger.warning(f"Firebase Admin SDK not initialized, skipping auth deletion for user {uid}")
-            except Exception as auth_error:
-                logger.warning(f"Could not delete Firebase Auth user {uid}: {str(auth_error)}")
-                # Continue with deletion even if Firebase Auth deletion fails
-            
-            logger.info(f"User account {uid} and all associated data deleted successfully")
-            return True
-        else:
-            logger.warning(f"User document not found for deletion: {uid}")
-            return False
+                except auth.UserNotFoundError:
+                    logger.info(f"Firebase Auth user {uid} was already deleted")
+            else:
+                logger.warning(f"Firebase Admin SDK not initialized, skipping auth deletion for user {uid}")
+        except Exception as auth_error:
+            logger.warning(f"Could not delete Firebase Auth user {uid}: {str(auth_error)}")
+            # Continue with deletion even if Firebase Auth deletion fails
+        
+        logger.info(f"User account {uid} and all associated data deleted successfully")
+        return True
             
     except Exception as e:
         logger.error(f"Error deleting user account {uid}: {str(e)}")
         return False
 
+# ==================== JOBS ====================
+
+async def account_deletion_job(payload: Dict[str, Any]):
+    if not await delete_user_account(payload["uid"]):
+        raise RuntimeError("Account deletion failed")
+
+
+def email_configured() -> bool:
+    return bool(os.getenv("EMAIL_PASSWORD") and os.getenv("EMAIL_USER", "talkbuddyai@gmail.com"))
+
+
+async def deletion_email_job(payload: Dict[str, Any]):
+    if not email_configured():
+        raise PermanentJobError("Email is not configured (EMAIL_USER/EMAIL_PASSWORD)")
+    if not await asyncio.to_thread(send_deletion_email, **payload):
+        raise RuntimeError("Deletion confirmation email was not sent")
+
+
+async def quiz_results_email_job(payload: Dict[str, Any]):
+    if not email_configured():
+        raise PermanentJobError("Email is not configured (EMAIL_USER/EMAIL_PASSWORD)")
+    if not await asyncio.to_thread(send_quiz_results_email, **payload):
+        raise RuntimeError("Quiz results email was not sent")
+
+
+async def progress_rebuild_job(payload: Dict[str, Any]):
+    if not db_firestore:
+        raise RuntimeError("Database service unavailable")
+    summary = await asyncio.to_thread(progress_summary.rebuild_summary, db_firestore, payload["user_id"])
+    return {"session_count": summary["session_count"], "quiz_count": summary["quiz_count"]}
+
+
+# Concurrency is per worker process and max_running across all of them; leases outlast the slowest
+# expected run so live jobs aren't reclaimed
+job_runner.register(JobType("account_deletion", account_deletion_job, max_attempts=5, base_delay=30, lease_seconds=600))
+job_runner.register(JobType("deletion_email", deletion_email_job, max_attempts=6, base_delay=10, lease_seconds=120))
+job_runner.register(JobType("quiz_results_email", quiz_results_email_job, concurrency=max(1, 4 // WORKER_COUNT),
+                            max_running=4, max_attempts=6, base_delay=10, lease_seconds=120))
+job_runner.register(JobType("progress_rebuild", progress_rebuild_job, max_attempts=3, base_delay=5, lease_seconds=300))
+
+
+def preload_shared_state():
+    """Prepare state shared by all workers before they are spawned."""
+    shared_store.initialize()
+    job_queue.initialize()
+    token_ledger.initialize()
+    for key, _ in shared_store.items("worker:"):
+        shared_store.delete(key)
+
+
 if __name__ == "__main__":
+    import argparse
     import uvicorn
-    uvicorn.run(
-        "main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        log_level="info"
-    )
\ No newline at end of file
+
+    parser = argparse.ArgumentParser(description="Run the TalkBuddy AI API server")
+    parser.add_argument("--production", action="store_true",
+                        default=os.getenv("TALKBUDDY_ENV", "").lower() == "production",
+                        help="multi-worker mode without auto-reload (or set TALKBUDDY_ENV=production)")
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("WEB_CONCURRENCY", str(os.cpu_count() or 1))),
+                        help="worker processes in production mode (default: WEB_CONCURRENCY or CPU count)")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    args = parser.parse_args()
+
+    if args.production:
+        # Workers are spawned fresh and read these settings from the environment
+        os.environ["TALKBUDDY_WORKERS"] = str(args.workers)
+        preload_shared_state()
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            workers=args.workers,
+            log_level="info",
+            timeout_keep_alive=5,
+            timeout_graceful_shutdown=int(DRAIN_TIMEOUT_SECONDS)
+        )
+    else:
+        uvicorn.run(
+            "main:app",
+            host=args.host,
+            port=args.port,
+            reload=True,
+            log_level="info"
+        )
\ No newline at end of file
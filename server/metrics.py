@@ -0,0 +1,120 @@
+# server/metrics.py
+from typing import Any, Callable, Dict, Iterable, Set
+from collections import deque
+import asyncio
+import bisect
+import threading
+import logging
+
+logger = logging.getLogger(__name__)
+
+_providers: Dict[str, Callable[[], Dict[str, Any]]] = {}
+# Providers that read SQLite (the shared store, the job queue), which can wait on another worker's lock
+_blocking: Set[str] = set()
+
+
+class Counter:
+    """Thread-safe monotonically increasing counter."""
+
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> int:
+        return self._value
+
+
+def _rank(values, q: float) -> float:
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+
+class Samples:
+    """Thread-safe window of the most recent observations, summarized as percentiles."""
+
+    def __init__(self, size: int = 1000):
+        self._values = deque(maxlen=size)
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._values.append(value)
+            self._count += 1
+
+    def percentile(self, q: float) -> float:
+        with self._lock:
+            values = sorted(self._values)
+        return _rank(values, q) if values else 0.0
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            values = sorted(self._values)
+            count = self._count
+        if not values:
+            return {"count": count}
+        return {
+            "count": count,
+            "avg": round(sum(values) / len(values), 2),
+            "p50": round(_rank(values, 50), 2),
+            "p95": round(_rank(values, 95), 2),
+            "max": round(values[-1], 2),
+        }
+
+
+class Histogram:
+    """Thread-safe counts of every observation in fixed buckets; a value lands in the first bucket whose bound it doesn't exceed."""
+
+    def __init__(self, bounds: Iterable[float]):
+        self.bounds = sorted(bounds)
+        self._counts = [0] * (len(self.bounds) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        with self._lock:
+            self._counts[bisect.bisect_left(self.bounds, value)] += 1
+            self._sum += value
+
+    def summary(self) -> Dict[str, Any]:
+        with self._lock:
+            counts, total = list(self._counts), self._sum
+        buckets = {f"le_{bound:g}": count for bound, count in zip(self.bounds, counts)}
+        buckets["inf"] = counts[-1]
+        return {"count": sum(counts), "sum": round(total, 2), "buckets": buckets}
+
+
+def register(name: str, provider: Callable[[], Dict[str, Any]], blocking: bool = False):
+    """Register a callable whose dict output is published under `name` on /metrics.
+
+    Providers that read a database pass `blocking=True`; `collect` runs them in a thread.
+    """
+    _providers[name] = provider
+    if blocking:
+        _blocking.add(name)
+    else:
+        _blocking.discard(name)
+
+
+def _read(name: str) -> Dict[str, Any]:
+    try:
+        return _providers[name]()
+    except Exception as e:
+        logger.warning(f"Metrics provider {name} failed: {str(e)}")
+        return {"error": str(e)}
+
+
+def snapshot() -> Dict[str, Any]:
+    """Collect the current value of every registered metrics provider."""
+    return {name: _read(name) for name in _providers}
+
+
+async def collect() -> Dict[str, Any]:
+    """Like snapshot(), but blocking providers run in a thread so the event loop never waits on a database lock."""
+    names = [name for name in _providers if name in _blocking]
+    blocking = await asyncio.to_thread(lambda: {name: _read(name) for name in names})
+    return {name: blocking[name] if name in blocking else _read(name) for name in _providers}
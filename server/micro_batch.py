@@ -0,0 +1,133 @@
+# server/micro_batch.py
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+import asyncio
+import logging
+import os
+import time
+
+from metrics import Counter, Samples
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BATCH = int(os.getenv("EVAL_BATCH_MAX_SIZE", "8"))
+DEFAULT_MAX_WAIT_MS = float(os.getenv("EVAL_BATCH_MAX_WAIT_MS", "25"))
+
+
+class MicroBatcher:
+    """Collects requests from concurrent callers and dispatches them together.
+
+    A batch is sent when it reaches `max_batch` items or `max_wait` seconds
+    after its first item arrived, whichever comes first. `dispatch` takes
+    the list of items and returns one result per item, in order; if it
+    raises, every caller in the batch gets the exception. With `max_batch`
+    1 or `max_wait` 0 each item is dispatched on its own straight away.
+    """
+
+    def __init__(self, name: str, dispatch: Callable[[List[Any]], Awaitable[List[Any]]],
+                 max_batch: int = DEFAULT_MAX_BATCH, max_wait: float = DEFAULT_MAX_WAIT_MS / 1000):
+        self.name = name
+        self.dispatch = dispatch
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait)
+        self._pending: List[Tuple[Any, asyncio.Future, float]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+        self.batches = Counter()
+        self.items = Counter()
+        self.failed_batches = Counter()
+        self.flushes = {"full": Counter(), "timeout": Counter()}
+        self.batch_size = Samples()
+        self.wait_ms = Samples()
+        self.dispatch_ms = Samples()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_batch > 1 and self.max_wait > 0
+
+    async def submit(self, item: Any) -> Any:
+        """Add an item to the next batch and wait for its result."""
+        if not self.enabled:
+            return (await self._run([(item, None, time.perf_counter())]))[0]
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, future, time.perf_counter()))
+        if len(self._pending) >= self.max_batch:
+            self._flush("full")
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.max_wait, self._flush, "timeout")
+        return await future
+
+    def _flush(self, reason: str):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        # Callers that gave up (timeouts, disconnects) are dropped before dispatch
+        batch = [entry for entry in self._pending if not entry[1].done()]
+        self._pending = []
+        if not batch:
+            return
+        self.flushes[reason].inc()
+        task = asyncio.create_task(self._deliver(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _deliver(self, batch: List[Tuple[Any, asyncio.Future, float]]):
+        try:
+            results = await self._run(batch)
+        except Exception as e:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future, _), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _run(self, batch: List[Tuple[Any, Optional[asyncio.Future], float]]) -> List[Any]:
+        started = time.perf_counter()
+        for _, _, enqueued in batch:
+            self.wait_ms.observe((started - enqueued) * 1000)
+        self.batches.inc()
+        self.items.inc(len(batch))
+        self.batch_size.observe(len(batch))
+        try:
+            results = await self.dispatch([item for item, _, _ in batch])
+        except Exception:
+            self.failed_batches.inc()
+            raise
+        finally:
+            self.dispatch_ms.observe((time.perf_counter() - started) * 1000)
+        if len(results) != len(batch):
+            self.failed_batches.inc()
+            raise RuntimeError(f"{self.name} batch returned {len(results)} results for {len(batch)} items")
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": round(self.max_wait * 1000, 1),
+            "pending": len(self._pending),
+            "batches": self.batches.value,
+            "items": self.items.value,
+            "failed_batches": self.failed_batches.value,
+            "flushes": {reason: counter.value for reason, counter in self.flushes.items()},
+            "batch_size": self.batch_size.summary(),
+            "added_wait_ms": self.wait_ms.summary(),
+            "dispatch_ms": self.dispatch_ms.summary(),
+        }
+
+
+def split_result(result: Any) -> List[Any]:
+    """Split a langchain LLMResult for several prompts into one single-prompt result per prompt."""
+    from langchain_core.outputs import LLMResult
+
+    return [LLMResult(generations=[generations], llm_output=result.llm_output) for generations in result.generations]
+
+
+def model_batcher(name: str, model: Any, **kwargs) -> MicroBatcher:
+    """A batcher that sends each batch of message lists to `model` in a single `agenerate` call."""
+
+    async def dispatch(prompts: List[List[Any]]) -> List[Any]:
+        return split_result(await model.agenerate(prompts))
+
+    return MicroBatcher(name, dispatch, **kwargs)
+
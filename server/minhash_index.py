@@ -0,0 +1,134 @@
+# server/minhash_index.py
+from typing import Dict, Hashable, Iterable, List, Optional, Set, Tuple
+import hashlib
+import random
+import re
+import struct
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+
+def normalize_text(text: str) -> str:
+    """Lowercase and strip punctuation so trivial variations compare equal."""
+    return " ".join(_WORD_RE.findall(text.lower()))
+
+
+def word_shingles(text: str, size: int = 3) -> Set[str]:
+    words = normalize_text(text).split()
+    if len(words) <= size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def char_shingles(text: str, size: int = 4) -> Set[str]:
+    normalized = normalize_text(text)
+    if len(normalized) <= size:
+        return {normalized} if normalized else set()
+    return {normalized[i:i + size] for i in range(len(normalized) - size + 1)}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class MinHasher:
+    """MinHash signatures from universal hashing of 32-bit shingle hashes."""
+
+    def __init__(self, num_perm: int = 64, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self._params = [
+            (rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME))
+            for _ in range(num_perm)
+        ]
+
+    def signature(self, shingles: Iterable[str]) -> Tuple[int, ...]:
+        hashes = [
+            struct.unpack("<I", hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest())[0]
+            for s in shingles
+        ]
+        if not hashes:
+            return tuple([_MAX_HASH] * self.num_perm)
+        return tuple(
+            min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes)
+            for a, b in self._params
+        )
+
+    @staticmethod
+    def similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class MinHashIndex:
+    """Locality-sensitive index answering "is there a stored text similar to this one?".
+
+    Signatures are split into `bands` bands; two texts become candidates when
+    any band matches exactly, and candidates are then confirmed with the
+    estimated Jaccard similarity. With 64 permutations in 16 bands, pairs
+    above ~0.6 similarity are found with high probability.
+    """
+
+    def __init__(self, num_perm: int = 64, bands: int = 16, shingle: str = "word", shingle_size: int = 3):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.hasher = MinHasher(num_perm)
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+        self._shingle = word_shingles if shingle == "word" else char_shingles
+        self._buckets: List[Dict[Tuple[int, ...], Set[Hashable]]] = [{} for _ in range(bands)]
+        self._signatures: Dict[Hashable, Tuple[int, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._signatures
+
+    def signature(self, text: str) -> Tuple[int, ...]:
+        return self.hasher.signature(self._shingle(text, self.shingle_size))
+
+    def _bands(self, sig: Tuple[int, ...]):
+        for i in range(self.bands):
+            yield i, sig[i * self.rows:(i + 1) * self.rows]
+
+    def add(self, key: Hashable, text: str, sig: Optional[Tuple[int, ...]] = None):
+        if key in self._signatures:
+            self.remove(key)
+        sig = sig or self.signature(text)
+        self._signatures[key] = sig
+        for i, band in self._bands(sig):
+            self._buckets[i].setdefault(band, set()).add(key)
+
+    def remove(self, key: Hashable):
+        sig = self._signatures.pop(key, None)
+        if sig is None:
+            return
+        for i, band in self._bands(sig):
+            bucket = self._buckets[i].get(band)
+            if bucket:
+                bucket.discard(key)
+                if not bucket:
+                    del self._buckets[i][band]
+
+    def query(self, text: str, threshold: float = 0.7, sig: Optional[Tuple[int, ...]] = None) -> List[Tuple[Hashable, float]]:
+        """Return (key, similarity) for stored texts at or above `threshold`, best first."""
+        sig = sig or self.signature(text)
+        candidates: Set[Hashable] = set()
+        for i, band in self._bands(sig):
+            candidates |= self._buckets[i].get(band, set())
+        matches = []
+        for key in candidates:
+            score = MinHasher.similarity(sig, self._signatures[key])
+            if score >= threshold:
+                matches.append((key, score))
+        matches.sort(key=lambda m: m[1], reverse=True)
+        return matches
+
+    def best_match(self, text: str, threshold: float = 0.7, sig: Optional[Tuple[int, ...]] = None) -> Optional[Tuple[Hashable, float]]:
+        matches = self.query(text, threshold, sig)
+        return matches[0] if matches else None
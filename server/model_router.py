@@ -0,0 +1,157 @@
+# server/model_router.py
+from typing import Any, Dict, List, Optional, Tuple
+from collections import deque
+from contextvars import ContextVar
+import logging
+import os
+import threading
+import time
+
+from metrics import Counter
+import generation_profiles
+
+logger = logging.getLogger(__name__)
+
+WINDOW_SECONDS = float(os.getenv("LLM_ROUTER_WINDOW_SECONDS", "60"))
+MIN_SAMPLES = int(os.getenv("LLM_ROUTER_MIN_SAMPLES", "5"))
+QUEUE_LIMIT = int(os.getenv("LLM_FALLBACK_QUEUE_DEPTH", "8"))
+
+# Models used while handling the current request, for the X-LLM-Model header
+current_models: ContextVar[Optional[List[str]]] = ContextVar("llm_models", default=None)
+
+
+class LatencyWindow:
+    """Generation latencies observed in the last `window` seconds."""
+
+    def __init__(self, window: float = WINDOW_SECONDS):
+        self.window = window
+        self._samples = deque()
+        self._lock = threading.Lock()
+
+    def _trim(self, now: float):
+        while self._samples and self._samples[0][0] < now - self.window:
+            self._samples.popleft()
+
+    def observe(self, ms: float):
+        now = time.monotonic()
+        with self._lock:
+            self._samples.append((now, ms))
+            self._trim(now)
+
+    def p95(self) -> Tuple[Optional[float], int]:
+        """The window's p95 and sample count; None when there are too few samples to judge."""
+        with self._lock:
+            self._trim(time.monotonic())
+            values = sorted(ms for _, ms in self._samples)
+        if len(values) < MIN_SAMPLES:
+            return None, len(values)
+        return values[min(len(values) - 1, int(0.95 * len(values)))], len(values)
+
+
+class ModelRouter:
+    """Picks the model for each generation from its task's profile.
+
+    A profile's primary model is used unless its p95 over the last
+    `WINDOW_SECONDS` is above the profile's `p95_budget_ms`, or at least
+    `QUEUE_LIMIT` generations are waiting for the scheduler; then its
+    `fallback_model` is used. Routed-away primaries get no new samples, so
+    once their slow samples age out of the window the primary is tried
+    again.
+    """
+
+    def __init__(self, queue_limit: int = QUEUE_LIMIT):
+        self.queue_limit = queue_limit
+        self.latency: Dict[Tuple[str, str], LatencyWindow] = {}
+        self.routed: Dict[Tuple[str, str, str], Counter] = {}
+        self._state: Dict[str, str] = {}
+
+    def _window(self, profile: str, model: str) -> LatencyWindow:
+        key = (profile, model)
+        if key not in self.latency:
+            self.latency[key] = LatencyWindow()
+        return self.latency[key]
+
+    def choose(self, profile_name: str, queued: int = 0) -> str:
+        profile = generation_profiles.get_profile(profile_name)
+        reason = "primary"
+        if profile.fallback_model:
+            p95, _ = self._window(profile_name, profile.model).p95()
+            if queued >= self.queue_limit:
+                reason = "queue"
+            elif p95 is not None and p95 > profile.p95_budget_ms:
+                reason = "p95"
+        model = profile.fallback_model if reason != "primary" else profile.model
+        if self._state.get(profile_name, "primary") != reason:
+            logger.warning(f"Profile {profile_name} now routed to {model} ({reason})")
+            self._state[profile_name] = reason
+        key = (profile_name, model, reason)
+        if key not in self.routed:
+            self.routed[key] = Counter()
+        self.routed[key].inc()
+        return model
+
+    def p95_seconds(self, profile_name: str, model: str) -> Optional[float]:
+        """The model's recent p95 for this profile, or None with too few samples."""
+        p95, _ = self._window(profile_name, model).p95()
+        return p95 / 1000 if p95 is not None else None
+
+    def record(self, profile_name: str, model: str, seconds: float):
+        self._window(profile_name, model).observe(seconds * 1000)
+        self.record_use(model)
+
+    def record_use(self, model: str):
+        """Note that the current request used `model`."""
+        models = current_models.get()
+        if models is not None and model not in models:
+            models.append(model)
+
+    def stats(self) -> Dict[str, Any]:
+        result: Dict[str, Any] = {"queue_limit": self.queue_limit, "window_seconds": WINDOW_SECONDS, "profiles": {}}
+        for name, profile in generation_profiles.PROFILES.items():
+            models = {}
+            for model in filter(None, (profile.model, profile.fallback_model)):
+                p95, samples = self._window(name, model).p95()
+                models[model] = {
+                    "p95_ms": round(p95, 1) if p95 is not None else None,
+                    "samples": samples,
+                    "routed": {reason: counter.value for (p, m, reason), counter in self.routed.items()
+                               if p == name and m == model},
+                }
+            result["profiles"][name] = {
+                "primary": profile.model,
+                "fallback": profile.fallback_model,
+                "p95_budget_ms": profile.p95_budget_ms,
+                "route": self._state.get(name, "primary"),
+                "models": models,
+            }
+        return result
+
+
+class ModelTagMiddleware:
+    """ASGI middleware that reports the models used for a request in an `X-LLM-Model` header."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        models: List[str] = []
+        token = current_models.set(models)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and models:
+                headers = list(message.get("headers", []))
+                headers.append((b"x-llm-model", ",".join(models).encode("latin-1")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_models.reset(token)
+
+
+model_router = ModelRouter()
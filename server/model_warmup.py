@@ -0,0 +1,198 @@
+# server/model_warmup.py
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from datetime import datetime, time as dt_time
+from zoneinfo import ZoneInfo
+import logging
+import os
+import time
+
+from metrics import Counter, Samples
+
+logger = logging.getLogger(__name__)
+
+OLLAMA_HOST = os.getenv("OLLAMA_HOST", "http://localhost:11434").rstrip("/")
+WARMUP_TIMEOUT_SECONDS = float(os.getenv("LLM_WARMUP_TIMEOUT_SECONDS", "180"))
+KEEPALIVE_INTERVAL_SECONDS = int(os.getenv("LLM_KEEPALIVE_INTERVAL_SECONDS", "240"))
+# How long a ping keeps a model loaded; must outlast the ping interval
+KEEPALIVE_DURATION = os.getenv("LLM_KEEPALIVE_DURATION", "10m")
+# "idle" lets models expire after their profile's keep_alive outside the schedule; "unload" frees them at once
+OFF_HOURS_POLICY = os.getenv("LLM_OFF_HOURS_POLICY", "idle")
+# Ollama reports how long it spent loading the model; anything longer than this was a cold start
+COLD_LOAD_SECONDS = 0.5
+
+DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+
+warmups = Counter()
+warmup_failures = Counter()
+pings = Counter()
+ping_failures = Counter()
+unloads = Counter()
+warmup_seconds: Dict[str, float] = {}
+cold_latency_ms: Dict[str, Samples] = {}
+warm_latency_ms: Dict[str, Samples] = {}
+load_ms: Dict[str, Samples] = {}
+
+
+class KeepWarmSchedule:
+    """When models should be kept loaded, e.g. "mon-fri 08:00-20:00; sat-sun 10:00-18:00".
+
+    "always" and "never" are also accepted. Times are in `timezone`; a
+    window whose end is before its start runs past midnight.
+    """
+
+    def __init__(self, spec: str, timezone: str = "UTC"):
+        self.spec = spec.strip().lower()
+        self.timezone = ZoneInfo(timezone)
+        self.windows: List[Tuple[Set[int], dt_time, dt_time]] = []
+        if self.spec not in ("always", "never"):
+            self.windows = [self._parse(part) for part in self.spec.split(";") if part.strip()]
+
+    @classmethod
+    def from_env(cls) -> "KeepWarmSchedule":
+        return cls(
+            os.getenv("LLM_KEEP_WARM_SCHEDULE", "mon-sun 07:00-23:00"),
+            os.getenv("LLM_SCHEDULE_TIMEZONE", "UTC"),
+        )
+
+    @staticmethod
+    def _days(spec: str) -> Set[int]:
+        days: Set[int] = set()
+        for part in spec.split(","):
+            first, _, last = part.partition("-")
+            start, end = DAYS.index(first[:3]), DAYS.index((last or first)[:3])
+            days.update(range(start, end + 1) if start <= end else list(range(start, 7)) + list(range(0, end + 1)))
+        return days
+
+    def _parse(self, part: str) -> Tuple[Set[int], dt_time, dt_time]:
+        try:
+            days, hours = part.split()
+            start, end = hours.split("-")
+            return self._days(days), dt_time.fromisoformat(start), dt_time.fromisoformat(end)
+        except ValueError:
+            raise ValueError(f"Invalid keep-warm window {part!r}; expected e.g. 'mon-fri 08:00-20:00'")
+
+    def active(self, now: Optional[datetime] = None) -> bool:
+        if self.spec in ("always", "never"):
+            return self.spec == "always"
+        now = (now or datetime.now(self.timezone)).astimezone(self.timezone)
+        moment, day = now.time(), now.weekday()
+        for days, start, end in self.windows:
+            if start <= end:
+                if day in days and start <= moment < end:
+                    return True
+            elif (day in days and moment >= start) or ((day - 1) % 7 in days and moment < end):
+                return True
+        return False
+
+
+schedule = KeepWarmSchedule.from_env()
+
+
+async def _load(session, model: str, keep_alive: str, timeout: float) -> Dict[str, Any]:
+    """Ask Ollama to load `model` (or unload it with keep_alive "0"); a request without a prompt generates nothing."""
+    import aiohttp
+
+    async with session.post(
+        f"{OLLAMA_HOST}/api/generate",
+        json={"model": model, "keep_alive": keep_alive},
+        timeout=aiohttp.ClientTimeout(total=timeout)
+    ) as response:
+        if response.status != 200:
+            raise RuntimeError(f"Ollama returned {response.status}: {(await response.text())[:200]}")
+        return await response.json()
+
+
+async def warm_up(models: Iterable[str], keep_alive: str = KEEPALIVE_DURATION,
+                  timeout: float = WARMUP_TIMEOUT_SECONDS) -> Dict[str, bool]:
+    """Load each model into Ollama, one at a time so they don't compete for memory.
+
+    Gives up on the remaining models once `timeout` seconds have passed in
+    total. Returns whether each model was loaded.
+    """
+    import aiohttp
+
+    deadline = time.monotonic() + timeout
+    loaded: Dict[str, bool] = {}
+    async with aiohttp.ClientSession() as session:
+        for model in dict.fromkeys(models):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logger.warning(f"Model warm-up timed out before loading {model}")
+                loaded[model] = False
+                continue
+            started = time.perf_counter()
+            try:
+                await _load(session, model, keep_alive, remaining)
+            except Exception as e:
+                warmup_failures.inc()
+                loaded[model] = False
+                logger.warning(f"Could not warm up {model}: {e!r}")
+                continue
+            warmups.inc()
+            loaded[model] = True
+            warmup_seconds[model] = round(time.perf_counter() - started, 2)
+            logger.info(f"Warmed up {model} in {warmup_seconds[model]}s")
+    return loaded
+
+
+async def keep_alive_round(models: Iterable[str], active: bool, was_active: Optional[bool]):
+    """Ping each model while the schedule is active; unload them when it ends if the policy says so."""
+    if not active and not (was_active and OFF_HOURS_POLICY == "unload"):
+        return
+    import aiohttp
+
+    async with aiohttp.ClientSession() as session:
+        for model in dict.fromkeys(models):
+            try:
+                await _load(session, model, KEEPALIVE_DURATION if active else "0", WARMUP_TIMEOUT_SECONDS)
+                (pings if active else unloads).inc()
+            except Exception as e:
+                ping_failures.inc()
+                logger.warning(f"Keep-alive {'ping' if active else 'unload'} for {model} failed: {e!r}")
+
+
+def load_seconds(result: Any) -> float:
+    """Seconds Ollama spent loading the model for a generation result (the longest across its prompts)."""
+    longest = 0.0
+    try:
+        for generations in result.generations:
+            for gen in generations:
+                info = gen.generation_info or getattr(getattr(gen, "message", None), "response_metadata", None) or {}
+                longest = max(longest, (info.get("load_duration") or 0) / 1e9)
+    except Exception as e:
+        logger.debug(f"Could not read load duration: {str(e)}")
+    return longest
+
+
+def record_generation(model: str, seconds: float, result: Any):
+    """Count a generation's latency as cold or warm, depending on whether Ollama had to load the model."""
+    loading = load_seconds(result)
+    cold = loading > COLD_LOAD_SECONDS
+    if model not in warm_latency_ms:
+        cold_latency_ms[model], warm_latency_ms[model], load_ms[model] = Samples(), Samples(), Samples()
+    (cold_latency_ms if cold else warm_latency_ms)[model].observe(seconds * 1000)
+    if cold:
+        load_ms[model].observe(loading * 1000)
+        logger.info(f"Cold start of {model}: {loading:.1f}s of {seconds:.1f}s spent loading")
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "schedule": schedule.spec,
+        "schedule_active": schedule.active(),
+        "off_hours_policy": OFF_HOURS_POLICY,
+        "warmups": warmups.value,
+        "warmup_failures": warmup_failures.value,
+        "warmup_seconds": warmup_seconds,
+        "keepalive_pings": pings.value,
+        "keepalive_failures": ping_failures.value,
+        "unloads": unloads.value,
+        "models": {
+            model: {
+                "cold_latency_ms": cold_latency_ms[model].summary(),
+                "warm_latency_ms": warm_latency_ms[model].summary(),
+                "load_ms": load_ms[model].summary(),
+            }
+            for model in warm_latency_ms
+        },
+    }
@@ -0,0 +1,46 @@
+# server/pagination.py
+from typing import Any, Iterable, List, Optional
+from datetime import datetime
+from fastapi import HTTPException
+import base64
+import hashlib
+import orjson
+
+
+def encode_cursor(order_value: datetime, doc_id: str) -> str:
+    """Opaque cursor for keyset pagination: the last item's sort value and document ID."""
+    raw = orjson.dumps([order_value.isoformat(), doc_id])
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Return [order_value, doc_id] for Query.start_after, or raise 400 for a malformed cursor."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        order_value, doc_id = orjson.loads(raw)
+        return [datetime.fromisoformat(order_value), str(doc_id)]
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail="Invalid cursor") from e
+
+
+def snapshot_etag(snapshots: Iterable[Any], *extra: Any) -> str:
+    """Weak ETag over document IDs and update times, so it changes whenever any listed doc does."""
+    digest = hashlib.sha1()
+    for part in extra:
+        digest.update(f"{part}|".encode("utf-8"))
+    for snapshot in snapshots:
+        updated = getattr(snapshot, "update_time", None)
+        digest.update(f"{snapshot.id}@{updated.isoformat() if updated else ''};".encode("utf-8"))
+    return f'W/"{digest.hexdigest()[:20]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """True if an If-None-Match header lists `etag` (weak comparison) or is "*"."""
+    if not if_none_match:
+        return False
+    opaque = etag[2:] if etag.startswith("W/") else etag
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or (candidate[2:] if candidate.startswith("W/") else candidate) == opaque:
+            return True
+    return False
@@ -0,0 +1,199 @@
+# server/pre_evaluation.py
+from typing import Any, Dict, List, Optional, Set
+import logging
+import os
+import re
+
+from metrics import Counter, Samples
+
+logger = logging.getLogger(__name__)
+
+MIN_WORDS = int(os.getenv("PRE_EVAL_MIN_WORDS", "4"))
+# Answers at least this long always go to the model, even with no keyword overlap
+OFF_TOPIC_MAX_WORDS = 12
+ECHO_OVERLAP = 0.8
+NOISE_RATIO = 0.6
+MODEL_NAME = "rules"
+
+_WORD_RE = re.compile(r"[a-z']+")
+STOPWORDS = set("""
+a an the and or but if so of to in on at for with from by about as into than then that this these those
+is am are was were be been being do does did have has had will would can could should shall may might must
+i me my mine you your yours he him his she her hers it its we us our they them their what which who whom
+whose when where why how there here not no yes very just also too please tell describe explain talk
+""".split())
+# Phrases speech recognition produces from silence or background noise
+ASR_NOISE = {"thank you for watching", "thanks for watching", "please subscribe", "you", "bye", "thank you"}
+FILLERS = {"uh", "um", "erm", "hmm", "mm", "ah", "eh", "er", "huh", "like", "okay", "ok", "yeah", "oh"}
+
+# Doubled words that are correct English: "she had had lunch", "I think that that is true"
+LEGITIMATE_REPEATS = ("had", "that", "is", "do")
+# Words spelled with a vowel but said with a consonant sound, which take "a": "a one-day trip", "a European"
+CONSONANT_SOUND = r"one\b|once\b|eu|ewe"
+
+# (pattern, corrected form, explanation) for frequent learner errors that a regex can catch reliably
+GRAMMAR_RULES = [
+    (re.compile(r"\b(he|she|it) (don't|do not)\b", re.I), r"\1 doesn't", "Use 'doesn't' with he, she and it."),
+    (re.compile(r"\b(he|she|it) have\b", re.I), r"\1 has", "Use 'has' with he, she and it."),
+    (re.compile(r"\b(he|she|it) (are|am)\b", re.I), r"\1 is", "Use 'is' with he, she and it."),
+    (re.compile(r"\bI (is|are)\b"), "I am", "Use 'am' with I."),
+    (re.compile(r"\b(you|we|they) is\b", re.I), r"\1 are", "Use 'are' with you, we and they."),
+    (re.compile(r"\b(you|we|they) was\b", re.I), r"\1 were", "Use 'were' with you, we and they."),
+    (re.compile(rf"\ba (?!{CONSONANT_SOUND})([aeio]\w+)", re.I), r"an \1", "Use 'an' before a vowel sound."),
+    (re.compile(rf"\b(?!(?:{'|'.join(LEGITIMATE_REPEATS)})\b)(\w+) \1\b", re.I), r"\1", "A word is repeated."),
+    (re.compile(r"\bmore (better|worse|bigger|smaller|easier|harder)\b", re.I), r"\1",
+     "'More' is not needed with a comparative."),
+    (re.compile(r"(^|[.!?] )i\b"), r"\1I", "'I' is always a capital letter."),
+]
+
+evaluated = Counter()
+offloaded: Dict[str, Counter] = {reason: Counter() for reason in ("too_short", "echo", "noise", "off_topic")}
+passed = Counter()
+grammar_hits = Counter()
+shadow_checks: Dict[str, Counter] = {reason: Counter() for reason in offloaded}
+shadow_agreements: Dict[str, Counter] = {reason: Counter() for reason in offloaded}
+shadow_error = Samples()
+
+
+def words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def _stem(word: str) -> str:
+    for suffix in ("ing", "ed", "es", "s", "ly"):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def keywords(text: str) -> Set[str]:
+    return {_stem(w) for w in words(text) if w not in STOPWORDS and w not in FILLERS and len(w) > 2}
+
+
+def grammar_check(text: str) -> List[Dict[str, str]]:
+    """Corrections for the learner errors in GRAMMAR_RULES."""
+    corrections = []
+    for pattern, replacement, explanation in GRAMMAR_RULES:
+        for match in pattern.finditer(text):
+            original = match.group(0).strip()
+            corrected = match.expand(replacement).strip()
+            if corrected == original:
+                continue
+            corrections.append({"original": original, "corrected": corrected, "explanation": explanation})
+    return corrections
+
+
+def features(question: str, response: str) -> Dict[str, Any]:
+    response_words, question_words = words(response), words(question)
+    question_keywords, response_keywords = keywords(question), keywords(response)
+    fillers = sum(1 for w in response_words if w in FILLERS)
+    distinct = len(set(response_words))
+    return {
+        "word_count": len(response_words),
+        "distinct_ratio": distinct / len(response_words) if response_words else 0.0,
+        "filler_ratio": fillers / len(response_words) if response_words else 0.0,
+        # Share of the answer's words that are copied from the question
+        "echo_ratio": (sum(1 for w in response_words if w in set(question_words)) / len(response_words)
+                       if response_words else 0.0),
+        "keyword_overlap": len(question_keywords & response_keywords),
+        "question_keywords": len(question_keywords),
+    }
+
+
+def _result(reason: str, score: int, feedback: str, suggestions: List[str],
+            corrections: List[Dict[str, str]]) -> Dict[str, Any]:
+    offloaded[reason].inc()
+    return {
+        "score": score,
+        "feedback": feedback,
+        "corrections": corrections,
+        "suggestions": suggestions,
+        "encouragement": "Every answer is practice. Try again with a few more sentences!",
+        "model": MODEL_NAME,
+        "pre_evaluation": reason,
+    }
+
+
+def pre_evaluate(question: str, response: str) -> Optional[Dict[str, Any]]:
+    """Score answers that need no model: too short, an echo of the question, recognition noise or off topic.
+
+    Returns an evaluation in the OralEvaluation shape, or None when the
+    answer is substantive and should go to the model.
+    """
+    evaluated.inc()
+    f = features(question, response)
+    corrections = grammar_check(response)
+    if corrections:
+        grammar_hits.inc()
+
+    noisy = f["word_count"] >= 3 and (f["filler_ratio"] >= NOISE_RATIO or f["distinct_ratio"] <= 1 - NOISE_RATIO)
+    if noisy or " ".join(words(response)) in ASR_NOISE:
+        return _result("noise", 1, "We couldn't make out an answer, only sounds or repeated words.", [
+            "Speak a little slower and closer to the microphone.",
+            "Answer in full sentences.",
+        ], [])
+    if f["word_count"] >= 3 and f["echo_ratio"] >= ECHO_OVERLAP and f["keyword_overlap"] >= f["question_keywords"] * 0.8:
+        return _result("echo", 1, "Your answer repeats the question instead of answering it.", [
+            "Start with your own answer, for example 'I think...' or 'In my opinion...'.",
+            "Add a reason or an example from your own life.",
+        ], [])
+    if f["word_count"] < MIN_WORDS:
+        return _result("too_short", 2, "Your answer is too short to show your speaking skills.", [
+            "Answer in at least two full sentences.",
+            "Explain why, or give an example.",
+        ], corrections)
+    # Keyword overlap alone misses on-topic paraphrases, so only short answers with almost no content count
+    if f["word_count"] < OFF_TOPIC_MAX_WORDS and f["question_keywords"] >= 2 and f["keyword_overlap"] == 0 \
+            and len(keywords(response)) <= 1:
+        return _result("off_topic", 2, "Your answer doesn't seem to address the question.", [
+            "Listen to the question again and answer what it asks.",
+            "Use some of the key words from the question in your answer.",
+        ], corrections)
+    passed.inc()
+    return None
+
+
+def record_shadow(reason: str, rule_score: int, model_score: int):
+    """Compare a pre-evaluated score with the model's score for the same answer.
+
+    This is the reference measure of how well the rules stand in for the
+    model; the labeled corpus only checks that they still behave as written.
+    """
+    shadow_checks[reason].inc()
+    shadow_error.observe(abs(rule_score - model_score))
+    if abs(rule_score - model_score) <= 1:
+        shadow_agreements[reason].inc()
+    else:
+        logger.info(f"Pre-evaluation disagrees with the model ({reason}): rules {rule_score}, model {model_score}")
+
+
+def _agreement(checks: int, agreements: int) -> Optional[float]:
+    return round(agreements / checks, 3) if checks else None
+
+
+def stats() -> Dict[str, Any]:
+    total = evaluated.value
+    offloaded_total = sum(counter.value for counter in offloaded.values())
+    return {
+        "evaluated": total,
+        "passed_to_model": passed.value,
+        "offloaded": {reason: counter.value for reason, counter in offloaded.items()},
+        "offload_rate": round(offloaded_total / total, 3) if total else 0.0,
+        "grammar_flagged": grammar_hits.value,
+        "shadow": {
+            "checked": sum(counter.value for counter in shadow_checks.values()),
+            "agreement_within_1": _agreement(
+                sum(counter.value for counter in shadow_checks.values()),
+                sum(counter.value for counter in shadow_agreements.values())
+            ),
+            "by_reason": {
+                reason: {
+                    "checked": shadow_checks[reason].value,
+                    "agreement_within_1": _agreement(shadow_checks[reason].value, shadow_agreements[reason].value),
+                }
+                for reason in offloaded
+            },
+            "abs_error": shadow_error.summary(),
+        },
+    }
+
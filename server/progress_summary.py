@@ -0,0 +1,214 @@
+# server/progress_summary.py
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from datetime import date, datetime, timedelta, timezone
+import logging
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "progressSummaries"
+SUMMARY_VERSION = 1
+RECENT_SESSIONS = 5
+RECENT_QUIZZES = 10
+# Sessions left open (tab closed without ending) shouldn't count as hours of practice
+MAX_SESSION_MINUTES = 120
+
+incremental_updates = Counter()
+rebuilds = Counter()
+skipped_updates = Counter()
+
+
+def empty_summary() -> Dict[str, Any]:
+    return {
+        "version": SUMMARY_VERSION,
+        "session_count": 0,
+        "minutes_practiced": 0.0,
+        "quiz_count": 0,
+        "quiz_levels": {},
+        "current_streak": 0,
+        "longest_streak": 0,
+        "last_active_date": None,
+        "recent_sessions": [],
+        "recent_quizzes": [],
+        "updated_at": None,
+    }
+
+
+def _as_datetime(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+    if isinstance(value, str):
+        try:
+            return _as_datetime(datetime.fromisoformat(value.replace("Z", "+00:00")))
+        except ValueError:
+            return None
+    return None
+
+
+def session_entry(session_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """The part of a completed voice session that the summary keeps."""
+    started = _as_datetime(data.get("createdAt"))
+    ended = _as_datetime(data.get("endedAt"))
+    if started is None or ended is None:
+        # Fall back to message timestamps for sessions without start/end times
+        stamps = [t for t in (_as_datetime(m.get("timestamp")) for m in data.get("messages") or []) if t]
+        started = started or (min(stamps) if stamps else None)
+        ended = ended or (max(stamps) if stamps else None)
+    minutes = 0.0
+    if started and ended and ended > started:
+        minutes = min((ended - started).total_seconds() / 60, MAX_SESSION_MINUTES)
+    summary = data.get("summary") or {}
+    return {
+        "id": session_id,
+        "created_at": started or ended,
+        "minutes": round(minutes, 1),
+        "correction_count": len(summary.get("corrections") or []),
+        "feedback": summary.get("final_feedback"),
+        "tip": summary.get("tips"),
+    }
+
+
+def quiz_entry(quiz_id: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    """The part of an attempted quiz that the summary keeps."""
+    oral_scores = [
+        (r.get("evaluation") or {}).get("score", 0)
+        for r in data.get("responses") or []
+        if r.get("type") == "oral" and r.get("evaluation")
+    ]
+    return {
+        "id": quiz_id,
+        "level": data.get("assessment_level", "BASIC"),
+        "attempted_at": _as_datetime(data.get("attempted_at")),
+        "percentage": float(data.get("percentage") or 0),
+        "oral_percentage": round(sum(oral_scores) / len(oral_scores) * 10, 1) if oral_scores else 0.0,
+    }
+
+
+def _record_activity(summary: Dict[str, Any], when: Optional[datetime]):
+    if when is None:
+        return
+    day = when.astimezone(timezone.utc).date()
+    last = date.fromisoformat(summary["last_active_date"]) if summary["last_active_date"] else None
+    if last is not None and day <= last:
+        return
+    summary["current_streak"] = summary["current_streak"] + 1 if last == day - timedelta(days=1) else 1
+    summary["longest_streak"] = max(summary["longest_streak"], summary["current_streak"])
+    summary["last_active_date"] = day.isoformat()
+
+
+def _push_recent(items: List[Dict[str, Any]], entry: Dict[str, Any], key: str, limit: int) -> List[Dict[str, Any]]:
+    items = [item for item in items if item["id"] != entry["id"]] + [entry]
+    items.sort(key=lambda item: item[key] or datetime.min.replace(tzinfo=timezone.utc), reverse=True)
+    return items[:limit]
+
+
+def apply_session(summary: Dict[str, Any], entry: Dict[str, Any]) -> Dict[str, Any]:
+    summary["session_count"] += 1
+    summary["minutes_practiced"] = round(summary["minutes_practiced"] + entry["minutes"], 1)
+    summary["recent_sessions"] = _push_recent(summary["recent_sessions"], entry, "created_at", RECENT_SESSIONS)
+    _record_activity(summary, entry["created_at"])
+    return summary
+
+
+def apply_quiz(summary: Dict[str, Any], entry: Dict[str, Any], previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Add a quiz result; `previous` is the earlier result of the same quiz when it is resubmitted."""
+    levels = summary["quiz_levels"]
+    if previous is not None:
+        old = levels.get(previous["level"])
+        if old:
+            old["count"] -= 1
+            old["percentage_total"] -= previous["percentage"]
+            old["average"] = round(old["percentage_total"] / old["count"], 1) if old["count"] else 0.0
+    else:
+        summary["quiz_count"] += 1
+    level = levels.setdefault(entry["level"], {"count": 0, "percentage_total": 0.0, "average": 0.0})
+    level["count"] += 1
+    level["percentage_total"] += entry["percentage"]
+    level["average"] = round(level["percentage_total"] / level["count"], 1)
+    summary["recent_quizzes"] = _push_recent(summary["recent_quizzes"], entry, "attempted_at", RECENT_QUIZZES)
+    _record_activity(summary, entry["attempted_at"])
+    return summary
+
+
+def build_summary(sessions: Iterable[Dict[str, Any]], quizzes: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """Fold session and quiz entries into a fresh summary in chronological order."""
+    events = [(entry["created_at"], apply_session, entry) for entry in sessions]
+    events += [(entry["attempted_at"], apply_quiz, entry) for entry in quizzes]
+    events.sort(key=lambda event: event[0] or datetime.min.replace(tzinfo=timezone.utc))
+    summary = empty_summary()
+    for _, apply, entry in events:
+        apply(summary, entry)
+    return summary
+
+
+def effective_streak(summary: Dict[str, Any], today: Optional[date] = None) -> int:
+    """The stored streak only counts if the user was active today or yesterday."""
+    if not summary.get("last_active_date"):
+        return 0
+    today = today or datetime.now(timezone.utc).date()
+    last = date.fromisoformat(summary["last_active_date"])
+    return summary["current_streak"] if today - last <= timedelta(days=1) else 0
+
+
+def update_summary(db, user_id: str, mutate: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Apply `mutate` to the stored summary inside a transaction (blocking; run in a thread).
+
+    If the user has no summary yet nothing is written: the next read builds
+    it from history, which already includes the change being recorded.
+    """
+    from google.cloud import firestore
+
+    ref = db.collection(COLLECTION).document(user_id)
+
+    @firestore.transactional
+    def run(transaction):
+        snapshot = ref.get(transaction=transaction)
+        if not snapshot.exists:
+            return None
+        summary = snapshot.to_dict()
+        if summary.get("version") != SUMMARY_VERSION:
+            return None
+        summary = mutate(summary)
+        summary["updated_at"] = datetime.now(timezone.utc)
+        transaction.set(ref, summary)
+        return summary
+
+    summary = run(db.transaction())
+    (incremental_updates if summary is not None else skipped_updates).inc()
+    return summary
+
+
+def rebuild_summary(db, user_id: str) -> Dict[str, Any]:
+    """Recompute a user's summary from raw sessions and quizzes and store it (blocking; run in a thread)."""
+    sessions = (
+        db.collection("voice_sessions")
+        .where("userId", "==", user_id)
+        .where("status", "==", "completed")
+        .select(["createdAt", "endedAt", "summary", "messages"])
+        .stream()
+    )
+    quizzes = (
+        db.collection("users").document(user_id).collection("ai_quizzes")
+        .where("attempted", "==", True)
+        .select(["assessment_level", "attempted_at", "percentage", "responses"])
+        .stream()
+    )
+    summary = build_summary(
+        (session_entry(doc.id, doc.to_dict() or {}) for doc in sessions),
+        (quiz_entry(doc.id, doc.to_dict() or {}) for doc in quizzes),
+    )
+    summary["updated_at"] = datetime.now(timezone.utc)
+    db.collection(COLLECTION).document(user_id).set(summary)
+    rebuilds.inc()
+    logger.info(f"Rebuilt progress summary for user {user_id}: "
+                f"{summary['session_count']} sessions, {summary['quiz_count']} quizzes")
+    return summary
+
+
+def stats() -> Dict[str, int]:
+    return {
+        "incremental_updates": incremental_updates.value,
+        "skipped_updates": skipped_updates.value,
+        "rebuilds": rebuilds.value,
+    }
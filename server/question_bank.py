@@ -0,0 +1,225 @@
+# server/question_bank.py
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from datetime import datetime
+import asyncio
+import hashlib
+import logging
+import random
+
+from metrics import Counter
+from minhash_index import MinHashIndex, normalize_text
+
+logger = logging.getLogger(__name__)
+
+QUESTION_TYPES = ("multiple_choice", "oral")
+
+# Keyword fallback for questions the model did not tag with a topic
+TOPIC_KEYWORDS = {
+    "food": ["food", "eat", "cook", "meal", "restaurant", "breakfast", "dinner", "lunch", "dish"],
+    "family": ["family", "mother", "father", "brother", "sister", "parent", "child", "relative"],
+    "hobbies": ["hobby", "hobbies", "free time", "weekend", "sport", "music", "movie", "book", "game"],
+    "daily_routine": ["every day", "morning", "routine", "usually", "wake", "daily"],
+    "weather": ["weather", "rain", "sunny", "season", "cold", "hot", "snow"],
+    "travel": ["travel", "trip", "holiday", "vacation", "visit", "country", "city", "journey"],
+    "work": ["work", "job", "career", "office", "colleague", "boss", "interview", "profession"],
+    "education": ["school", "study", "learn", "teacher", "university", "class", "exam"],
+    "technology": ["technology", "internet", "phone", "computer", "social media", "online", "digital"],
+    "health": ["health", "exercise", "doctor", "sleep", "diet", "fitness"],
+    "society": ["society", "environment", "government", "culture", "community", "social issue"],
+}
+
+
+def classify_topic(question: Dict[str, Any]) -> str:
+    topic = question.get("topic")
+    if isinstance(topic, str) and topic.strip():
+        return normalize_text(topic).replace(" ", "_") or "general"
+    text = normalize_text(question.get("question", ""))
+    for name, keywords in TOPIC_KEYWORDS.items():
+        if any(k in text for k in keywords):
+            return name
+    return "general"
+
+
+def question_id(level: str, question: Dict[str, Any]) -> str:
+    text = f"{level}|{question.get('type')}|{normalize_text(question.get('question', ''))}"
+    return "qb_" + hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class QuestionBank:
+    """Deduplicated store of generated quiz questions, indexed by level, type and topic.
+
+    Every question the model generates is checked against a MinHash index of
+    the bank for its level; near-duplicates are rejected and everything else
+    is persisted to the `questionBank` collection. Quizzes are then assembled
+    mostly from bank questions the user has not seen, so only a few slots
+    need fresh generation.
+
+    Firestore is only touched in `load_level` and `save_new`, both in a
+    thread; everything else works on the in-memory index.
+    """
+
+    def __init__(self, db_getter: Callable[[], Any] = lambda: None, collection: str = "questionBank",
+                 duplicate_threshold: float = 0.7):
+        # The Firestore client is created after import, in the app's lifespan, so it is looked up on use
+        self.db_getter = db_getter
+        self.collection = collection
+        self.duplicate_threshold = duplicate_threshold
+        self._questions: Dict[str, Dict[str, Any]] = {}
+        self._by_key: Dict[Tuple[str, str, str], List[str]] = {}
+        self._indexes: Dict[str, MinHashIndex] = {}
+        self._loaded_levels: Set[str] = set()
+        self._load_locks: Dict[str, asyncio.Lock] = {}
+        self._unsaved: List[Dict[str, Any]] = []
+        self.generated = Counter()
+        self.duplicates_rejected = Counter()
+        self.served_from_bank = Counter()
+        self.served_fresh = Counter()
+
+    @property
+    def db(self):
+        return self.db_getter()
+
+    def _index(self, level: str) -> MinHashIndex:
+        if level not in self._indexes:
+            self._indexes[level] = MinHashIndex(shingle="word", shingle_size=3)
+        return self._indexes[level]
+
+    def _remember(self, entry: Dict[str, Any]):
+        bank_id = entry["bank_id"]
+        self._questions[bank_id] = entry
+        self._by_key.setdefault((entry["level"], entry["type"], entry["topic"]), []).append(bank_id)
+        self._index(entry["level"]).add(bank_id, entry["question"])
+
+    def _fetch_level(self, level: str) -> List[Dict[str, Any]]:
+        entries = []
+        for doc in self.db.collection(self.collection).where("level", "==", level).stream():
+            entry = doc.to_dict()
+            entry["bank_id"] = doc.id
+            entries.append(entry)
+        return entries
+
+    async def load_level(self, level: str):
+        """Populate the in-memory index for a level from Firestore, once per process.
+
+        A failed load is retried by the next quiz for that level.
+        """
+        if level in self._loaded_levels or not self.db:
+            return
+        async with self._load_locks.setdefault(level, asyncio.Lock()):
+            if level in self._loaded_levels:
+                return
+            try:
+                entries = await asyncio.to_thread(self._fetch_level, level)
+            except Exception as e:
+                logger.warning(f"Could not load question bank for {level}: {e}")
+                return
+            for entry in entries:
+                if entry["bank_id"] not in self._questions:
+                    self._remember(entry)
+            self._loaded_levels.add(level)
+            logger.info(f"Loaded {len(self._index(level))} {level} questions into the question bank")
+
+    def find_duplicate(self, level: str, text: str) -> Optional[str]:
+        match = self._index(level).best_match(text, self.duplicate_threshold)
+        return match[0] if match else None
+
+    def add_generated(self, level: str, questions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Add freshly generated questions to the index, rejecting near-duplicates.
+
+        Returns one record per input question with `bank_id` set and
+        `duplicate_of` naming the existing bank entry when it was rejected.
+        New questions are persisted by the next `save_new`.
+        """
+        records = []
+        for q in questions:
+            if not isinstance(q, dict) or q.get("type") not in QUESTION_TYPES or not q.get("question"):
+                continue
+            self.generated.inc()
+            duplicate_of = self.find_duplicate(level, q["question"])
+            if duplicate_of:
+                self.duplicates_rejected.inc()
+                records.append({**q, "bank_id": duplicate_of, "duplicate_of": duplicate_of})
+                continue
+
+            entry = {
+                "bank_id": question_id(level, q),
+                "level": level,
+                "type": q["type"],
+                "topic": classify_topic(q),
+                "question": q["question"],
+                "created_at": datetime.utcnow(),
+            }
+            if q["type"] == "multiple_choice":
+                entry["options"] = q.get("options", [])
+                entry["correct"] = q.get("correct")
+            self._remember(entry)
+            if self.db:
+                self._unsaved.append(entry)
+            records.append({**q, "bank_id": entry["bank_id"], "topic": entry["topic"], "duplicate_of": None})
+        return records
+
+    def _write(self, entries: List[Dict[str, Any]]):
+        batch = self.db.batch()
+        for entry in entries:
+            data = {k: v for k, v in entry.items() if k != "bank_id"}
+            batch.set(self.db.collection(self.collection).document(entry["bank_id"]), data)
+        batch.commit()
+
+    async def save_new(self):
+        """Persist the questions added since the last call in one batched write."""
+        entries, self._unsaved = self._unsaved, []
+        if not entries or not self.db:
+            return
+        try:
+            await asyncio.to_thread(self._write, entries)
+        except Exception as e:
+            logger.warning(f"Could not persist {len(entries)} bank questions: {e}")
+
+    def pick(self, level: str, question_type: str, count: int, exclude: Set[str],
+             avoid_topics: Optional[Set[str]] = None) -> List[Dict[str, Any]]:
+        """Pick up to `count` unseen bank questions, spreading them across topics."""
+        avoid_topics = set(avoid_topics or ())
+        by_topic: Dict[str, List[str]] = {}
+        for (lvl, qtype, topic), ids in self._by_key.items():
+            if lvl == level and qtype == question_type:
+                available = [i for i in ids if i not in exclude]
+                if available:
+                    by_topic[topic] = available
+
+        picked = []
+        topics = sorted(by_topic, key=lambda t: (t in avoid_topics, random.random()))
+        while len(picked) < count and topics:
+            for topic in list(topics):
+                if len(picked) >= count:
+                    break
+                ids = by_topic[topic]
+                picked.append(self._questions[ids.pop(random.randrange(len(ids)))])
+                if not ids:
+                    topics.remove(topic)
+        return [self.to_question(entry) for entry in picked]
+
+    @staticmethod
+    def to_question(entry: Dict[str, Any]) -> Dict[str, Any]:
+        question = {"type": entry["type"], "question": entry["question"], "topic": entry["topic"], "bank_id": entry["bank_id"]}
+        if entry["type"] == "multiple_choice":
+            question["options"] = entry.get("options", [])
+            question["correct"] = entry.get("correct")
+        return question
+
+    def record_served(self, from_bank: int, fresh: int):
+        self.served_from_bank.inc(from_bank)
+        self.served_fresh.inc(fresh)
+
+    def stats(self) -> Dict[str, Any]:
+        generated = self.generated.value
+        served = self.served_from_bank.value + self.served_fresh.value
+        return {
+            "bank_size": len(self._questions),
+            "bank_size_by_level": {level: len(index) for level, index in self._indexes.items()},
+            "generated": generated,
+            "duplicates_rejected": self.duplicates_rejected.value,
+            "duplicate_rejection_rate": round(self.duplicates_rejected.value / generated, 4) if generated else 0.0,
+            "served_from_bank": self.served_from_bank.value,
+            "served_fresh": self.served_fresh.value,
+            "fresh_ratio": round(self.served_fresh.value / served, 4) if served else 0.0,
+        }
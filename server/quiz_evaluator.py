@@ -1,17 +1,25 @@
 # server/quiz_evaluator.py
 from typing import Dict, Any, Optional
-from langchain_ollama import ChatOllama
 from langchain_core.messages import HumanMessage, SystemMessage
 import logging
 import asyncio
-import re
 from functools import wraps
 import time
 
+import deadlines
+from deadlines import DeadlineExceeded
+from fair_share import token_usage
+import generation_profiles
+from micro_batch import MicroBatcher, model_batcher
+from token_ledger import token_ledger
+from model_router import model_router
+import model_warmup
+from llm_parsing import EVALUATOR_EVALUATION, LLMParseError, fallback_fields, parse_model
+
 logger = logging.getLogger(__name__)
 
 def retry_on_failure(max_retries=3, initial_delay=1, max_delay=10):
-    """Decorator to retry a function on failure with exponential backoff."""
+    """Decorator to retry a function on failure with exponential backoff, within the request's deadline."""
     def decorator(func):
         @wraps(func)
         async def wrapper(*args, **kwargs):
@@ -26,6 +34,8 @@ def retry_on_failure(max_retries=3, initial_delay=1, max_delay=10):
                     if retries > max_retries:
                         logger.error(f"Max retries ({max_retries}) exceeded for {func.__name__}")
                         raise
+                    if isinstance(e, DeadlineExceeded) or not deadlines.retry_allowed(delay):
+                        raise
                     
                     logger.warning(f"Attempt {retries} failed for {func.__name__}: {str(e)}. Retrying in {delay} seconds...")
                     await asyncio.sleep(delay)
@@ -35,14 +45,9 @@ def retry_on_failure(max_retries=3, initial_delay=1, max_delay=10):
 
 class QuizEvaluator:
     def __init__(self):
-        self.model = ChatOllama(
-            model="llama3.1",
-            temperature=0.3,
-            num_ctx=4096,
-            timeout=60,  # Reduced timeout to fail faster
-            max_retries=2,
-            request_timeout=30
-        )
+        self.profile = "quiz_evaluator"
+        # One batcher per routed model; concurrent evaluations share one agenerate call
+        self.batchers: Dict[str, MicroBatcher] = {}
         self.system_prompt = """
         You are an English language evaluation assistant. Your task is to evaluate spoken responses to English questions.
         
@@ -64,11 +69,10 @@ class QuizEvaluator:
         Keep feedback concise, constructive, and focused on improvement.
         """
         self.max_retries = 3
-        self.request_timeout = 30  # seconds
 
     @retry_on_failure(max_retries=3)
-    async def evaluate_response(self, question: str, response: str) -> Dict[str, Any]:
-        """Evaluate a user's response with retry logic and timeout."""
+    async def evaluate_response(self, question: str, response: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """Evaluate a user's response with retry logic, bounded by the request's deadline."""
         try:
             if not response.strip():
                 raise ValueError("Empty response received")
@@ -78,50 +82,51 @@ class QuizEvaluator:
                 HumanMessage(content=f"Question: {question}\n\nResponse: {response}")
             ]
             
-            # Add timeout to the model call
-            result = await asyncio.wait_for(
-                self.model.agenerate([messages]),
-                timeout=self.request_timeout
-            )
+            # The deadline covers the model call, including time spent waiting for the batch to fill
+            model = model_router.choose(self.profile)
+            started = time.perf_counter()
+            try:
+                result = await deadlines.bounded(self._batcher(model).submit(messages), "llm")
+            except Exception:
+                generation_profiles.record_failure(self.profile)
+                raise
+            elapsed = time.perf_counter() - started
+            prompt_tokens, completion_tokens = token_usage(result)
+            generation_profiles.record(self.profile, prompt_tokens, completion_tokens, elapsed, model)
+            token_ledger.record(user_id, self.profile, model, prompt_tokens, completion_tokens, elapsed)
+            model_router.record(self.profile, model, elapsed)
+            model_warmup.record_generation(model, elapsed, result)
             
             evaluation_text = result.generations[0][0].text
             logger.debug(f"Raw evaluation response: {evaluation_text}")
             
             return self._parse_evaluation(evaluation_text, question, response)
             
-        except asyncio.TimeoutError:
-            logger.error("Evaluation request timed out")
+        except DeadlineExceeded:
+            logger.error("Evaluation request ran past its deadline")
             return self._get_error_evaluation("Evaluation timed out. Please try again.")
         except Exception as e:
             logger.error(f"Error in evaluate_response: {str(e)}", exc_info=True)
             return self._get_error_evaluation(f"Evaluation error: {str(e)}")
 
+    def _batcher(self, model: str) -> MicroBatcher:
+        if model not in self.batchers:
+            chat_model = generation_profiles.get_profile(self.profile).chat_model(model)
+            self.batchers[model] = model_batcher(f"{self.profile}:{model}", chat_model)
+        return self.batchers[model]
+
     def _parse_evaluation(self, evaluation_text: str, question: str, response: str) -> Dict[str, Any]:
         """Parse the model's evaluation response with robust error handling."""
         try:
-            # Try to extract JSON from the response
-            json_match = re.search(r'\{.*\}', evaluation_text, re.DOTALL)
-            if json_match:
-                import json
-                try:
-                    evaluation = json.loads(json_match.group(0))
-                    # Validate required fields
-                    if all(key in evaluation for key in ['score', 'feedback', 'suggestions']):
-                        return {
-                            'score': max(1, min(10, int(evaluation['score']))),  # Ensure score is between 1-10
-                            'correction': evaluation.get('correction'),
-                            'feedback': evaluation['feedback'],
-                            'suggestions': evaluation['suggestions'][:3],  # Limit to 3 suggestions
-                            'is_appropriate': evaluation.get('is_appropriate', True),
-                            'original_response': response,
-                            'is_fallback': False
-                        }
-                except (json.JSONDecodeError, KeyError, ValueError) as e:
-                    logger.warning(f"Failed to parse evaluation JSON: {e}")
-            
-            # Fallback to regex-based parsing if JSON parsing fails
+            evaluation = parse_model(evaluation_text, EVALUATOR_EVALUATION)
+            return {
+                **evaluation.model_dump(),
+                'original_response': response,
+                'is_fallback': False
+            }
+        except LLMParseError as e:
+            logger.warning(f"Failed to parse evaluation JSON: {e}")
             return self._fallback_parse_evaluation(evaluation_text, response)
-            
         except Exception as e:
             logger.error(f"Error in _parse_evaluation: {str(e)}", exc_info=True)
             return self._get_default_evaluation(question, response)
@@ -129,27 +134,15 @@ class QuizEvaluator:
     def _fallback_parse_evaluation(self, text: str, response: str) -> Dict[str, Any]:
         """Fallback parsing when JSON parsing fails."""
         try:
-            # Try to extract score (look for number 1-10)
-            score_match = re.search(r'(?i)score[\s:]*([1-9]|10)', text)
-            score = int(score_match.group(1)) if score_match else 5
-            
-            # Try to extract feedback (everything after 'feedback:' or similar)
-            feedback_match = re.search(r'(?i)(?:feedback|comment)[\s:]*([^\n]+)', text)
-            feedback = feedback_match.group(1).strip() if feedback_match else "Thank you for your response."
-            
-            # Try to extract suggestions (look for bullet points or numbered lists)
-            suggestions = re.findall(r'(?:[-•*]|\d+\.)\s*([^\n]+)', text)
-            if not suggestions:
-                suggestions = [
-                    "Try to speak clearly and use complete sentences.",
-                    "Practice speaking about this topic more to improve fluency."
-                ]
-            
+            fields = fallback_fields(text)
             return {
-                'score': score,
+                'score': fields['score'] or 5,
                 'correction': None,
-                'feedback': feedback,
-                'suggestions': suggestions[:3],
+                'feedback': fields['feedback'] or "Thank you for your response.",
+                'suggestions': fields['suggestions'] or [
+                    "Try to speak clearly and use complete sentences.",
+                    "Practice speaking about this topic more to improve fluency."
+                ],
                 'is_appropriate': True,
                 'original_response': response,
                 'is_fallback': True
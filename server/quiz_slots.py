@@ -0,0 +1,161 @@
+# server/quiz_slots.py
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+import asyncio
+import logging
+import random
+import time
+
+from llm_parsing import LLMParseError, QUIZ_QUESTION, parse_model
+from metrics import Counter, Samples
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 3
+
+# Topics each level's full-quiz prompt asks the model to vary across, as question bank topic names
+LEVEL_TOPICS = {
+    "BASIC": ["daily_routine", "family", "hobbies", "food", "weather", "travel", "health"],
+    "INTERMEDIATE": ["travel", "work", "education", "technology", "health", "hobbies", "food", "society"],
+    "ADVANCED": ["society", "work", "technology", "education", "health", "travel", "culture"],
+}
+
+LEVEL_GUIDANCE = {
+    "BASIC": {
+        "learner": "a BASIC level learner (beginner)",
+        "multiple_choice": "Test one of: present simple tense, basic articles (a/an/the), common verbs "
+                           "(be, have, do, go), simple prepositions (in, on, at) or basic vocabulary, "
+                           "in an everyday sentence.",
+        "oral": "Ask a friendly, conversational question of 1-2 sentences that can be answered "
+                "from personal experience in 2-3 simple sentences.",
+    },
+    "INTERMEDIATE": {
+        "learner": "an INTERMEDIATE level learner",
+        "multiple_choice": "Test one of: past simple vs present perfect, past perfect, first/second "
+                           "conditionals, common phrasal verbs, passive voice or relative clauses, where "
+                           "the right answer depends on context and meaning.",
+        "oral": "Ask a question of 2-3 sentences that asks for an opinion, an experience or an "
+                "explanation, answerable in 3-5 sentences.",
+    },
+    "ADVANCED": {
+        "learner": "an ADVANCED level learner",
+        "multiple_choice": "Test one of: third or mixed conditionals, the subjunctive, advanced phrasal "
+                           "verbs, collocations, idioms or formal vs informal register, with distractors "
+                           "that are very close to correct.",
+        "oral": "Ask a question of 3-4 sentences that calls for analysis or argument, answerable in "
+                "a well-structured response of 5 or more sentences.",
+    },
+}
+
+slots_requested = Counter()
+slots_filled = Counter()
+slot_retries = Counter()
+slots_failed = Counter()
+rejections: Dict[str, Counter] = {reason: Counter() for reason in ("error", "invalid", "wrong_type", "duplicate")}
+fill_seconds = Samples()
+
+
+def question_slot_prompt(level: str, question_type: str, topic: str) -> str:
+    """Prompt for exactly one question of the given type about `topic`."""
+    guidance = LEVEL_GUIDANCE.get(level, LEVEL_GUIDANCE["ADVANCED"])
+    topic_text = topic.replace("_", " ")
+    if question_type == "multiple_choice":
+        shape = ('{"type": "multiple_choice", "question": "...", "options": ["A", "B", "C", "D"], '
+                 f'"correct": "A", "topic": "{topic}"}}')
+        rules = ("Give exactly 4 options: ONE clearly correct answer and 3 plausible distractors. "
+                 "\"correct\" must repeat the correct option word for word.")
+    else:
+        shape = f'{{"type": "oral", "question": "...", "topic": "{topic}"}}'
+        rules = "Make it clear, unambiguous and relevant to real life."
+    return f"""You are an expert English language teacher writing ONE quiz question for {guidance["learner"]}.
+
+Question type: {question_type.replace("_", "-")}
+Topic: {topic_text}
+{guidance[question_type]}
+{rules}
+
+Return ONLY this JSON object, no other text:
+{shape}"""
+
+
+def assign_topics(level: str, count: int, avoid: Set[str]) -> List[str]:
+    """Distinct topics for `count` slots, preferring ones the quiz does not cover yet."""
+    topics = list(LEVEL_TOPICS.get(level, LEVEL_TOPICS["ADVANCED"]))
+    random.shuffle(topics)
+    topics.sort(key=lambda topic: topic in avoid)
+    # More slots than topics only happens with custom quiz sizes; topics then repeat
+    return [topics[i % len(topics)] for i in range(count)]
+
+
+async def fill_slots(
+    level: str,
+    slots: List[Tuple[str, str]],
+    generate: Callable[[str], Awaitable[str]],
+    accept: Callable[[Dict[str, Any]], Optional[str]],
+    max_attempts: int = MAX_ATTEMPTS,
+    fatal: Tuple[type, ...] = (),
+) -> List[Optional[Dict[str, Any]]]:
+    """Generate one question per (type, topic) slot concurrently.
+
+    `generate` runs a prompt and returns the model text; concurrency is
+    whatever the LLM scheduler behind it allows. Each item is validated on
+    its own and `accept` may reject it (returning a reason, e.g. a
+    duplicate), in which case only that slot is retried, with a fresh topic
+    if its topic was the problem. Failed generations are retried the same
+    way, except for `fatal` exceptions, which are raised. Returns one
+    question per slot, or None for slots that failed every attempt.
+    """
+    started = time.perf_counter()
+    used_topics = {topic for _, topic in slots}
+    spare_topics = [t for t in LEVEL_TOPICS.get(level, LEVEL_TOPICS["ADVANCED"]) if t not in used_topics]
+    random.shuffle(spare_topics)
+    slots_requested.inc(len(slots))
+
+    async def fill(question_type: str, topic: str) -> Optional[Dict[str, Any]]:
+        for attempt in range(max_attempts):
+            if attempt:
+                slot_retries.inc()
+            try:
+                text = await generate(question_slot_prompt(level, question_type, topic))
+                question = parse_model(text, QUIZ_QUESTION).model_dump(exclude_none=True)
+            except LLMParseError as e:
+                rejections["invalid"].inc()
+                logger.info(f"Slot {question_type}/{topic} attempt {attempt + 1}: {e}")
+                continue
+            except fatal:
+                raise
+            except Exception as e:
+                rejections["error"].inc()
+                logger.warning(f"Slot {question_type}/{topic} attempt {attempt + 1} failed: {e}")
+                continue
+            if question["type"] != question_type:
+                rejections["wrong_type"].inc()
+                continue
+            question["topic"] = topic
+            # Checked after the await, so slots finishing together see each other's questions
+            reason = accept(question)
+            if reason is None:
+                slots_filled.inc()
+                return question
+            rejections["duplicate" if reason == "duplicate" else "invalid"].inc()
+            if reason == "duplicate" and spare_topics:
+                topic = spare_topics.pop()
+        slots_failed.inc()
+        logger.warning(f"Could not generate a {question_type} question on {topic} after {max_attempts} attempts")
+        return None
+
+    try:
+        return list(await asyncio.gather(*(fill(question_type, topic) for question_type, topic in slots)))
+    finally:
+        fill_seconds.observe(time.perf_counter() - started)
+
+
+def stats() -> Dict[str, Any]:
+    return {
+        "slots_requested": slots_requested.value,
+        "slots_filled": slots_filled.value,
+        "slots_failed": slots_failed.value,
+        "retries": slot_retries.value,
+        "rejections": {reason: counter.value for reason, counter in rejections.items()},
+        "fill_seconds": fill_seconds.summary(),
+    }
+
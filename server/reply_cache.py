@@ -0,0 +1,132 @@
+# server/reply_cache.py
+from typing import Any, Dict, List, Optional, Tuple
+from collections import OrderedDict
+import logging
+import os
+import random
+import re
+
+from metrics import Counter
+from minhash_index import MinHashIndex, normalize_text
+
+logger = logging.getLogger(__name__)
+
+# A capitalized word after the first one is usually a name or place, which the reply repeats back
+_PROPER_NOUN_RE = re.compile(r"(?<=\s)[A-Z][a-z]+")
+# Speech recognition often lowercases names, so also skip phrasings that introduce one: a near-duplicate
+# of "my name is anna" is "my name is anne", and must not get Anna's reply
+_INTRODUCTION_RE = re.compile(
+    r"\b(?:name(?:'s| is)|(?:am|i'm|is|are|was) called|call me|i live in|i(?:'m| am) from|i come from)\b",
+    re.IGNORECASE
+)
+
+
+class ReplyCache:
+    """Replies to short, common voice-chat utterances, looked up exactly or by near-duplicate.
+
+    Utterances are keyed by their normalized text; a miss on the exact key
+    falls back to a character 3-gram MinHash index, so "helo how are you"
+    finds "hello how are you". Each key collects up to `variants` different
+    replies and is only served once it has them all, picking one at
+    random, so a learner doesn't hear the same answer every time. At most
+    `max_entries` keys are kept, evicting the least recently used.
+
+    Only utterances of up to `max_words` words without names, introductions
+    ("my name is ...", "i'm from ...") or numbers are cached: the voice chat prompt sees just the last message, so the
+    reply depends on nothing else.
+    """
+
+    def __init__(self, max_entries: int = 2000, variants: int = 4, similarity: float = 0.85, max_words: int = 8):
+        self.max_entries = max_entries
+        self.variants = variants
+        self.similarity = similarity
+        self.max_words = max_words
+        self._entries: "OrderedDict[str, List[Tuple[str, str]]]" = OrderedDict()
+        self._index = MinHashIndex(shingle="char", shingle_size=3)
+        self.lookups = Counter()
+        self.exact_hits = Counter()
+        self.near_hits = Counter()
+        self.filling = Counter()
+        self.misses = Counter()
+        self.uncacheable = Counter()
+        self.evictions = Counter()
+
+    @classmethod
+    def from_env(cls) -> "ReplyCache":
+        return cls(
+            max_entries=int(os.getenv("REPLY_CACHE_SIZE", "2000")),
+            variants=int(os.getenv("REPLY_CACHE_VARIANTS", "4")),
+            similarity=float(os.getenv("REPLY_CACHE_SIMILARITY", "0.85")),
+            max_words=int(os.getenv("REPLY_CACHE_MAX_WORDS", "8")),
+        )
+
+    def cache_key(self, utterance: str) -> Optional[str]:
+        """The normalized key for an utterance, or None if it shouldn't be cached."""
+        if (self.max_entries <= 0 or _PROPER_NOUN_RE.search(utterance.strip()) or _INTRODUCTION_RE.search(utterance)
+                or any(c.isdigit() for c in utterance)):
+            return None
+        key = normalize_text(utterance)
+        if not key or len(key.split()) > self.max_words:
+            return None
+        return key
+
+    def _find(self, key: str) -> Tuple[Optional[str], bool]:
+        if key in self._entries:
+            return key, True
+        match = self._index.best_match(key, self.similarity)
+        return (match[0], False) if match else (None, False)
+
+    def lookup(self, utterance: str) -> Optional[Tuple[str, str]]:
+        """A cached (reply, model) for the utterance or a near-duplicate of it, or None."""
+        self.lookups.inc()
+        key = self.cache_key(utterance)
+        if key is None:
+            self.uncacheable.inc()
+            return None
+        found, exact = self._find(key)
+        if found is None:
+            self.misses.inc()
+            return None
+        replies = self._entries[found]
+        self._entries.move_to_end(found)
+        if len(replies) < self.variants:
+            # Still collecting variety; the caller generates and stores another reply
+            self.filling.inc()
+            return None
+        (self.exact_hits if exact else self.near_hits).inc()
+        return random.choice(replies)
+
+    def store(self, utterance: str, reply: str, model: str):
+        key = self.cache_key(utterance)
+        if key is None:
+            return
+        found, _ = self._find(key)
+        key = found or key
+        replies = self._entries.setdefault(key, [])
+        self._entries.move_to_end(key)
+        if found is None:
+            self._index.add(key, key)
+        if len(replies) < self.variants and all(reply != existing for existing, _ in replies):
+            replies.append((reply, model))
+        while len(self._entries) > self.max_entries:
+            evicted, _ = self._entries.popitem(last=False)
+            self._index.remove(evicted)
+            self.evictions.inc()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.lookups.value
+        hits = self.exact_hits.value + self.near_hits.value
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ready_entries": sum(1 for replies in self._entries.values() if len(replies) >= self.variants),
+            "lookups": lookups,
+            "exact_hits": self.exact_hits.value,
+            "near_hits": self.near_hits.value,
+            "filling": self.filling.value,
+            "misses": self.misses.value,
+            "uncacheable": self.uncacheable.value,
+            "evictions": self.evictions.value,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+        }
+
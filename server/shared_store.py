@@ -0,0 +1,148 @@
+# server/shared_store.py
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class SharedStore:
+    """Small key/value store with TTLs shared by every worker process on this host.
+
+    Backed by a SQLite file in WAL mode, so idempotency records, quota
+    buckets, cached lookups and the Ollama circuit breaker behave the same
+    whether the API runs as one process or one per core. Values are stored
+    as JSON. Each process opens its own connection lazily, so the store is
+    safe to create before workers are spawned.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._purged_at = 0.0
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS kv_expires ON kv (expires_at)")
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def initialize(self):
+        """Create the schema and drop expired entries; called once before workers start."""
+        with self._lock:
+            self._connection()
+        removed = self.purge_expired()
+        logger.info(f"Shared store ready at {self.path} ({removed} expired entries removed)")
+
+    @staticmethod
+    def _expiry(ttl: Optional[float]) -> Optional[float]:
+        return time.time() + ttl if ttl else None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value, default=str), self._expiry(ttl))
+            )
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Store `value` only if the key is absent or expired. Returns True if it was stored."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute("DELETE FROM kv WHERE key = ? AND expires_at IS NOT NULL AND expires_at <= ?", (key, now))
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, default=str), self._expiry(ttl))
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return cursor.rowcount == 1
+
+    def update(self, key: str, func: Callable[[Any], Any], ttl: Optional[float] = None) -> Any:
+        """Atomically replace the value with func(current value or None) and return the new value."""
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                    (key, now)
+                ).fetchone()
+                value = func(json.loads(row[0]) if row else None)
+                conn.execute(
+                    "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, default=str), self._expiry(ttl))
+                )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return value
+
+    def delete(self, key: str):
+        with self._lock:
+            self._connection().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def items(self, prefix: str) -> List[Tuple[str, Any]]:
+        """Return every live (key, value) whose key starts with `prefix`."""
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT key, value FROM kv WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?)",
+                (prefix, prefix + "\uffff", time.time())
+            ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def purge_expired(self) -> int:
+        with self._lock:
+            cursor = self._connection().execute(
+                "DELETE FROM kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+            )
+        self._purged_at = time.time()
+        return cursor.rowcount
+
+    def purge_if_due(self, interval: float) -> int:
+        """Drop expired entries if this process hasn't in the last `interval` seconds.
+
+        Reads already ignore expired rows; this keeps them from piling up
+        (idempotency records, cached roles, idle quota buckets) while the
+        server runs.
+        """
+        if time.time() - self._purged_at < interval:
+            return 0
+        return self.purge_expired()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            count = self._connection().execute("SELECT COUNT(*) FROM kv").fetchone()[0]
+        return {"path": self.path, "entries": count}
+
+
+shared_store = SharedStore(os.getenv("TALKBUDDY_SHARED_STORE", "talkbuddy_shared.db"))
@@ -0,0 +1,84 @@
+# server/single_flight.py
+from typing import Any, Awaitable, Callable, Dict
+import asyncio
+import hashlib
+import json
+import logging
+
+from metrics import Counter
+
+logger = logging.getLogger(__name__)
+
+
+def canonical_key(namespace: str, payload: Dict[str, Any]) -> str:
+    """Build a stable key for a request payload, ignoring key order and surrounding whitespace."""
+    def normalize(value):
+        if isinstance(value, str):
+            return " ".join(value.split())
+        if isinstance(value, dict):
+            return {k: normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [normalize(v) for v in value]
+        return value
+
+    body = json.dumps(normalize(payload), sort_keys=True, separators=(",", ":"), default=str)
+    return f"{namespace}:{hashlib.sha256(body.encode('utf-8')).hexdigest()}"
+
+
+class SingleFlight:
+    """Coalesce concurrent calls that share a key onto one in-flight task.
+
+    The first caller for a key starts the work; callers arriving while it is
+    still running await the same task and receive the same result or
+    exception. A caller being cancelled only detaches that caller - the shared
+    task is cancelled once no caller is waiting on it any more.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._inflight: Dict[str, asyncio.Task] = {}
+        self._waiters: Dict[str, int] = {}
+        self.started = Counter()
+        self.coalesced = Counter()
+        self.abandoned = Counter()
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            self._waiters[key] = 0
+            task.add_done_callback(lambda t, key=key: self._forget(key, t))
+            self.started.inc()
+        else:
+            self.coalesced.inc()
+            logger.debug(f"[{self.name}] Coalesced duplicate request {key}")
+
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self._waiters.get(key, 0) <= 1:
+                # Last interested caller went away - stop the shared work too
+                self.abandoned.inc()
+                task.cancel()
+            raise
+        finally:
+            if key in self._waiters and self._inflight.get(key) is task:
+                self._waiters[key] -= 1
+
+    def _forget(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+            self._waiters.pop(key, None)
+        # Mark the exception as retrieved when every caller already detached
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "in_flight": len(self._inflight),
+            "started": self.started.value,
+            "coalesced": self.coalesced.value,
+            "abandoned": self.abandoned.value,
+        }
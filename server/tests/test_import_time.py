@@ -0,0 +1,36 @@
+# server/tests/test_import_time.py
+"""Importing main stays fast: heavy SDKs are deferred and the import fits its budgets.
+
+Each test imports main in a fresh interpreter with `-X importtime`, as
+check_import_time.py does; run that script to see the slowest packages
+when one of these fails.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from check_import_time import DEFAULT_BUDGET_MS, DEFAULT_MODULE_BUDGET, eager_imports, measure
+
+
+@pytest.fixture(scope="module")
+def import_main():
+    return measure("main")
+
+
+def test_sdks_are_imported_lazily(import_main):
+    _, modules = import_main
+    assert eager_imports(modules) == []
+
+
+def test_import_time_within_budget(import_main):
+    total_ms, _ = import_main
+    assert total_ms <= DEFAULT_BUDGET_MS, f"import main took {total_ms:.0f} ms, budget {DEFAULT_BUDGET_MS:.0f} ms"
+
+
+def test_module_count_within_budget(import_main):
+    _, modules = import_main
+    assert len(modules) <= DEFAULT_MODULE_BUDGET, \
+        f"import main loaded {len(modules)} modules, budget {DEFAULT_MODULE_BUDGET}"
@@ -0,0 +1,263 @@
+# server/token_ledger.py
+from typing import Any, Dict, List, Optional, Tuple
+from contextvars import ContextVar
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from metrics import Counter, Samples
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL_SECONDS = float(os.getenv("LEDGER_FLUSH_INTERVAL_SECONDS", "5"))
+FLUSH_SIZE = int(os.getenv("LEDGER_FLUSH_SIZE", "200"))
+# Raw entries are kept this long; hourly rollups are kept for ROLLUP_RETENTION_DAYS
+RETENTION_DAYS = int(os.getenv("LEDGER_RETENTION_DAYS", "14"))
+ROLLUP_RETENTION_DAYS = int(os.getenv("LEDGER_ROLLUP_RETENTION_DAYS", "400"))
+GROUP_COLUMNS = ("user_id", "endpoint", "profile", "model")
+
+# ASGI scope of the HTTP request an LLM call was made for
+current_scope: ContextVar[Optional[Dict[str, Any]]] = ContextVar("ledger_scope", default=None)
+
+Entry = Tuple[int, str, str, str, str, int, int, int]
+
+
+class TokenLedger:
+    """Append-only record of every LLM call, with hourly rollups per user, endpoint, profile and model.
+
+    `record` only appends to an in-memory buffer; a background task writes
+    the buffer every `FLUSH_INTERVAL_SECONDS`, or sooner once it holds
+    `FLUSH_SIZE` entries. Each flush inserts the raw entries and adds them
+    to their hour's rollup rows in the same transaction, so rollups are
+    always exact and queries never scan the raw entries. The SQLite file is
+    shared by every worker on the host, with the same per-process
+    connection scheme as JobQueue. Entries still buffered when a worker is
+    killed are lost.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._buffer: List[Entry] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._pruned_at = 0.0
+        self.recorded = Counter()
+        self.flushes = Counter()
+        self.flush_failures = Counter()
+        self.flush_ms = Samples()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None or self._pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ledger ("
+                "ts INTEGER NOT NULL, user_id TEXT NOT NULL, endpoint TEXT NOT NULL, profile TEXT NOT NULL, "
+                "model TEXT NOT NULL, prompt_tokens INTEGER NOT NULL, completion_tokens INTEGER NOT NULL, "
+                "wall_ms INTEGER NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS ledger_ts ON ledger (ts)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS ledger_hourly ("
+                "hour INTEGER NOT NULL, user_id TEXT NOT NULL, endpoint TEXT NOT NULL, profile TEXT NOT NULL, "
+                "model TEXT NOT NULL, calls INTEGER NOT NULL, prompt_tokens INTEGER NOT NULL, "
+                "completion_tokens INTEGER NOT NULL, wall_ms INTEGER NOT NULL, "
+                "PRIMARY KEY (hour, user_id, endpoint, profile, model)) WITHOUT ROWID"
+            )
+            self._conn = conn
+            self._pid = os.getpid()
+        return self._conn
+
+    def _transaction(self, func) -> Any:
+        with self._lock:
+            conn = self._connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        return result
+
+    def initialize(self):
+        """Create the schema and drop expired entries and rollups; called once before workers start."""
+        self._prune()
+        logger.info(f"Token ledger ready at {self.path}")
+
+    def record(self, user_id: Optional[str], profile: str, model: str, prompt_tokens: int, completion_tokens: int,
+               seconds: float, endpoint: Optional[str] = None):
+        """Buffer one LLM call; `endpoint` defaults to the route of the request being handled."""
+        self._buffer.append((
+            int(time.time()), user_id or "anonymous", endpoint or current_endpoint(), profile, model,
+            prompt_tokens, completion_tokens, int(seconds * 1000),
+        ))
+        self.recorded.inc()
+        if len(self._buffer) >= FLUSH_SIZE and self._wakeup is not None:
+            self._wakeup.set()
+
+    def _write(self, entries: List[Entry]):
+        rollups: Dict[Tuple[int, str, str, str, str], List[int]] = {}
+        for ts, user_id, endpoint, profile, model, prompt_tokens, completion_tokens, wall_ms in entries:
+            totals = rollups.setdefault((ts - ts % 3600, user_id, endpoint, profile, model), [0, 0, 0, 0])
+            totals[0] += 1
+            totals[1] += prompt_tokens
+            totals[2] += completion_tokens
+            totals[3] += wall_ms
+
+        def write(conn):
+            conn.executemany("INSERT INTO ledger VALUES (?, ?, ?, ?, ?, ?, ?, ?)", entries)
+            conn.executemany(
+                "INSERT INTO ledger_hourly VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (hour, user_id, endpoint, profile, model) DO UPDATE SET "
+                "calls = calls + excluded.calls, prompt_tokens = prompt_tokens + excluded.prompt_tokens, "
+                "completion_tokens = completion_tokens + excluded.completion_tokens, "
+                "wall_ms = wall_ms + excluded.wall_ms",
+                [key + tuple(totals) for key, totals in rollups.items()]
+            )
+
+        self._transaction(write)
+
+    def _prune(self):
+        now = time.time()
+        self._transaction(lambda conn: (
+            conn.execute("DELETE FROM ledger WHERE ts < ?", (now - RETENTION_DAYS * 86400,)),
+            conn.execute("DELETE FROM ledger_hourly WHERE hour < ?", (now - ROLLUP_RETENTION_DAYS * 86400,)),
+        ))
+        self._pruned_at = now
+
+    async def flush(self):
+        """Write the buffered entries; on failure they are put back for the next flush."""
+        entries, self._buffer = self._buffer, []
+        if not entries:
+            return
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._write, entries)
+        except Exception as e:
+            self.flush_failures.inc()
+            # Keep only the newest entries, so an unwritable store can't grow the buffer without bound
+            self._buffer[:0] = entries[-FLUSH_SIZE * 50:]
+            logger.warning(f"Could not write {len(entries)} ledger entries: {str(e)}")
+            return
+        self.flushes.inc()
+        self.flush_ms.observe((time.perf_counter() - started) * 1000)
+        if time.time() - self._pruned_at > 3600:
+            try:
+                await asyncio.to_thread(self._prune)
+            except Exception as e:
+                logger.warning(f"Could not prune the token ledger: {str(e)}")
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=FLUSH_INTERVAL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        """Stop the flush task and write what is still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.flush()
+
+    def top(self, since: float, group_by: str = "user_id", limit: int = 20,
+            where: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """The biggest consumers since `since`, by wall time, grouped by one of GROUP_COLUMNS."""
+        if group_by not in GROUP_COLUMNS:
+            raise ValueError(f"Cannot group by {group_by!r}")
+        filters, params = self._filters(since, where)
+        with self._lock:
+            rows = self._connection().execute(
+                f"SELECT {group_by} AS key, SUM(calls) AS calls, SUM(prompt_tokens) AS prompt_tokens, "
+                f"SUM(completion_tokens) AS completion_tokens, SUM(wall_ms) AS wall_ms FROM ledger_hourly "
+                f"WHERE {filters} GROUP BY {group_by} ORDER BY wall_ms DESC LIMIT ?",
+                params + [limit]
+            ).fetchall()
+        return [{group_by: row["key"], **_totals(row)} for row in rows]
+
+    def trend(self, since: float, where: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        """Totals per hour since `since`, oldest first; hours without calls are left out."""
+        filters, params = self._filters(since, where)
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT hour, SUM(calls) AS calls, SUM(prompt_tokens) AS prompt_tokens, "
+                "SUM(completion_tokens) AS completion_tokens, SUM(wall_ms) AS wall_ms FROM ledger_hourly "
+                f"WHERE {filters} GROUP BY hour ORDER BY hour",
+                params
+            ).fetchall()
+        return [{"hour": row["hour"], **_totals(row)} for row in rows]
+
+    @staticmethod
+    def _filters(since: float, where: Optional[Dict[str, str]]) -> Tuple[str, List[Any]]:
+        clauses, params = ["hour >= ?"], [since - since % 3600]
+        for column, value in (where or {}).items():
+            if column not in GROUP_COLUMNS:
+                raise ValueError(f"Cannot filter by {column!r}")
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        return " AND ".join(clauses), params
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "recorded": self.recorded.value,
+            "buffered": len(self._buffer),
+            "flushes": self.flushes.value,
+            "flush_failures": self.flush_failures.value,
+            "flush_ms": self.flush_ms.summary(),
+        }
+
+
+def current_endpoint() -> str:
+    """The route template (e.g. "/voice_chat/") of the request being handled, or "background"."""
+    scope = current_scope.get()
+    if scope is None:
+        return "background"
+    # The router adds the matched route to the same scope dict once it has routed the request
+    return getattr(scope.get("route"), "path", None) or scope["path"]
+
+
+def _totals(row: sqlite3.Row) -> Dict[str, Any]:
+    return {
+        "calls": row["calls"],
+        "prompt_tokens": row["prompt_tokens"],
+        "completion_tokens": row["completion_tokens"],
+        "llm_seconds": round(row["wall_ms"] / 1000, 1),
+    }
+
+
+class LedgerEndpointMiddleware:
+    """ASGI middleware that tags LLM calls made while handling a request with the request's route."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        token = current_scope.set(scope)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_scope.reset(token)
+
+
+token_ledger = TokenLedger(os.getenv("TALKBUDDY_LEDGER_STORE", "talkbuddy_ledger.db"))
@@ -0,0 +1,301 @@
+# server/transcript_store.py
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta, timezone
+import logging
+import os
+import time
+
+import orjson
+import zstandard
+
+from metrics import Counter, Samples
+
+logger = logging.getLogger(__name__)
+
+CHUNK_COLLECTION = "transcript_chunks"
+ARCHIVE_COLLECTION = "transcriptArchives"
+CHUNK_TURNS = int(os.getenv("TRANSCRIPT_CHUNK_TURNS", "50"))
+CHUNK_LEVEL = 3
+ARCHIVE_LEVEL = 19
+ARCHIVE_AFTER_DAYS = int(os.getenv("TRANSCRIPT_ARCHIVE_AFTER_DAYS", "90"))
+# Firestore documents are capped at 1 MiB; leave room for the other fields
+MAX_BLOB_BYTES = 900_000
+
+raw_bytes = Counter()
+stored_bytes = Counter()
+archived_sessions = Counter()
+read_latency = {storage: Samples() for storage in ("inline", "chunks", "archive")}
+
+
+class TranscriptUnavailable(Exception):
+    """A chunk or archive document the session points to is missing."""
+
+
+def encode_turns(turns: List[Dict[str, Any]], level: int = CHUNK_LEVEL) -> bytes:
+    return zstandard.ZstdCompressor(level=level).compress(orjson.dumps(turns))
+
+
+def decode_turns(data: bytes) -> List[Dict[str, Any]]:
+    return orjson.loads(zstandard.ZstdDecompressor().decompress(data))
+
+
+def storage_of(data: Dict[str, Any]) -> str:
+    """Where a session's turns live: "inline" (the legacy messages array), "chunks" or "archive"."""
+    return (data.get("transcript") or {}).get("storage", "inline")
+
+
+def firestore_size(value: Any) -> int:
+    """Stored size of a field value under Firestore's documented size rules."""
+    if value is None or isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float, datetime)):
+        return 8
+    if isinstance(value, str):
+        return len(value.encode("utf-8")) + 1
+    if isinstance(value, bytes):
+        return len(value)
+    if isinstance(value, dict):
+        return sum(firestore_size(key) + firestore_size(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return sum(firestore_size(item) for item in value)
+    return firestore_size(str(value))
+
+
+def document_size(path: str, data: Dict[str, Any]) -> int:
+    """Stored size of a document: its name, its fields and 32 bytes of overhead."""
+    return firestore_size(path) + firestore_size(data) + 32
+
+
+def chunk_documents(turns: List[Dict[str, Any]], chunk_turns: int = CHUNK_TURNS) -> List[Dict[str, Any]]:
+    return [
+        {"index": index, "first_turn": start, "turns": len(turns[start:start + chunk_turns]),
+         "data": encode_turns(turns[start:start + chunk_turns])}
+        for index, start in enumerate(range(0, len(turns), chunk_turns))
+    ]
+
+
+def write_transcript(db, session_ref, turns: List[Dict[str, Any]],
+                     previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Store turns as compressed chunk documents under the session (blocking; run in a thread).
+
+    Returns the `transcript` field for the session document; the caller
+    writes it together with its other session fields.
+    """
+    from google.cloud import firestore
+
+    chunks = chunk_documents(turns)
+    batch = db.batch()
+    for chunk in chunks:
+        batch.set(session_ref.collection(CHUNK_COLLECTION).document(f"{chunk['index']:05d}"), chunk)
+    # A rewrite with fewer turns leaves chunks from the earlier write behind
+    for index in range(len(chunks), (previous or {}).get("chunks", 0)):
+        batch.delete(session_ref.collection(CHUNK_COLLECTION).document(f"{index:05d}"))
+    batch.commit()
+
+    raw = len(orjson.dumps(turns))
+    stored = sum(len(chunk["data"]) for chunk in chunks)
+    raw_bytes.inc(raw)
+    stored_bytes.inc(stored)
+    return {
+        "storage": "chunks", "codec": "zstd", "chunk_turns": CHUNK_TURNS, "chunks": len(chunks),
+        "turns": len(turns), "raw_bytes": raw, "stored_bytes": stored, "updated_at": firestore.SERVER_TIMESTAMP,
+    }
+
+
+def append_turns(db, session_ref, first_turn: int, turns: List[Dict[str, Any]],
+                 list_fields: Callable[[Dict[str, Any], Dict[str, Any], List[Dict[str, Any]]], Dict[str, Any]]
+                 ) -> Dict[str, Any]:
+    """Append turns to a session's chunked transcript in a transaction (blocking; run in a thread).
+
+    `first_turn` is the position of turns[0] in the transcript. Turns that
+    are already stored are skipped, so a retried append is harmless; a
+    gap raises ValueError. Only the last, partly filled chunk is rewritten,
+    so each append costs at most `CHUNK_TURNS` turns however long the
+    session gets. Legacy inline messages are moved into the chunks.
+    `list_fields(data, transcript, added)` returns the other session fields
+    to write with the new `transcript`. Returns the new `transcript` field.
+    """
+    from google.cloud import firestore
+
+    @firestore.transactional
+    def run(transaction):
+        snapshot = session_ref.get(transaction=transaction)
+        data = snapshot.to_dict() if snapshot.exists else None
+        if data is None:
+            raise TranscriptUnavailable(f"Session {session_ref.id} does not exist")
+        storage = storage_of(data)
+        if storage == "archive":
+            raise ValueError("Archived transcripts can't be appended to")
+        meta = data.get("transcript") or {}
+        if storage == "chunks":
+            total = meta.get("turns", 0)
+            size = meta.get("chunk_turns", CHUNK_TURNS)
+            base = total - total % size
+            tail, tail_bytes = [], 0
+            if total % size:
+                chunk = session_ref.collection(CHUNK_COLLECTION).document(f"{base // size:05d}").get(
+                    transaction=transaction
+                ).to_dict()
+                if not chunk or "data" not in chunk:
+                    raise TranscriptUnavailable(f"Last chunk of session {session_ref.id} is missing")
+                tail, tail_bytes = decode_turns(chunk["data"]), len(chunk["data"])
+        else:
+            tail = data.get("messages") or []
+            total, size, base, tail_bytes = len(tail), CHUNK_TURNS, 0, 0
+
+        if first_turn > total:
+            raise ValueError(f"Expected turn {total}, got turn {first_turn}")
+        added = turns[total - first_turn:]
+        if not added:
+            return meta
+
+        pending = tail + added
+        written = 0
+        for start in range(0, len(pending), size):
+            part = pending[start:start + size]
+            index = (base + start) // size
+            chunk = {"index": index, "first_turn": base + start, "turns": len(part), "data": encode_turns(part)}
+            transaction.set(session_ref.collection(CHUNK_COLLECTION).document(f"{index:05d}"), chunk)
+            written += len(chunk["data"])
+
+        raw = len(orjson.dumps(added if storage == "chunks" else pending))
+        transcript = {
+            "storage": "chunks", "codec": "zstd", "chunk_turns": size, "chunks": (total + len(added) - 1) // size + 1,
+            "turns": total + len(added), "raw_bytes": meta.get("raw_bytes", 0) + raw,
+            "stored_bytes": meta.get("stored_bytes", 0) - tail_bytes + written,
+            "updated_at": firestore.SERVER_TIMESTAMP,
+        }
+        update = {"transcript": transcript, **list_fields(data, transcript, added)}
+        if storage == "inline":
+            update["messages"] = firestore.DELETE_FIELD
+        transaction.update(session_ref, update)
+        raw_bytes.inc(raw)
+        stored_bytes.inc(written - tail_bytes)
+        return transcript
+
+    return run(db.transaction())
+
+
+def read_turns(db, session_ref, data: Dict[str, Any], offset: int = 0,
+               limit: Optional[int] = None) -> Tuple[List[Dict[str, Any]], int]:
+    """Return (turns[offset:offset + limit], total turns) for a session (blocking; run in a thread).
+
+    Chunked transcripts only read the chunk documents covering the window.
+    Raises TranscriptUnavailable if a document the session points to is
+    missing, rather than returning a transcript with a gap in it.
+    """
+    storage = storage_of(data)
+    started = time.perf_counter()
+    meta = data.get("transcript") or {}
+    if storage == "chunks":
+        total = meta.get("turns", 0)
+        end = total if limit is None else min(total, offset + limit)
+        size = meta.get("chunk_turns", CHUNK_TURNS)
+        refs = [session_ref.collection(CHUNK_COLLECTION).document(f"{index:05d}")
+                for index in range(offset // size, (end - 1) // size + 1)] if end > offset else []
+        turns = []
+        for snapshot in sorted(db.get_all(refs), key=lambda s: s.id):
+            chunk = snapshot.to_dict() if snapshot.exists else None
+            if not chunk or "data" not in chunk:
+                raise TranscriptUnavailable(f"Chunk {snapshot.id} of session {session_ref.id} is missing")
+            first = chunk.get("first_turn", 0)
+            turns.extend(decode_turns(chunk["data"])[max(0, offset - first):end - first])
+    else:
+        if storage == "archive":
+            archive = db.collection(ARCHIVE_COLLECTION).document(session_ref.id).get().to_dict() or {}
+            if "data" not in archive:
+                raise TranscriptUnavailable(f"Archive of session {session_ref.id} is missing")
+            all_turns = decode_turns(archive["data"])
+        else:
+            all_turns = data.get("messages") or []
+        total = len(all_turns)
+        turns = all_turns[offset:None if limit is None else offset + limit]
+    read_latency[storage].observe((time.perf_counter() - started) * 1000)
+    return turns, total
+
+
+def delete_transcript(db, session_ref):
+    """Delete a session's chunk documents and archive blob (blocking; run in a thread)."""
+    for chunk in session_ref.collection(CHUNK_COLLECTION).stream():
+        chunk.reference.delete()
+    db.collection(ARCHIVE_COLLECTION).document(session_ref.id).delete()
+
+
+def archive_session(db, snapshot) -> bool:
+    """Replace a session's chunks or inline messages with one archive blob (blocking; run in a thread)."""
+    from google.cloud import firestore
+
+    data = snapshot.to_dict() or {}
+    if storage_of(data) == "archive":
+        return False
+    turns, _ = read_turns(db, snapshot.reference, data)
+    blob = encode_turns(turns, ARCHIVE_LEVEL)
+    if len(blob) > MAX_BLOB_BYTES:
+        logger.warning(f"Transcript of session {snapshot.id} is too large to archive ({len(blob)} bytes compressed)")
+        return False
+
+    db.collection(ARCHIVE_COLLECTION).document(snapshot.id).set({
+        "session_id": snapshot.id, "user_id": data.get("userId"), "codec": "zstd",
+        "turns": len(turns), "data": blob, "archived_at": firestore.SERVER_TIMESTAMP,
+    })
+    raw = len(orjson.dumps(turns))
+    snapshot.reference.update({
+        "transcript": {"storage": "archive", "codec": "zstd", "turns": len(turns),
+                       "raw_bytes": raw, "stored_bytes": len(blob), "updated_at": firestore.SERVER_TIMESTAMP},
+        "messages": firestore.DELETE_FIELD,
+    })
+    # Only drop the chunks once the archive and the pointer to it are written
+    for chunk in snapshot.reference.collection(CHUNK_COLLECTION).stream():
+        chunk.reference.delete()
+    archived_sessions.inc()
+    return True
+
+
+def archive_old_sessions(db, since: Optional[datetime] = None, older_than_days: int = ARCHIVE_AFTER_DAYS,
+                         page_size: int = 100) -> Tuple[int, Optional[datetime]]:
+    """Archive completed sessions created more than `older_than_days` ago (blocking; run in a thread).
+
+    Only sessions created at or after `since` are read, so a round with the
+    previous round's watermark covers just the sessions that have aged past
+    the cutoff since. Legacy inline sessions have no `transcript` field, so
+    a query filter on it would miss them; the watermark is what keeps the
+    scan from growing with all history. Returns (sessions archived, new
+    watermark), the watermark stopping short of any session whose archiving
+    failed so the next round retries it.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(days=older_than_days)
+    query = db.collection("voice_sessions").where("createdAt", "<", cutoff)
+    if since is not None:
+        query = query.where("createdAt", ">=", since)
+    query = query.order_by("createdAt").limit(page_size)
+    archived, watermark, failed = 0, since, False
+    page = list(query.get())
+    while page:
+        for snapshot in page:
+            data = snapshot.to_dict() or {}
+            if data.get("status") == "completed" and storage_of(data) != "archive":
+                try:
+                    archived += archive_session(db, snapshot)
+                except TranscriptUnavailable as e:
+                    # Retrying won't bring the document back; leave the session as it is
+                    logger.error(f"Not archiving session {snapshot.id}: {e}")
+                except Exception as e:
+                    failed = True
+                    logger.warning(f"Could not archive session {snapshot.id}: {e}")
+            if not failed and data.get("createdAt") is not None:
+                watermark = data["createdAt"]
+        page = list(query.start_after(page[-1]).get()) if len(page) == page_size else []
+    logger.info(f"Archived {archived} voice sessions older than {older_than_days} days")
+    return archived, watermark
+
+
+def stats() -> Dict[str, Any]:
+    raw, stored = raw_bytes.value, stored_bytes.value
+    return {
+        "raw_bytes": raw,
+        "stored_bytes": stored,
+        "compression_ratio": round(raw / stored, 2) if stored else 0.0,
+        "archived_sessions": archived_sessions.value,
+        "read_ms": {storage: samples.summary() for storage, samples in read_latency.items()},
+    }
+
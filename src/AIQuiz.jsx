@@ -21,6 +21,8 @@ function AIQuiz({ user, userProfile }) {
   const [isEvaluating, setIsEvaluating] = useState(false);
   const [currentEvaluation, setCurrentEvaluation] = useState(null);
   const recognitionRef = useRef(null);
+  // Reused across retries of the same generation so the server can replay its response
+  const generateKeyRef = useRef(null);
   const navigate = useNavigate();
   const location = useLocation();
 
@@ -142,10 +144,18 @@ function AIQuiz({ user, userProfile }) {
     setLoading(true);
     setError(null);
 
+    if (!generateKeyRef.current) {
+      generateKeyRef.current = `generate_${user.uid}_${Date.now()}`;
+    }
+
     try {
       const res = await fetch("http://127.0.0.1:8000/generate_assessment/", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          "Idempotency-Key": generateKeyRef.current,
+          Authorization: `Bearer ${await user.getIdToken()}`,
+        },
         body: JSON.stringify({
           user_id: user.uid,
         }),
@@ -158,6 +168,7 @@ function AIQuiz({ user, userProfile }) {
 
       const data = await res.json();
       if (data.questions && data.quiz_id) {
+        generateKeyRef.current = null;
         setQuestions(data.questions);
         setQuizId(data.quiz_id);
         setUserAnswers(Array(data.questions.length).fill(""));
@@ -221,6 +232,7 @@ function AIQuiz({ user, userProfile }) {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          ...(user && { Authorization: `Bearer ${await user.getIdToken()}` }),
         },
         body: JSON.stringify({
           userId: user?.uid || 'anonymous',
@@ -360,7 +372,10 @@ function AIQuiz({ user, userProfile }) {
       // Submit to backend
       const res = await fetch("http://127.0.0.1:8000/submit_quiz/", {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          "Idempotency-Key": `submit_${quizId}`,
+        },
         body: JSON.stringify({
           user_id: user.uid,
           quiz_id: quizId,
@@ -7,12 +7,23 @@ import {
   Calendar,
   Mail,
   Award,
-  BookOpen
+  BookOpen,
+  Download
 } from 'lucide-react';
 import { db } from './firebase';
 import { collection, getDocs, query, where, orderBy, limit } from 'firebase/firestore';
 
+const API_BASE = (import.meta.env.VITE_API_BASE_URL || "http://127.0.0.1:8000").replace(/\/$/, "");
+
+const EXPORTS = [
+  { dataset: 'users', label: 'Export Users', icon: Users },
+  { dataset: 'sessions', label: 'Export Sessions', icon: Clock },
+  { dataset: 'quiz_results', label: 'Export Quiz Results', icon: BookOpen }
+];
+
 const AdminReports = ({ data, loading }) => {
+  const [exporting, setExporting] = useState(null);
+
   const [detailedStats, setDetailedStats] = useState({
     newUsersToday: 0,
     newUsersThisWeek: 0,
@@ -80,6 +91,44 @@ const AdminReports = ({ data, loading }) => {
     }
   };
 
+  // Exports are built and streamed by the server (CSV), never assembled from Firestore in the browser
+  const handleExport = async (dataset) => {
+    let token = sessionStorage.getItem('adminApiToken');
+    if (!token) {
+      token = window.prompt('Enter the admin API token to export data');
+      if (!token) return;
+    }
+
+    setExporting(dataset);
+    try {
+      const response = await fetch(`${API_BASE}/admin/export/${dataset}?format=csv`, {
+        headers: { 'X-Admin-Token': token }
+      });
+      if (response.status === 401) {
+        sessionStorage.removeItem('adminApiToken');
+        throw new Error('Invalid admin token');
+      }
+      if (!response.ok) {
+        const body = await response.json().catch(() => ({}));
+        throw new Error(body.detail || `Export failed (${response.status})`);
+      }
+      sessionStorage.setItem('adminApiToken', token);
+
+      const blob = await response.blob();
+      const url = URL.createObjectURL(blob);
+      const link = document.createElement('a');
+      link.href = url;
+      link.download = `${dataset}_${new Date().toISOString().slice(0, 10)}.csv`;
+      link.click();
+      URL.revokeObjectURL(url);
+    } catch (error) {
+      console.error('Error exporting data:', error);
+      alert(error.message);
+    } finally {
+      setExporting(null);
+    }
+  };
+
   const StatCard = ({ title, value, icon: Icon, color, trend, subtitle }) => (
     <div className="stat-card">
       <div className="stat-header">
@@ -239,6 +288,24 @@ const AdminReports = ({ data, loading }) => {
       {/* Recent Activity */}
       <RecentActivity />
 
+      {/* Data Export */}
+      <div className="quick-actions">
+        <h3>Export Data</h3>
+        <div className="actions-grid">
+          {EXPORTS.map(({ dataset, label, icon: Icon }) => (
+            <button
+              key={dataset}
+              className="action-btn"
+              onClick={() => handleExport(dataset)}
+              disabled={exporting !== null}
+            >
+              {exporting === dataset ? <Download size={20} /> : <Icon size={20} />}
+              <span>{exporting === dataset ? 'Exporting...' : label}</span>
+            </button>
+          ))}
+        </div>
+      </div>
+
       {/* Quick Actions */}
       {/* <div className="quick-actions">
         <h3>Quick Actions</h3>
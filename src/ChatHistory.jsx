@@ -1,16 +1,20 @@
 import React, { useEffect, useState } from "react";
 import { useNavigate } from "react-router-dom";
-import { collection, query, where, orderBy, getDocs, doc, getDoc } from "firebase/firestore";
-import { db } from "./firebase";
 import { ArrowLeft, MessageSquare, Calendar, Volume2, Mic, Play } from "lucide-react";
 import "./ChatHistory.css";
 
+const API_BASE = (import.meta.env.VITE_API_BASE_URL || "http://127.0.0.1:8000").replace(/\/$/, "");
+const PAGE_SIZE = 20;
+
 const ChatHistory = ({ user }) => {
   const navigate = useNavigate();
   const [sessions, setSessions] = useState([]);
   const [selectedSession, setSelectedSession] = useState(null);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [nextCursor, setNextCursor] = useState(null);
   const [showSummary, setShowSummary] = useState(false);
+  const [loadingTurns, setLoadingTurns] = useState(false);
 
   useEffect(() => {
     if (!user) {
@@ -20,67 +24,81 @@ const ChatHistory = ({ user }) => {
     fetchSessions();
   }, [user, navigate]);
 
-  const fetchSessions = async () => {
+  // Session list holds summaries only; the transcript is fetched when a session is opened
+  const fetchSessions = async (cursor = null) => {
     try {
-      const sessionsRef = collection(db, "voice_sessions");
-      
-      // Try simple query first - just get user's sessions
-      const q = query(
-        sessionsRef,
-        where("userId", "==", user.uid),
-        orderBy("createdAt", "desc")
-      );
-      
-      const snapshot = await getDocs(q);
-      const sessionList = snapshot.docs
-        .map(doc => ({
-          id: doc.id,
-          ...doc.data()
-        }))
-        .filter(session => session.status === "completed"); // Filter completed in memory
-      
-      console.log('Fetched sessions:', sessionList);
-      setSessions(sessionList);
-      if (sessionList.length > 0) {
-        setSelectedSession(sessionList[0]);
+      const params = new URLSearchParams({ limit: PAGE_SIZE });
+      if (cursor) params.set("cursor", cursor);
+      const response = await fetch(`${API_BASE}/users/${user.uid}/sessions?${params}`, {
+        headers: { Authorization: `Bearer ${await user.getIdToken()}` }
+      });
+      if (!response.ok) {
+        throw new Error(`Failed to load sessions (${response.status})`);
+      }
+      const page = await response.json();
+
+      setSessions(prev => cursor ? [...prev, ...page.items] : page.items);
+      setNextCursor(page.next_cursor);
+      if (!cursor && page.items.length > 0) {
+        openSession(page.items[0]);
       }
     } catch (err) {
       console.error('Error fetching sessions:', err);
-      // Fallback - try without orderBy if composite index doesn't exist
-      try {
-        const sessionsRef = collection(db, "voice_sessions");
-        const q = query(
-          sessionsRef,
-          where("userId", "==", user.uid)
-        );
-        const snapshot = await getDocs(q);
-        const sessionList = snapshot.docs
-          .map(doc => ({
-            id: doc.id,
-            ...doc.data()
-          }))
-          .filter(session => session.status === "completed")
-          .sort((a, b) => {
-            const aTime = a.createdAt?.toDate?.() || new Date(a.createdAt);
-            const bTime = b.createdAt?.toDate?.() || new Date(b.createdAt);
-            return bTime - aTime;
-          });
-        
-        console.log('Fetched sessions (fallback):', sessionList);
-        setSessions(sessionList);
-        if (sessionList.length > 0) {
-          setSelectedSession(sessionList[0]);
-        }
-      } catch (fallbackErr) {
-        console.error('Fallback query also failed:', fallbackErr);
-      }
     } finally {
       setLoading(false);
+      setLoadingMore(false);
+    }
+  };
+
+  const loadMore = () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    fetchSessions(nextCursor);
+  };
+
+  const openSession = async (session) => {
+    setSelectedSession({ ...session, messages: null });
+    try {
+      const response = await fetch(`${API_BASE}/users/${user.uid}/sessions/${session.id}`, {
+        headers: { Authorization: `Bearer ${await user.getIdToken()}` }
+      });
+      if (!response.ok) {
+        throw new Error(`Failed to load session (${response.status})`);
+      }
+      const detail = await response.json();
+      setSelectedSession(current => current?.id === session.id ? { ...session, ...detail } : current);
+    } catch (err) {
+      console.error('Error fetching session:', err);
+      setSelectedSession(current => current?.id === session.id ? { ...session, messages: [] } : current);
+    }
+  };
+
+  // Long transcripts arrive in pages of turns; fetch the next one on request
+  const loadMoreTurns = async () => {
+    const session = selectedSession;
+    if (!session || session.next_turn == null || loadingTurns) return;
+    setLoadingTurns(true);
+    try {
+      const params = new URLSearchParams({ offset: session.next_turn });
+      const response = await fetch(`${API_BASE}/users/${user.uid}/sessions/${session.id}/transcript?${params}`, {
+        headers: { Authorization: `Bearer ${await user.getIdToken()}` }
+      });
+      if (!response.ok) {
+        throw new Error(`Failed to load transcript (${response.status})`);
+      }
+      const page = await response.json();
+      setSelectedSession(current => current?.id === session.id
+        ? { ...current, messages: [...current.messages, ...page.messages], next_turn: page.next_offset }
+        : current);
+    } catch (err) {
+      console.error('Error fetching transcript:', err);
+    } finally {
+      setLoadingTurns(false);
     }
   };
 
   const handleSessionClick = (session) => {
-    setSelectedSession(session);
+    openSession(session);
     setShowSummary(false);
   };
 
@@ -140,7 +158,7 @@ const ChatHistory = ({ user }) => {
         <aside className="sessions-sidebar">
           <div className="sidebar-header">
             <h2>Your Conversations</h2>
-            <span className="session-count">{sessions.length} sessions</span>
+            <span className="session-count">{sessions.length}{nextCursor ? "+" : ""} sessions</span>
           </div>
           
           {loading ? (
@@ -165,22 +183,25 @@ const ChatHistory = ({ user }) => {
                     <h3>{session.title || "Voice Practice Session"}</h3>
                     <span className="session-date">
                       <Calendar size={14} />
-                      {formatDate(session.createdAt)}
+                      {formatDate(session.created_at)}
                     </span>
                   </div>
                   <p className="session-preview">
-                    {session.messages && session.messages.length > 0 
-                      ? (session.messages.find(m => m.role === 'user')?.content?.slice(0, 60) || "No messages")
-                      : "No messages"}...
+                    {session.preview || "No messages"}...
                   </p>
                   <div className="session-stats">
-                    <span>{session.messages?.length || 0} messages</span>
-                    {session.summary && (
+                    <span>{session.message_count || 0} messages</span>
+                    {session.has_summary && (
                       <span className="has-summary">✓ Summary</span>
                     )}
                   </div>
                 </div>
               ))}
+              {nextCursor && (
+                <button className="load-more-btn" onClick={loadMore} disabled={loadingMore}>
+                  {loadingMore ? "Loading..." : "Load more"}
+                </button>
+              )}
             </div>
           )}
         </aside>
@@ -238,7 +259,7 @@ const ChatHistory = ({ user }) => {
               <div className="chat-viewer-header">
                 <div>
                   <h2>{selectedSession.title || "Voice Practice Session"}</h2>
-                  <span className="chat-date">{formatDate(selectedSession.createdAt)}</span>
+                  <span className="chat-date">{formatDate(selectedSession.created_at)}</span>
                 </div>
                 {selectedSession.summary && (
                   <button className="view-summary-btn" onClick={() => setShowSummary(true)}>
@@ -248,7 +269,9 @@ const ChatHistory = ({ user }) => {
               </div>
 
               <div className="messages-container">
-                {selectedSession.messages && selectedSession.messages.length > 0 ? (
+                {selectedSession.messages === null ? (
+                  <div className="loading-state">Loading conversation...</div>
+                ) : selectedSession.messages && selectedSession.messages.length > 0 ? (
                   selectedSession.messages.map((message, idx) => (
                     <div key={idx} className={`message-bubble ${message.role}`}>
                       <div className="message-header">
@@ -278,6 +301,11 @@ const ChatHistory = ({ user }) => {
                 ) : (
                   <div className="no-messages">No messages in this session</div>
                 )}
+                {selectedSession.next_turn != null && (
+                  <button className="load-more-btn" onClick={loadMoreTurns} disabled={loadingTurns}>
+                    {loadingTurns ? "Loading..." : "Load more messages"}
+                  </button>
+                )}
               </div>
             </>
           )}
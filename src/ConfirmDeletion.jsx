@@ -3,6 +3,25 @@ import { useSearchParams, useNavigate } from "react-router-dom";
 import { doc, getDoc } from "firebase/firestore";
 import { db } from "./firebase";
 
+const API_BASE = "http://localhost:8000";
+const JOB_POLL_MS = 2000;
+
+// Resolves once the background job finishes; throws if it failed
+async function waitForJob(jobId) {
+  while (true) {
+    const response = await fetch(`${API_BASE}/jobs/${jobId}`);
+    if (!response.ok) {
+      throw new Error("Could not check deletion progress");
+    }
+    const job = await response.json();
+    if (job.status === "succeeded") return job;
+    if (job.status === "failed") {
+      throw new Error(job.error || "Account deletion failed");
+    }
+    await new Promise((resolve) => setTimeout(resolve, JOB_POLL_MS));
+  }
+}
+
 export default function ConfirmDeletion() {
   const [searchParams] = useSearchParams();
   const navigate = useNavigate();
@@ -10,6 +29,7 @@ export default function ConfirmDeletion() {
   const [error, setError] = useState("");
   const [success, setSuccess] = useState("");
   const [deletionData, setDeletionData] = useState(null);
+  const [isDeleting, setIsDeleting] = useState(false);
 
   const token = searchParams.get("token");
   const uid = searchParams.get("uid");
@@ -65,12 +85,12 @@ export default function ConfirmDeletion() {
   };
 
   const handleConfirmDeletion = async () => {
-    setIsLoading(true);
+    setIsDeleting(true);
     setError("");
 
     try {
-      // Call backend to confirm deletion and delete all user data
-      const response = await fetch(`http://localhost:8000/confirm-deletion?token=${token}&uid=${uid}`, {
+      // Call backend to confirm deletion; the data is deleted by a background job
+      const response = await fetch(`${API_BASE}/confirm-deletion?token=${token}&uid=${uid}`, {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
@@ -83,6 +103,9 @@ export default function ConfirmDeletion() {
       }
 
       const result = await response.json();
+      if (result.job_id) {
+        await waitForJob(result.job_id);
+      }
       
       setSuccess("Account has been successfully deleted. All your data has been permanently removed.");
       
@@ -94,7 +117,7 @@ export default function ConfirmDeletion() {
     } catch (error) {
       setError("Failed to delete account: " + error.message);
     } finally {
-      setIsLoading(false);
+      setIsDeleting(false);
     }
   };
 
@@ -129,6 +152,12 @@ export default function ConfirmDeletion() {
         {error && <div className="error" role="alert">{error}</div>}
         {success && <div className="success" role="alert">{success}</div>}
 
+        {isDeleting && (
+          <div className="deletion-info">
+            <p>Deleting your account and data. This can take a minute, please keep this page open...</p>
+          </div>
+        )}
+
         {deletionData && !success && (
           <>
             <div className="deletion-info">
@@ -155,7 +184,7 @@ export default function ConfirmDeletion() {
               <button 
                 className="cancel-deletion-btn" 
                 onClick={handleCancelDeletion}
-                disabled={isLoading}
+                disabled={isDeleting}
               >
                 Cancel Deletion
               </button>
@@ -163,9 +192,9 @@ export default function ConfirmDeletion() {
               <button 
                 className="confirm-deletion-btn" 
                 onClick={handleConfirmDeletion}
-                disabled={isLoading}
+                disabled={isDeleting}
               >
-                {isLoading ? 'Deleting Account...' : 'Yes, Delete My Account'}
+                {isDeleting ? 'Deleting Account...' : 'Yes, Delete My Account'}
               </button>
             </div>
           </>
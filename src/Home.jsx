@@ -1,8 +1,7 @@
 import { Link } from "react-router-dom";
 import { useState, useEffect } from "react";
-import { auth, db } from './firebase';
+import { auth } from './firebase';
 import { signOut } from 'firebase/auth';
-import { collection, query, where, orderBy, limit, getDocs } from 'firebase/firestore';
 import ProfileSidebar from './ProfileSidebar';
 import FeedbackForm from './FeedbackForm';
 import { useAuthValidation, useSecureLogout } from './hooks/useAuthValidation';
@@ -21,6 +20,8 @@ import {
 } from 'chart.js';
 import { Line } from 'react-chartjs-2';
 
+const API_BASE = (import.meta.env.VITE_API_BASE_URL || "http://127.0.0.1:8000").replace(/\/$/, "");
+
 // Register Chart.js components
 ChartJS.register(
   CategoryScale,
@@ -40,86 +41,48 @@ export default function Home({ user, userProfile }) {
   const [loadingSessions, setLoadingSessions] = useState(true);
   const [quizHistory, setQuizHistory] = useState([]); // Add state for quiz history
   const [loadingQuizHistory, setLoadingQuizHistory] = useState(true); // Add loading state
+  const [progress, setProgress] = useState(null);
   const navigate = useNavigate();
 
   // Use custom hooks for authentication validation and secure logout
   useAuthValidation(user, ['/']);
   const handleLogout = useSecureLogout(() => signOut(auth));
 
-  // Fetch voice sessions
+  // Fetch the materialized progress summary: recent sessions, quiz trend and totals in one read
   useEffect(() => {
     if (!user) {
       setLoadingSessions(false);
-      return;
-    }
-
-    const fetchVoiceSessions = async () => {
-      try {
-        const sessionsRef = collection(db, "voice_sessions");
-        const q = query(
-          sessionsRef,
-          where("userId", "==", user.uid),
-          where("status", "==", "completed"),
-          orderBy("createdAt", "desc"),
-          limit(5)
-        );
-        
-        const snapshot = await getDocs(q);
-        const sessions = snapshot.docs.map(doc => ({
-          id: doc.id,
-          ...doc.data()
-        }));
-        
-        setVoiceSessions(sessions);
-      } catch (err) {
-        console.error('Error fetching voice sessions:', err);
-      } finally {
-        setLoadingSessions(false);
-      }
-    };
-
-    fetchVoiceSessions();
-  }, [user]);
-
-  // Fetch quiz history for chart
-  useEffect(() => {
-    if (!user) {
       setLoadingQuizHistory(false);
       return;
     }
 
-    const fetchQuizHistory = async () => {
+    const fetchProgress = async () => {
       try {
-        const quizzesRef = collection(db, "users", user.uid, "ai_quizzes");
-        // Query for quizzes that have been attempted (have attempted_at field)
-        const q = query(
-          quizzesRef,
-          orderBy("created_at", "desc"),
-          limit(10)
-        );
-        const snapshot = await getDocs(q);
-        const quizzes = snapshot.docs.map(doc => {
-          const data = doc.data();
-          return {
-            id: doc.id,
-            ...data,
-            created_at: data.created_at?.toDate ? data.created_at.toDate() : new Date(data.created_at),
-            attempted_at: data.attempted_at?.toDate ? data.attempted_at.toDate() : (data.attempted_at ? new Date(data.attempted_at) : null)
-          };
+        const response = await fetch(`${API_BASE}/users/${user.uid}/progress`, {
+          headers: { Authorization: `Bearer ${await user.getIdToken()}` }
         });
-        
-        // Filter for only attempted quizzes and sort by date ascending for chart
-        const attemptedQuizzes = quizzes.filter(quiz => quiz.attempted_at !== null);
-        const sortedQuizzes = [...attemptedQuizzes].sort((a, b) => a.attempted_at - b.attempted_at);
-        setQuizHistory(sortedQuizzes);
+        if (!response.ok) {
+          throw new Error(`Failed to load progress (${response.status})`);
+        }
+        const summary = await response.json();
+
+        setProgress(summary);
+        setVoiceSessions(summary.recent_sessions || []);
+        // Recent quizzes come newest first; the chart reads oldest to newest
+        const quizzes = (summary.recent_quizzes || [])
+          .filter(quiz => quiz.attempted_at)
+          .map(quiz => ({ ...quiz, attempted_at: new Date(quiz.attempted_at) }))
+          .sort((a, b) => a.attempted_at - b.attempted_at);
+        setQuizHistory(quizzes);
       } catch (err) {
-        console.error('Error fetching quiz history:', err);
+        console.error('Error fetching progress summary:', err);
       } finally {
+        setLoadingSessions(false);
         setLoadingQuizHistory(false);
       }
     };
 
-    fetchQuizHistory();
+    fetchProgress();
   }, [user]);
 
   const scrollToSection = (sectionId) => {
@@ -202,12 +165,7 @@ export default function Home({ user, userProfile }) {
       },
       {
         label: 'Oral Score %',
-        data: quizHistory.map(quiz => 
-          quiz.responses ? 
-            (quiz.responses.filter(r => r.type === 'oral' && r.evaluation).reduce((sum, r) => sum + (r.evaluation?.score || 0), 0) / 
-             Math.max(quiz.responses.filter(r => r.type === 'oral' && r.evaluation).length, 1) * 10) || 0 
-            : 0
-        ),
+        data: quizHistory.map(quiz => quiz.oral_percentage || 0),
         borderColor: '#8b5cf6',
         backgroundColor: 'rgba(139, 92, 246, 0.1)',
         borderWidth: 3,
@@ -464,17 +422,21 @@ export default function Home({ user, userProfile }) {
             </div>
           </article>
           <article className="card stat">
-            <div className="stat-icon">😊</div>
+            <div className="stat-icon">🔥</div>
             <div>
-              <div className="stat-label">Mood Trend</div>
-              <div className="stat-value">Steady ↗</div>
+              <div className="stat-label">Practice Streak</div>
+              <div className="stat-value">
+                {progress ? `${progress.current_streak} ${progress.current_streak === 1 ? 'day' : 'days'}` : '—'}
+              </div>
             </div>
           </article>
           <article className="card stat">
             <div className="stat-icon">🕒</div>
             <div>
-              <div className="stat-label">Last Session</div>
-              <div className="stat-value">12 min, Clarity +6%</div>
+              <div className="stat-label">Time Practiced</div>
+              <div className="stat-value">
+                {progress ? `${Math.round(progress.minutes_practiced)} min, ${progress.session_count} ${progress.session_count === 1 ? 'session' : 'sessions'}` : '—'}
+              </div>
             </div>
           </article>
         </div>
@@ -489,17 +451,17 @@ export default function Home({ user, userProfile }) {
           ) : (
             <div className="sessions-grid">
               {voiceSessions.map((session) => {
-                const sessionDate = session.createdAt?.toDate ? 
-                  session.createdAt.toDate().toLocaleDateString('en-US', { 
+                const sessionDate = session.created_at ? 
+                  new Date(session.created_at).toLocaleDateString('en-US', { 
                     month: 'short', 
                     day: 'numeric', 
                     year: 'numeric' 
                   }) : 
                   'Recent';
                 
-                const mistakeCount = session.summary?.corrections?.length || 0;
-                const feedback = session.summary?.final_feedback || "Great practice session!";
-                const tip = session.summary?.tips || "Keep up the good work!";
+                const mistakeCount = session.correction_count || 0;
+                const feedback = session.feedback || "Great practice session!";
+                const tip = session.tip || "Keep up the good work!";
 
                 return (
                   <div key={session.id} className="session-card">
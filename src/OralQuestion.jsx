@@ -207,6 +207,7 @@ function OralQuestion({ user, userProfile, refreshUserProfile }) {
         method: 'POST',
         headers: {
           'Content-Type': 'application/json',
+          ...(user && { Authorization: `Bearer ${await user.getIdToken()}` }),
         },
         body: JSON.stringify({
           userId: user?.uid || 'anonymous',
@@ -1,49 +1,63 @@
 import React, { useState, useEffect } from "react";
 import { useNavigate } from "react-router-dom";
-import { collection, query, where, orderBy, getDocs, doc, getDoc } from "firebase/firestore";
-import { db } from "./firebase";
 import "./QuizHistory.css";
 
+const API_BASE = (import.meta.env.VITE_API_BASE_URL || "http://127.0.0.1:8000").replace(/\/$/, "");
+const PAGE_SIZE = 20;
+
 function QuizHistory({ user }) {
   const [quizzes, setQuizzes] = useState([]);
   const [loading, setLoading] = useState(true);
+  const [loadingMore, setLoadingMore] = useState(false);
+  const [nextCursor, setNextCursor] = useState(null);
   const [error, setError] = useState(null);
   const navigate = useNavigate();
 
+  // Summaries only; questions and responses are loaded by the results page
+  const fetchQuizzes = async (cursor = null) => {
+    try {
+      const params = new URLSearchParams({ limit: PAGE_SIZE });
+      if (cursor) params.set("cursor", cursor);
+      const response = await fetch(`${API_BASE}/users/${user.uid}/quizzes?${params}`, {
+        headers: { Authorization: `Bearer ${await user.getIdToken()}` }
+      });
+      if (!response.ok) {
+        throw new Error(`Failed to load quizzes (${response.status})`);
+      }
+      const page = await response.json();
+
+      const quizzesData = page.items.map(quiz => ({
+        ...quiz,
+        created_at: quiz.created_at ? new Date(quiz.created_at) : null,
+        attempted_at: quiz.attempted_at ? new Date(quiz.attempted_at) : null
+      }));
+
+      setQuizzes(prev => cursor ? [...prev, ...quizzesData] : quizzesData);
+      setNextCursor(page.next_cursor);
+    } catch (err) {
+      console.error("Error fetching quizzes:", err);
+      setError("Failed to load quiz history. Please try again.");
+    } finally {
+      setLoading(false);
+      setLoadingMore(false);
+    }
+  };
+
   useEffect(() => {
     if (!user) {
       navigate("/auth");
       return;
     }
 
-    const fetchQuizzes = async () => {
-      try {
-        const quizzesRef = collection(db, "users", user.uid, "ai_quizzes");
-        const q = query(quizzesRef, orderBy("created_at", "desc"));
-        const snapshot = await getDocs(q);
-        
-        const quizzesData = snapshot.docs.map(doc => {
-          const data = doc.data();
-          return {
-            id: doc.id,
-            ...data,
-            created_at: data.created_at?.toDate ? data.created_at.toDate() : new Date(data.created_at),
-            attempted_at: data.attempted_at?.toDate ? data.attempted_at.toDate() : (data.attempted_at ? new Date(data.attempted_at) : null)
-          };
-        });
-        
-        setQuizzes(quizzesData);
-      } catch (err) {
-        console.error("Error fetching quizzes:", err);
-        setError("Failed to load quiz history. Please try again.");
-      } finally {
-        setLoading(false);
-      }
-    };
-
     fetchQuizzes();
   }, [user, navigate]);
 
+  const loadMore = () => {
+    if (!nextCursor || loadingMore) return;
+    setLoadingMore(true);
+    fetchQuizzes(nextCursor);
+  };
+
   const formatDate = (date) => {
     if (!date) return "N/A";
     return new Intl.DateTimeFormat("en-US", {
@@ -82,9 +96,8 @@ function QuizHistory({ user }) {
   };
 
   const handleViewResults = (quiz) => {
-    navigate(`/quiz-results/${quiz.id}`, {
-      state: { resultData: quiz },
-    });
+    // The results page fetches the full quiz (responses and scores) itself
+    navigate(`/quiz-results/${quiz.id}`);
   };
 
   if (loading) {
@@ -205,6 +218,13 @@ function QuizHistory({ user }) {
               </tbody>
             </table>
           </div>
+          {nextCursor && (
+            <div className="load-more-container">
+              <button onClick={loadMore} className="load-more-btn" disabled={loadingMore}>
+                {loadingMore ? "Loading..." : "Load more"}
+              </button>
+            </div>
+          )}
         </div>
       )}
     </div>
@@ -4,6 +4,7 @@ import { useNavigate } from 'react-router-dom';
 import { FaceLandmarker, FilesetResolver } from '@mediapipe/tasks-vision';
 import { Canvas } from '@react-three/fiber';
 import Avatar3D from './components/Avatar3D';
+import { auth } from './firebase';
 import './VideoCall.css';
 
 const wasmAssetsPath = 'https://cdn.jsdelivr.net/npm/@mediapipe/tasks-vision@0.10.14/wasm';
@@ -459,10 +460,14 @@ const VideoCall = () => {
     try {
       const response = await fetch(`${API_BASE}/voice_chat/`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          ...(auth.currentUser && { Authorization: `Bearer ${await auth.currentUser.getIdToken()}` })
+        },
         body: JSON.stringify({
           messages: [{ role: "user", content: text }],
           user_name: "User",
+          user_id: auth.currentUser?.uid || undefined,
         }),
         signal: abortControllerRef.current.signal
       });
@@ -1,7 +1,7 @@
 import React, { useEffect, useRef, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import { ArrowLeft, Loader2, Mic, MicOff, RotateCcw, Volume2 } from "lucide-react";
-import { collection, addDoc, updateDoc, doc, serverTimestamp } from "firebase/firestore";
+import { collection, addDoc, serverTimestamp } from "firebase/firestore";
 import { db } from "./firebase";
 import "./VoicePractice.css";
 
@@ -48,6 +48,9 @@ const VoicePractice = ({ user }) => {
   const callActiveRef = useRef(false);
   const recognitionPausedRef = useRef(false);
   const abortControllerRef = useRef(new AbortController());
+  // Turns not yet appended to the session transcript, and how many were
+  const transcriptRef = useRef({ sessionId: null, saved: 0, pending: [] });
+  const transcriptSaveRef = useRef(Promise.resolve());
 
   // Update messages ref when messages change
   useEffect(() => {
@@ -253,7 +256,7 @@ const VoicePractice = ({ user }) => {
       const sessionDoc = await addDoc(collection(db, "voice_sessions"), {
         userId: user?.uid || "anonymous",
         createdAt: serverTimestamp(),
-        messages: [],
+        messageCount: 0,
         status: "active"
       });
       setSessionId(sessionDoc.id);
@@ -264,43 +267,54 @@ const VoicePractice = ({ user }) => {
     }
   };
 
-  // Save message to Firestore
-  const saveMessageToFirestore = async (role, content, audioUrl = null) => {
-    if (!sessionId) return;
-    
+  // Append pending turns to the session transcript on the server, a few turns per request
+  const flushTranscript = async () => {
+    const transcript = transcriptRef.current;
+    if (!transcript.sessionId || !user || transcript.pending.length === 0) return;
+
+    const turns = transcript.pending.slice();
     try {
-      const sessionRef = doc(db, "voice_sessions", sessionId);
-      const messageData = {
-        role,
-        content,
-        timestamp: new Date().toISOString()
-      };
-      
-      if (audioUrl) {
-        messageData.audioUrl = audioUrl;
-      }
-      
-      // Get current messages and append new one
-      const updatedMessages = messagesRef.current.map(m => {
-        const msg = {
-          role: m.role,
-          content: m.text,
-          timestamp: new Date().toISOString()
-        };
-        if (m.audioUrl) {
-          msg.audioUrl = m.audioUrl;
-        }
-        return msg;
-      });
-      
-      await updateDoc(sessionRef, {
-        messages: updatedMessages
+      const response = await fetch(`${API_BASE}/voice_sessions/${transcript.sessionId}/turns`, {
+        method: "POST",
+        headers: {
+          "Content-Type": "application/json",
+          Authorization: `Bearer ${await user.getIdToken()}`
+        },
+        body: JSON.stringify({ user_id: user.uid, first_turn: transcript.saved, turns })
       });
+      if (!response.ok) {
+        throw new Error(`Saving turns failed with status ${response.status}`);
+      }
+      if (transcriptRef.current === transcript) {
+        transcript.saved += turns.length;
+        transcript.pending.splice(0, turns.length);
+      }
     } catch (err) {
+      // The turns stay pending and go with the next request
       console.error('Error saving message:', err);
     }
   };
 
+  // Queue a turn for the transcript; saves run one at a time so turns stay in order
+  const saveMessage = (role, content, audioUrl = null) => {
+    if (!sessionId) return transcriptSaveRef.current;
+    if (transcriptRef.current.sessionId !== sessionId) {
+      transcriptRef.current = { sessionId, saved: 0, pending: [] };
+    }
+
+    const messageData = {
+      role,
+      content,
+      timestamp: new Date().toISOString()
+    };
+    if (audioUrl) {
+      messageData.audioUrl = audioUrl;
+    }
+    transcriptRef.current.pending.push(messageData);
+    transcriptSaveRef.current = transcriptSaveRef.current.then(flushTranscript);
+    return transcriptSaveRef.current;
+  };
+
   // Start/stop call functions
   const startCall = async () => {
     if (!speechSupported || callActive) return;
@@ -496,7 +510,10 @@ const VoicePractice = ({ user }) => {
       // Call evaluation endpoint
       const response = await fetch(`${API_BASE}/api/oral-quiz/evaluate`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          ...(user && { Authorization: `Bearer ${await user.getIdToken()}` })
+        },
         body: JSON.stringify({
           userId: user?.uid || "anonymous",
           questionId: "voice_practice_session",
@@ -521,26 +538,28 @@ const VoicePractice = ({ user }) => {
       setSessionSummary(summary);
       setShowSummary(true);
 
-      // Update session in Firestore
-      if (sessionId) {
-        const sessionRef = doc(db, "voice_sessions", sessionId);
-        await updateDoc(sessionRef, {
-          status: "completed",
-          endedAt: serverTimestamp(),
-          summary,
-          title: sessionTitle,
-          messages: messages.map(m => {
-            const msg = {
-              role: m.role,
-              content: m.text,
-              timestamp: new Date().toISOString()
-            };
-            if (m.audioUrl) {
-              msg.audioUrl = m.audioUrl;
-            }
-            return msg;
+      // Update session in Firestore; completing needs the signed-in user's ID token
+      if (sessionId && user) {
+        // The transcript was appended turn by turn; send whatever is still pending first
+        await transcriptSaveRef.current;
+        await flushTranscript();
+        // Completed through the API so the progress summary on the home screen is updated with it
+        const completeResponse = await fetch(`${API_BASE}/voice_sessions/${sessionId}/complete`, {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            "Idempotency-Key": `complete-${sessionId}`,
+            Authorization: `Bearer ${await user.getIdToken()}`
+          },
+          body: JSON.stringify({
+            user_id: user.uid,
+            title: sessionTitle,
+            summary
           })
         });
+        if (!completeResponse.ok) {
+          throw new Error("Failed to save session");
+        }
       }
     } catch (err) {
       console.error('Error generating summary:', err);
@@ -567,8 +586,8 @@ const VoicePractice = ({ user }) => {
     setLoadingReply(true);
     setIsProcessing(true);
 
-    // Save user message to Firestore
-    await saveMessageToFirestore("user", text);
+    // Append the user message to the session transcript; saves are queued, so the reply doesn't wait
+    saveMessage("user", text);
 
     // Abort any pending requests
     if (abortControllerRef.current) {
@@ -579,10 +598,14 @@ const VoicePractice = ({ user }) => {
     try {
       const response = await fetch(`${API_BASE}/voice_chat/`, {
         method: "POST",
-        headers: { "Content-Type": "application/json" },
+        headers: {
+          "Content-Type": "application/json",
+          ...(user && { Authorization: `Bearer ${await user.getIdToken()}` })
+        },
         body: JSON.stringify({
           messages: [{ role: "user", content: text }],
           user_name: user?.displayName || user?.email || undefined,
+          user_id: user?.uid || undefined,
         }),
         signal: abortControllerRef.current.signal
       });
@@ -603,8 +626,8 @@ const VoicePractice = ({ user }) => {
       
       setMessages(prev => [...prev, aiMessage]);
       
-      // Save AI message to Firestore
-      await saveMessageToFirestore("assistant", replyText);
+      // Append the AI message to the session transcript
+      saveMessage("assistant", replyText);
       
     } catch (err) {
       if (err.name === 'AbortError') {